@@ -20,7 +20,7 @@ setup(
     packages = find_packages(),
     install_requires = requires,
     package_data = {},
-    scripts = ['scripts/tlpipe', 'scripts/h5info'],
+    scripts = ['scripts/tlpipe', 'scripts/h5info', 'scripts/h5layout'],
     extras_require={
         'mpi': ['mpi4py>=1.3'],
     },
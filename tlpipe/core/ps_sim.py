@@ -0,0 +1,219 @@
+"""Simulate the visibilities of point sources.
+
+The visibility of a point source :math:`s` on baseline :math:`(i, j)` is
+
+.. math:: V_{ij}(t, \\nu) = S(\\nu) A_j(\\hat{s}, \\nu) A_i^*(\\hat{s}, \\nu) e^{-2 \\pi i \\hat{s} \\cdot (\\boldsymbol{r}_j - \\boldsymbol{r}_i) \\nu / c},
+
+so it is the product of a per-feed factor of feed :math:`j` and the
+conjugate of that of feed :math:`i`. :class:`PointSourceSim` computes the
+per-feed factors for many time points and frequencies at once and then forms
+the visibilities of all the requested baselines, instead of computing the
+beam response and the fringe of each baseline for one time point at a time.
+
+"""
+
+import numpy as np
+
+
+# approximate bytes of a block of the simulated visibilities computed at once
+BLOCK_BYTES = 2**26
+
+
+def _beam_key(ant, p):
+    ### a key identifying the beam response of antenna `ant` for pol `p`,
+    ### which is the same for antennas with equal beams and pointing
+    beam = ant.beam
+    items = []
+    for name, val in sorted(beam.__dict__.items()):
+        if isinstance(val, (np.ndarray, int, float, complex)):
+            val = np.asarray(val)
+            items.append((name, val.dtype.str, val.shape, val.tostring()))
+    rot = ant.rot_pol_x if p == 'x' else ant.rot_pol_y
+
+    return (beam.__class__, tuple(items), p, rot.tostring())
+
+
+class PointSourceSim(object):
+    """Simulate the visibilities of point sources observed by an antenna array.
+
+    Parameters
+    ----------
+    aa : :class:`~tlpipe.core.tl_array.AntennaArray`
+        The antenna array, its time is changed by the simulation.
+    feedno : list of integers
+        Feed No. of the antennas of `aa`, in order.
+    block_bytes : integer, optional
+        Approximate bytes of a block of time points of the visibilities that
+        are simulated together. Default :data:`BLOCK_BYTES`.
+
+    """
+
+    def __init__(self, aa, feedno, block_bytes=BLOCK_BYTES):
+
+        self.aa = aa
+        self.feedno = list(feedno)
+        self.feed_inds = dict((fd, k) for k, fd in enumerate(self.feedno))
+        self.block_bytes = block_bytes
+
+        # positions of the feeds relative to the first one in the zenith
+        # topocentric coordinates, which do not change with time, in ns
+        self.pos_z = np.array([ aa.get_baseline(0, k, src='z') for k in xrange(len(self.feedno)) ]) # (nfeed, 3)
+        self.afreqs = aa.get_afreqs() # GHz
+
+    def positions(self, src, jul_dates):
+        """Return the positions and fluxes of source `src` at the time points.
+
+        Parameters
+        ----------
+        src : aipy RadioBody
+            The point source.
+        jul_dates : array like
+            Julian dates of the time points.
+
+        Returns
+        -------
+        s_top : (nt, 3) array
+            Topocentric coordinates of the source, for the fringes.
+        b_top : (nt, 3) array
+            Topocentric coordinates of the equatorial position of the source,
+            for the beam responses (same as `aa.sim_cache`).
+        jys : (nt, nfreq) array
+            Fluxes of the source.
+
+        """
+        nt = len(jul_dates)
+        s_top = np.zeros((nt, 3))
+        b_top = np.zeros((nt, 3))
+        jys = np.zeros((nt, len(self.afreqs)))
+        for ti, jd in enumerate(jul_dates):
+            self.aa.set_jultime(jd)
+            src.compute(self.aa)
+            s_top[ti] = src.get_crds('top', ncrd=3)
+            b_top[ti] = np.dot(self.aa.eq2top_m, src.get_crds('eq', ncrd=3))
+            jys[ti] = src.get_jys()
+
+        return s_top, b_top, jys
+
+    def fringes(self, src, jul_dates, bls):
+        """Return the fringes of source `src` on baselines `bls`.
+
+        Parameters
+        ----------
+        src : aipy RadioBody
+            The point source.
+        jul_dates : array like
+            Julian dates of the time points.
+        bls : list of tuples
+            The (feed No., feed No.) pairs of the baselines.
+
+        Returns
+        -------
+        fringe : (nt, nfreq, nbl) complex array
+            :math:`e^{-2 \\pi i \\hat{s} \\cdot \\boldsymbol{u}_{ij}}` of each
+            time point, frequency and baseline.
+
+        """
+        ais = np.array([ self.feed_inds[i] for i, j in bls ], dtype=int)
+        ajs = np.array([ self.feed_inds[j] for i, j in bls ], dtype=int)
+
+        s_top = self.positions(src, jul_dates)[0]
+        # s_top . uij = (s_top . (rj - ri)) / lambda
+        d = np.dot(s_top, self.pos_z.T) # (nt, nfeed)
+        d = d[:, ajs] - d[:, ais] # (nt, nbl)
+
+        return np.exp(-2.0J * np.pi * self.afreqs[np.newaxis, :, np.newaxis] * d[:, np.newaxis, :])
+
+    def responses(self, b_top, p):
+        """Return the beam responses of all feeds towards `b_top`.
+
+        The response is computed only once for feeds having the same beam and
+        pointing. Positions below the horizon have zero response.
+
+        Parameters
+        ----------
+        b_top : (nt, 3) array
+            Topocentric coordinates of the positions.
+        p : 'x' or 'y'
+            The polarization.
+
+        Returns
+        -------
+        resp : (nt, nfreq, nfeed) array
+
+        """
+        nt, nfreq, nfeed = len(b_top), len(self.afreqs), len(self.feedno)
+        above = (b_top[:, 2] > 0)[:, np.newaxis]
+        resp = np.zeros((nt, nfreq, nfeed), dtype=np.float64)
+        cache = {}
+        for k in xrange(nfeed):
+            key = _beam_key(self.aa[k], p)
+            if not key in cache:
+                rk = self.aa[k].bm_response(b_top.T, pol=p).reshape(nfreq, nt).T # (nt, nfreq)
+                cache[key] = np.where(above, rk, 0)
+            resp[:, :, k] = cache[key]
+
+        return resp
+
+    def iter_simulate(self, src, jul_dates, bls, pols, factor=None):
+        """Simulate the visibilities of source `src` in blocks of time points.
+
+        Parameters
+        ----------
+        src : aipy RadioBody
+            The point source.
+        jul_dates : array like
+            Julian dates of the time points.
+        bls : list of tuples
+            The (feed No., feed No.) pairs of the baselines.
+        pols : list of strings
+            The polarizations, e.g., ['xx', 'yy'].
+        factor : None or (nfreq,) array, optional
+            A factor multiplied to the visibilities, e.g., to convert Jy to K.
+
+        Yields
+        ------
+        st, et : integer
+            The block is of time points `jul_dates[st:et]`.
+        vis : (et-st, nfreq, len(pols), len(bls)) complex array
+            The simulated visibilities of the block.
+
+        """
+        nt, nfreq = len(jul_dates), len(self.afreqs)
+        ais = np.array([ self.feed_inds[i] for i, j in bls ], dtype=int)
+        ajs = np.array([ self.feed_inds[j] for i, j in bls ], dtype=int)
+        nblk = max(1, self.block_bytes // (16 * nfreq * max(1, len(pols) * len(bls))))
+
+        s_top, b_top, jys = self.positions(src, jul_dates)
+        if factor is not None:
+            jys = jys * factor
+
+        for st in xrange(0, nt, nblk):
+            et = min(nt, st + nblk)
+            # the fringe factor of each feed, exp(-2 pi i s_top . r_k nu)
+            phs = 2.0 * np.pi * self.afreqs[np.newaxis, :, np.newaxis] * np.dot(s_top[st:et], self.pos_z.T)[:, np.newaxis, :]
+            fringe = np.exp(-1.0J * phs) # (nb, nfreq, nfeed)
+            gain = {}
+            for p in set(''.join(pols)):
+                gain[p] = self.responses(b_top[st:et], p) * fringe
+
+            vis = np.empty((et-st, nfreq, len(pols), len(bls)), dtype=np.complex128)
+            for pi, pol in enumerate(pols):
+                p1, p2 = pol[0], pol[-1]
+                vis[:, :, pi] = jys[st:et, :, np.newaxis] * gain[p2][:, :, ajs] * gain[p1][:, :, ais].conj()
+
+            yield st, et, vis
+
+    def simulate(self, src, jul_dates, bls, pols, factor=None, out=None):
+        """Simulate the visibilities of source `src`.
+
+        The parameters are the same as :meth:`iter_simulate`. The simulated
+        visibilities of shape (nt, nfreq, len(pols), len(bls)) are written
+        to `out` if given, otherwise to a new array, which is returned.
+
+        """
+        if out is None:
+            out = np.empty((len(jul_dates), len(self.afreqs), len(pols), len(bls)), dtype=np.complex128)
+        for st, et, vis in self.iter_simulate(src, jul_dates, bls, pols, factor):
+            out[st:et] = vis
+
+        return out
@@ -176,22 +176,22 @@ class CylinderBeam(ap.fit.Beam):
 
     @property
     def Omega(self):
-        r"""Return the beam solid angle :math:`\int |A(\boldsymbol{n})|^2 \ d^2\boldsymbol{n}`."""
-        nside = 256
-        angpos = hputil.ang_positions(nside)
-        lat = np.radians(44.15268333) # exact value not important
-        lon = np.radians(91.80686667) # exact value not important
-        zenith = np.array([0.5*np.pi - lat, lon])
-        horizon = visibility.horizon(angpos, zenith)
+        r"""Return the beam solid angle :math:`\int |A(\boldsymbol{n})|^2 \ d^2\boldsymbol{n}`.
 
-        pxarea = (4 * np.pi / (12 * nside**2))
-        om = np.zeros_like(self.freqs)
-        for fi in xrange(len(self.freqs)):
-            width = self.width / (const.c / (1.0e9 * self.freqs[fi]))
-            beam = cylbeam.beam_amp(angpos, zenith, width, self.fwhm_h, self.fwhm_h)
-            om[fi] = np.sum(np.abs(beam)**2 * horizon) * pxarea
+        The solid angle of each frequency is computed only once for a beam
+        geometry and kept in a module level table, which is shared by all
+        beams of the same width.
+        """
+        # cylinder width in wavelength
+        widths = self.width / (const.c / (1.0e9 * self.freqs))
+        keys = [ (wd, self.fwhm_h, self.fwhm_h) for wd in widths.tolist() ]
+        new_widths = sorted(set(key[0] for key in keys if not key in _omega_cache))
+        if len(new_widths) > 0:
+            om = _cylinder_omega(np.array(new_widths), self.fwhm_h, self.fwhm_h)
+            for wd, o in zip(new_widths, om):
+                _omega_cache[(wd, self.fwhm_h, self.fwhm_h)] = o
 
-        return om
+        return np.array([ _omega_cache[key] for key in keys ])
 
     def response(self, xyz):
         """Beam response across active band for specified topocentric coordinates.
@@ -226,13 +226,57 @@ class CylinderBeam(ap.fit.Beam):
         width = self.width / (const.c / (1.0e9 * self.freqs))
 
         nfreq = len(self.freqs)
-        resp = np.zeros((nfreq,)+xyz.shape[1:])
-        for fi in xrange( nfreq):
-            resp[fi] = cylbeam.beam_amp(p_eq, zenith, width[fi], self.fwhm_h, self.fwhm_h)
-            # resp[fi] = cylbeam.beam_amp(p_eq, zenith, width[fi], self.fwhm_e, self.fwhm_h) # for X dipole
-            # resp[fi] = cylbeam.beam_amp(p_eq, zenith, width[fi], self.fwhm_h, self.fwhm_e) # for Y dipole
-
-        return resp
+        resp = _cylinder_beam_amp(p_eq, zenith, width, self.fwhm_h, self.fwhm_h)
+        # resp = _cylinder_beam_amp(p_eq, zenith, width, self.fwhm_e, self.fwhm_h) # for X dipole
+        # resp = _cylinder_beam_amp(p_eq, zenith, width, self.fwhm_h, self.fwhm_e) # for Y dipole
+
+        return resp.reshape((nfreq,)+xyz.shape[1:])
+
+
+# beam solid angles of the cylinder beams, keyed by the cylinder width in
+# wavelength and the fwhm in the x and y directions, see CylinderBeam.Omega
+_omega_cache = {}
+
+
+def _cylinder_beam_amp(angpos, zenith, widths, fwhm_x, fwhm_y):
+    ### amplitude of the cylinder beam, same as cylbeam.beam_amp but for all
+    ### cylinder widths (in wavelength) `widths` together, of shape
+    ### (len(widths),) + angpos.shape[:-1]
+    that, phat = coord.thetaphi_plane_cart(zenith)
+    xhat, yhat, zhat = cylbeam.rotate_ypr([0.0, 0.0, 0.0], phat, -that, coord.sph_to_cart(zenith))
+
+    cvec = coord.sph_to_cart(angpos)
+    horizon = (np.dot(cvec, coord.sph_to_cart(zenith)) > 0.0).astype(np.float64)
+    ns_amp = cylbeam.beam_exptan(np.arcsin(np.dot(cvec, yhat)), fwhm_y)
+
+    # the E-W pattern of a cylinder of width w at sin(theta) is that of a
+    # cylinder of unit width at w * sin(theta), so one interpolator is enough
+    beampat = cylbeam.fraunhofer_cylinder(lambda t: cylbeam.beam_exptan(t, fwhm_x), 1.0)
+    ew = np.dot(cvec, xhat)
+    widths = np.asarray(widths, dtype=np.float64)
+    ew_amp = beampat(np.outer(widths, ew).reshape(-1)).reshape(widths.shape + ew.shape)
+
+    return ew_amp * (ns_amp * horizon)
+
+def _cylinder_omega(widths, fwhm_x, fwhm_y, nside=256, block_bytes=2**26):
+    ### beam solid angles of the cylinder beams of widths `widths` (in
+    ### wavelength), computed for blocks of widths on the pixels above the
+    ### horizon
+    angpos = hputil.ang_positions(nside)
+    lat = np.radians(44.15268333) # exact value not important
+    lon = np.radians(91.80686667) # exact value not important
+    zenith = np.array([0.5*np.pi - lat, lon])
+    horizon = visibility.horizon(angpos, zenith)
+    angpos = angpos[horizon]
+
+    pxarea = (4 * np.pi / (12 * nside**2))
+    nblk = max(1, block_bytes / (8 * len(angpos)))
+    om = np.zeros(len(widths))
+    for st in xrange(0, len(widths), nblk):
+        beam = _cylinder_beam_amp(angpos, zenith, widths[st:st+nblk], fwhm_x, fwhm_y)
+        om[st:st+nblk] = np.sum(np.abs(beam)**2, axis=1) * pxarea
+
+    return om
 
 
 
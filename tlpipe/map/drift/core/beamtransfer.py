@@ -30,7 +30,7 @@ import h5py
 
 from caput import mpiutil
 
-from ..util import util, blockla, tk
+from ..util import util, blockla, tk, workdist
 from . import kltransform
 
 
@@ -227,6 +227,10 @@ class BeamTransfer(object):
 
     _mem_switch = 2.0 # Rough chunks (in GB) to divide calculation into.
 
+    nprocs = 1 # Number of local worker processes to calculate the transfer matrices in.
+
+    _mchunk_bytes = 2**22 # Approximate bytes of a chunk of the m-files.
+
     svcut = 1e-6
     polsvcut = 1e-4
 
@@ -703,7 +707,7 @@ class BeamTransfer(object):
             for si in range(nsections):
                 print "Calculating section %i of %i...." % (si, nsections)
                 b_ind, f_ind = b_sec[si], f_sec[si]
-                tarray = self.telescope.transfer_matrices(b_ind, f_ind)
+                tarray = self.telescope.transfer_matrices(b_ind, f_ind, nprocs=self.nprocs)
                 dset[(b_ind[0]):(b_ind[-1]+1), ..., :(self.telescope.mmax+1)] = tarray[..., :(self.telescope.mmax+1)]
                 dset[(b_ind[0]):(b_ind[-1]+1), ..., (-self.telescope.mmax):]  = tarray[..., (-self.telescope.mmax):]
                 del tarray
@@ -754,8 +758,7 @@ class BeamTransfer(object):
             f = h5py.File(self._mfile(mi), 'w')
 
             dsize = (self.telescope.nfreq, 2, self.telescope.nbase, self.telescope.num_pol_sky, self.telescope.lmax+1)
-            csize = (1, 2, min(10, self.telescope.nbase), self.telescope.num_pol_sky, self.telescope.lmax+1)
-            f.create_dataset('beam_m', dsize, chunks=csize, compression='lzf', dtype=np.complex128)
+            f.create_dataset('beam_m', dsize, chunks=self._mchunks(), compression='lzf', dtype=np.complex128)
 
             # Write a few useful attributes.
             # f.attrs['baselines'] = self.telescope.baselines
@@ -776,9 +779,17 @@ class BeamTransfer(object):
             # Unpack freq-baselines range into num, start and end
             fbnum, fbstart, fbend = fbrange
 
-            # Split the fb list into the ones local to this node
-            loc_num, loc_start, loc_end = mpiutil.split_local(fbnum)
-            fb_ind = range(fbstart + loc_start, fbstart + loc_end)
+            # Balance the estimated cost of the fb list among the nodes, keeping
+            # the number of each node as expected by the transpose below. The
+            # fb's of the nodes in order form the permutation `fb_perm` of the
+            # chunk
+            fb_cost = self.telescope.transfer_lmax(fbmap[1, fbstart:fbend], fbmap[0, fbstart:fbend]).astype(np.float64)**2
+            fb_parts = workdist.partition(fb_cost, mpiutil.size, counts=mpiutil.split_all(fbnum)[0])
+            fb_perm = np.concatenate(fb_parts)
+
+            # The fb list local to this node
+            loc_num = len(fb_parts[mpiutil.rank])
+            fb_ind = fbstart + fb_parts[mpiutil.rank]
 
             # Extract the local frequency and baselines indices
             f_ind = fbmap[0, fb_ind]
@@ -790,7 +801,7 @@ class BeamTransfer(object):
             if loc_num > 0:
 
                 # Calculate the local Beam Matrices
-                tarray = self.telescope.transfer_matrices(bl_ind, f_ind)
+                tarray = self.telescope.transfer_matrices(bl_ind, f_ind, nprocs=self.nprocs)
 
                 # Expensive memory copy into array section
                 for mi in range(1, self.telescope.mmax+1):
@@ -809,19 +820,21 @@ class BeamTransfer(object):
 
             del fb_array
 
+            # Undo the permutation `fb_perm`, so the rows are the fb's from
+            # fbstart to fbend in order
+            fb_array = np.empty_like(m_array)
+            fb_array[fb_perm] = m_array
+
+            del m_array
+
             # Write out the current set of chunks into the m-files.
             for lmi, mi in enumerate(range(sm, em)):
 
                 # Open up correct m-file
                 with h5py.File(self._mfile(mi), 'r+') as mfile:
+                    self._write_mblock(mfile['beam_m'], fb_array[..., lmi], fbstart, fbend)
 
-                    # Lookup where to write Beam Transfers and write into file.
-                    for fbl, fbi in enumerate(range(fbstart, fbend)):
-                        fi = fbmap[0, fbi]
-                        bi = fbmap[1, fbi]
-                        mfile['beam_m'][fi, :, bi] = m_array[fbl, ..., lmi]
-
-            del m_array
+            del fb_array
 
         mpiutil.barrier()
 
@@ -837,6 +850,48 @@ class BeamTransfer(object):
 
 
 
+    def _mchunks(self):
+        ## Chunk shape of the `beam_m` dataset of the m-files, one frequency
+        ## of a section of the baselines of about `_mchunk_bytes`. It is read
+        ## a frequency at a time, and written in blocks of whole frequencies
+        ## by `_write_mblock`, so most chunks are written only once.
+
+        nbase = self.telescope.nbase
+        fbsize = 2 * self.telescope.num_pol_sky * (self.telescope.lmax+1) * 16
+
+        # Split the baselines into sections of even length
+        nsec = int(np.ceil(1.0 * nbase * fbsize / self._mchunk_bytes))
+        nb = int(np.ceil(1.0 * nbase / max(nsec, 1)))
+
+        return (1, 2, max(nb, 1), self.telescope.num_pol_sky, self.telescope.lmax+1)
+
+
+    def _write_mblock(self, dset, fb_block, fbstart, fbend):
+        ## Write the beam transfers `fb_block` of the fb's from fbstart to
+        ## fbend (ordered by frequency, then baseline) into the `beam_m`
+        ## dataset `dset` of an m-file, as at most three hyperslabs: the
+        ## partial first frequency, the whole frequencies and the partial
+        ## last frequency.
+
+        nbase = self.telescope.nbase
+
+        fb = fbstart
+        while fb < fbend:
+            fi, bi = fb // nbase, fb % nbase
+            if bi == 0 and fbend - fb >= nbase:
+                # A block of whole frequencies
+                nf = (fbend - fb) // nbase
+                block = fb_block[(fb-fbstart):(fb-fbstart+nf*nbase)]
+                block = block.reshape((nf, nbase) + block.shape[1:])
+                dset[fi:(fi+nf)] = block.swapaxes(1, 2)
+                fb += nf * nbase
+            else:
+                # Part of a frequency
+                be = min(nbase, bi + fbend - fb)
+                dset[fi, :, bi:be] = fb_block[(fb-fbstart):(fb-fbstart+be-bi)].swapaxes(0, 1)
+                fb += be - bi
+
+
     def _generate_svdfiles(self, regen=False):
         ## Generate all the SVD transfer matrices by simply iterating over all
         ## m, performing the SVD, combining the beams and then write out the
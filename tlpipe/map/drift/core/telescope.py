@@ -1,4 +1,5 @@
 import abc
+import collections
 
 import numpy as np
 
@@ -8,6 +9,7 @@ from cora.util import hputil, units
 
 import visibility
 from ..util import util
+from ..util import workdist
 
 
 def in_range(arr, min, max):
@@ -559,7 +561,33 @@ class TransitTelescope(object):
 
     #==== Methods for calculating Transfer matrices ====
 
-    def transfer_matrices(self, bl_indices, f_indices, global_lmax = True):
+    def transfer_lmax(self, bl_indices, f_indices):
+        """The maximum *l* needed for the transfer matrices of baseline and
+        frequency combinations.
+
+        Parameters
+        ----------
+        bl_indices : array_like
+            Indices of baselines.
+        f_indices : array_like
+            Indices of frequencies. Must be broadcastable against `bl_indices`.
+
+        Returns
+        -------
+        lmax : np.ndarray
+            The maximum *l* of each combination, of the broadcast shape. The
+            cost of calculating a transfer matrix scales as `lmax**2`.
+        """
+
+        bl_indices, f_indices = np.broadcast_arrays(bl_indices, f_indices)
+
+        lmax, mmax = np.ceil(self.l_boost * np.array(max_lm(self.baselines[bl_indices], self.wavelengths[f_indices], self.u_width, self.v_width))).astype(np.int64)
+        #lmax, mmax = lmax * self.l_boost, mmax * self.l_boost
+
+        return lmax
+
+
+    def transfer_matrices(self, bl_indices, f_indices, global_lmax = True, nprocs = 1):
         """Calculate the spherical harmonic transfer matrices for baseline and
         frequency combinations.
 
@@ -574,6 +602,10 @@ class TransitTelescope(object):
             If set (default), the output size `lside` in (l,m) is big enough to
             hold the maximum for the entire telescope. If not set it is only big
             enough for the requested set.
+        nprocs : integer, optional
+            Number of local worker processes to calculate the transfer matrices
+            in. The combinations are distributed among them by their estimated
+            cost (scales as `lmax**2`). Default 1.
 
         Returns
         -------
@@ -596,29 +628,43 @@ class TransitTelescope(object):
 
         # Fetch the set of lmax's for the baselines (in order to reduce time
         # regenerating Healpix maps)
-        lmax, mmax = np.ceil(self.l_boost * np.array(max_lm(self.baselines[bl_indices], self.wavelengths[f_indices], self.u_width, self.v_width))).astype(np.int64)
-        #lmax, mmax = lmax * self.l_boost, mmax * self.l_boost
+        lmax = self.transfer_lmax(bl_indices, f_indices)
         # Set the size of the (l,m) array to write into
         lside = self.lmax if global_lmax else lmax.max()
 
-        # Generate the array for the Transfer functions
+        # Cache the beams of each feed for this run
+        self._beam_cache = collections.OrderedDict()
+        self._beam_cache_nbytes = 0
+
+        # Generate the array for the Transfer functions, in shared memory if
+        # the worker processes write into it
+        nprocs = max(1, min(nprocs, lmax.size))
 
         tshape = bl_indices.shape + (self.num_pol_sky, lside+1, 2*lside+1)
         print "Size: %i elements. Memory %f GB." % (np.prod(tshape), 2*np.prod(tshape) * 8.0 / 2**30)
-        tarray = np.zeros(tshape, dtype=np.complex128)
-
-        # Sort the baselines by ascending lmax and iterate through in that
-        # order, calculating the transfer matrices
-        i_arr = np.argsort(lmax.flat)
-
-        for iflat in np.argsort(lmax.flat):
-            ind = np.unravel_index(iflat, lmax.shape)
-            trans = self._transfer_single(bl_indices[ind], f_indices[ind], lmax[ind], lside)
-
-            ## Iterate over pol combinations and copy into transfer array
-            for pi in range(self.num_pol_sky):
-                islice = (ind + (pi,) + (slice(None),slice(None)))
-                tarray[islice] = trans[pi]
+        if nprocs > 1:
+            tarray = workdist.shared_zeros(tshape, dtype=np.complex128)
+        else:
+            tarray = np.zeros(tshape, dtype=np.complex128)
+
+        def _transfer_part(part):
+            # Sort the baselines by ascending lmax and iterate through in that
+            # order, calculating the transfer matrices
+            for iflat in part[np.argsort(lmax.flat[part], kind='mergesort')]:
+                ind = np.unravel_index(iflat, lmax.shape)
+                trans = self._transfer_single(bl_indices[ind], f_indices[ind], lmax[ind], lside)
+
+                ## Iterate over pol combinations and copy into transfer array
+                for pi in range(self.num_pol_sky):
+                    islice = (ind + (pi,) + (slice(None),slice(None)))
+                    tarray[islice] = trans[pi]
+
+        # Balance the estimated cost among the worker processes
+        parts = workdist.partition(lmax.flatten().astype(np.float64)**2, nprocs)
+        try:
+            workdist.fork_run(_transfer_part, parts)
+        finally:
+            self._beam_cache = None
 
         return tarray
 
@@ -754,6 +800,43 @@ class TransitTelescope(object):
         self._horizon = visibility.horizon(self._angpos, self.zenith)
 
 
+    # Memory budget (in bytes) of the beam maps cached during a run of
+    # `transfer_matrices`.
+    beam_cache_bytes = 2**30
+
+    _beam_cache = None
+
+    def _cached_beam(self, feed, f_index, func):
+        ## Return `func(feed, f_index)` of the current nside, cached (with least
+        ## recently used eviction) during a run of `transfer_matrices`, as each
+        ## beam is used by all the baselines of the feed. `func` returns a
+        ## tuple of arrays and scalars.
+
+        if self._beam_cache is None:
+            return func(feed, f_index)
+
+        key = (feed, f_index, self._nside)
+        cache = self._beam_cache
+
+        if key in cache:
+            # Move to the most recently used end
+            val, nbytes = cache.pop(key)
+        else:
+            val = func(feed, f_index)
+            nbytes = sum(np.asarray(v).nbytes for v in val)
+            if nbytes > self.beam_cache_bytes:
+                return val
+
+            # Evict the least recently used ones to keep within the budget
+            while len(cache) > 0 and self._beam_cache_nbytes + nbytes > self.beam_cache_bytes:
+                self._beam_cache_nbytes -= cache.popitem(last=False)[1][1]
+            self._beam_cache_nbytes += nbytes
+
+        cache[key] = (val, nbytes)
+
+        return val
+
+
 
 
     #===================================================
@@ -859,22 +942,30 @@ class UnpolarisedTelescope(TransitTelescope):
 
     #===== Implementations of abstract functions =======
 
+    def _beam_and_omega(self, feed, f_index):
+        ## The beam map of a feed and its solid angle.
+
+        beam = self.beam(feed, f_index)
+
+        pxarea = (4 * np.pi / beam.shape[0])
+
+        # Beam solid angle (integrate over beam^2 - equal area pixels)
+        omega = np.sum(np.abs(beam)**2 * self._horizon) * pxarea
+
+        return beam, omega
+
+
     def _beam_map_single(self, bl_index, f_index):
 
-        # Get beam maps for each feed.
+        # Get beam maps and solid angles for each feed.
         feedi, feedj = self.uniquepairs[bl_index]
-        beami, beamj = self.beam(feedi, f_index), self.beam(feedj, f_index)
+        beami, om_i = self._cached_beam(feedi, f_index, self._beam_and_omega)
+        beamj, om_j = self._cached_beam(feedj, f_index, self._beam_and_omega)
 
         # Get baseline separation and fringe map.
         uv = self.baselines[bl_index] / self.wavelengths[f_index]
         fringe = visibility.fringe(self._angpos, self.zenith, uv)
 
-        pxarea = (4 * np.pi / beami.shape[0])
-
-        # Beam solid angle (integrate over beam^2 - equal area pixels)
-        om_i = np.sum(np.abs(beami)**2 * self._horizon) * pxarea
-        om_j = np.sum(np.abs(beamj)**2 * self._horizon) * pxarea
-
         omega_A = (om_i * om_j)**0.5
 
         # Calculate the complex visibility transfer function
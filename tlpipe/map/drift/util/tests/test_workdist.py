@@ -0,0 +1,36 @@
+import numpy as np
+
+from tlpipe.map.drift.util import workdist
+
+
+def test_partition():
+
+    costs = np.random.uniform(1.0, 100.0, 97)**2
+    parts = workdist.partition(costs, 4)
+
+    assert np.all(np.sort(np.concatenate(parts)) == np.arange(len(costs)))
+
+    # The LPT rule is within max(cost) of the optimal balance
+    loads = [ costs[p].sum() for p in parts ]
+    assert max(loads) - min(loads) <= costs.max()
+
+
+def test_partition_counts():
+
+    costs = np.arange(10.0)
+    parts = workdist.partition(costs, 3, counts=[4, 3, 3])
+
+    assert [ len(p) for p in parts ] == [4, 3, 3]
+    assert np.all(np.sort(np.concatenate(parts)) == np.arange(len(costs)))
+
+
+def test_fork_run():
+
+    out = workdist.shared_zeros((3, 5))
+
+    def fill(part):
+        out[part] = part[:, np.newaxis] + 1
+
+    workdist.fork_run(fill, [np.array([0]), np.array([1, 2])])
+
+    assert np.all(out == np.arange(1, 4)[:, np.newaxis])
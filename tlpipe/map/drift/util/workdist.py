@@ -0,0 +1,139 @@
+"""Distribute work items of unequal cost among MPI processes and local workers.
+
+The cost of the beam transfer matrix of a (baseline, frequency) pair grows as
+:math:`l_{max}^2`, so splitting the pairs into sections of equal number leaves
+the processes holding the long baselines or the high frequencies working while
+the others wait. :func:`partition` assigns the items to the processes by their
+estimated costs instead, and :func:`fork_run` runs a function on each part in
+forked local worker processes, which write their results into arrays created
+by :func:`shared_zeros` in memory shared with the parent process.
+
+"""
+
+import os
+import sys
+import mmap
+import heapq
+import traceback
+
+import numpy as np
+
+
+def partition(costs, nparts, counts=None):
+    """Partition items among `nparts` parts so that the total costs are balanced.
+
+    The items are assigned in descending order of cost, each to the part of
+    currently the least total cost (the longest processing time first rule).
+
+    Parameters
+    ----------
+    costs : array_like
+        The estimated cost of each item.
+    nparts : integer
+        Number of parts.
+    counts : None or array_like of integers, optional
+        If given, the number of items of each part, which must sum to the
+        number of items, e.g., to keep the section sizes expected by
+        `mpiutil.transpose_blocks`. Default None.
+
+    Returns
+    -------
+    parts : list of np.ndarray
+        The indices of the items of each part, in ascending order.
+    """
+
+    costs = np.asarray(costs, dtype=np.float64).reshape(-1)
+
+    if counts is None:
+        counts = [ len(costs) ] * nparts
+    elif np.sum(counts) != len(costs):
+        raise ValueError('Counts %s do not sum to the number of items %d' % (list(counts), len(costs)))
+
+    parts = [ [] for pi in range(nparts) ]
+
+    # Heap of (total cost, part) of the parts which are not full
+    heap = [ (0.0, pi) for pi in range(nparts) if counts[pi] > 0 ]
+    heapq.heapify(heap)
+
+    for ii in np.argsort(costs, kind='mergesort')[::-1]:
+        load, pi = heapq.heappop(heap)
+        parts[pi].append(ii)
+        if len(parts[pi]) < counts[pi]:
+            heapq.heappush(heap, (load + costs[ii], pi))
+
+    return [ np.sort(np.array(p, dtype=np.int64)) for p in parts ]
+
+
+def shared_zeros(shape, dtype=np.float64):
+    """Create an array of zeros in memory shared with the forked processes.
+
+    Parameters
+    ----------
+    shape : tuple of integers
+        Shape of the array.
+    dtype : np.dtype, optional
+        Data type of the array.
+
+    Returns
+    -------
+    array : np.ndarray
+    """
+
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+
+    # An anonymous mapping is zero filled, and shared with the children
+    buf = mmap.mmap(-1, max(nbytes, 1))
+
+    return np.frombuffer(buf, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+
+
+def fork_run(func, parts):
+    """Run `func(part)` for each part in a forked local worker process.
+
+    The worker processes inherit the state of the calling process, and must
+    write their results into arrays created by :func:`shared_zeros`. If there
+    is only one part it is run in the calling process.
+
+    Parameters
+    ----------
+    func : callable
+        Function of a single part.
+    parts : list
+        The parts, e.g., as returned by :func:`partition`.
+    """
+
+    if len(parts) == 1:
+        func(parts[0])
+        return
+
+    # Flush the buffers before fork so that they are not written twice
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    pids = []
+    for part in parts:
+        pid = os.fork()
+        if pid == 0:
+            # In the worker process
+            status = 0
+            try:
+                func(part)
+            except:
+                traceback.print_exc()
+                status = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(status)
+
+        pids.append(pid)
+
+    failed = []
+    for pid in pids:
+        pid, status = os.waitpid(pid, 0)
+        if status != 0:
+            failed.append(pid)
+
+    if len(failed) > 0:
+        raise RuntimeError('Worker processes %s failed' % failed)
@@ -365,10 +365,17 @@ import warnings
 import shutil
 import itertools
 import datetime
+import traceback
+import hashlib
+import json
+import cPickle as pickle
+import contextlib
+import numpy as np
 
 from caput import mpiutil
 from tlpipe.kiyopy import parse_ini
 from tlpipe.utils.path_util import input_path, output_path
+from profiler import Profiler
 
 
 
@@ -418,6 +425,186 @@ class _PipelineFinished(Exception):
     pass
 
 
+# Result Cache
+# ------------
+
+class ResultCache(object):
+    """Content addressed cache of the results of pipeline tasks.
+
+    The result of an iteration of a task is keyed by the hash of the task
+    class (including the source code of the modules of it and its base
+    classes, so the module level helpers it calls are included), the task
+    parameters (except for the product keys 'requires', 'in' and 'out') and
+    the fingerprints of its inputs, which are either the keys of the upstream
+    results or the path, size and modification time of the input files.
+    A record of the output files written for a key, together with their
+    sizes and modification times, is saved in `cache_dir`, and the result is
+    considered cached as long as the output files are unchanged.
+
+    Parameters
+    ----------
+    cache_dir : string
+        Directory to save the cache records.
+
+    """
+
+    def __init__(self, cache_dir):
+
+        self.cache_dir = cache_dir
+        if mpiutil.rank0 and not path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        mpiutil.barrier()
+
+        self._class_hashes = {}
+
+    @staticmethod
+    def file_fingerprint(filename):
+        """Fingerprint of a file as a list of its path, size and modification time.
+
+        Return None if `filename` does not exist.
+
+        """
+
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return None
+
+        return [ path.abspath(filename), st.st_size, repr(st.st_mtime) ]
+
+    def _class_hash(self, cls):
+        ### hash of the source code of the modules of cls and its task base
+        ### classes, which includes the module level helpers they call
+        if not cls in self._class_hashes:
+            sha = hashlib.sha1()
+            modules = []
+            for klass in inspect.getmro(cls):
+                if issubclass(klass, TaskBase):
+                    sha.update('%s.%s' % (klass.__module__, klass.__name__))
+                    if not klass.__module__ in modules:
+                        modules.append(klass.__module__)
+            for name in modules:
+                try:
+                    sha.update(inspect.getsource(sys.modules[name]))
+                except (IOError, TypeError, KeyError):
+                    pass
+            self._class_hashes[cls] = sha.hexdigest()
+
+        return self._class_hashes[cls]
+
+    def task_key(self, task, inputs):
+        """Return the cache key of `task` with input fingerprints `inputs`."""
+
+        sha = hashlib.sha1()
+        sha.update(self._class_hash(task.__class__))
+        for key in sorted(task.params.keys()):
+            if key in ('requires', 'in', 'out'):
+                continue
+            sha.update(key)
+            _hash_update(sha, task.params[key])
+        _hash_update(sha, inputs)
+
+        return sha.hexdigest()
+
+    def _record_file(self, key):
+        return path.join(self.cache_dir, '%s.json' % key)
+
+    def lookup(self, key, output_files):
+        """Return True if the result of `key` is cached in `output_files`."""
+
+        cached = False
+        if mpiutil.rank0 and len(output_files) > 0:
+            try:
+                with open(self._record_file(key), 'r') as f:
+                    record = json.load(f)
+                files = [ self.file_fingerprint(output_file) for output_file in output_files ]
+                cached = (files == record['output_files'])
+            except (IOError, ValueError, KeyError):
+                cached = False
+
+        return mpiutil.bcast(cached, root=0)
+
+    def store(self, key, task, output_files):
+        """Record that the result of `key` of `task` has been written to `output_files`."""
+
+        # wait for all processes to finish writing
+        mpiutil.barrier()
+
+        if mpiutil.rank0 and len(output_files) > 0:
+            files = [ self.file_fingerprint(output_file) for output_file in output_files ]
+            if not None in files:
+                record = {
+                           'task': '%s.%s' % (task.__module__, task.__class__.__name__),
+                           'time': str(datetime.datetime.now()),
+                           'output_files': files,
+                         }
+                # write to a temporary file first to avoid a partial record
+                tmp_file = self._record_file(key) + '.tmp'
+                with open(tmp_file, 'w') as f:
+                    json.dump(record, f, indent=1)
+                os.rename(tmp_file, self._record_file(key))
+
+        mpiutil.barrier()
+
+
+# Worker Processes
+# ----------------
+
+class _WorkerPool(object):
+    """Run task functions in at most `max_workers` forked worker processes."""
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._pids = collections.OrderedDict() # pid: task name
+
+    def _wait(self, pid):
+        ### wait for the worker process pid to exit
+        pid, status = os.waitpid(pid, 0)
+        name = self._pids.pop(pid)
+        if status != 0:
+            msg = '%s failed in worker process %d with status %d' % (name, pid, status)
+            raise PipelineRuntimeError(msg)
+
+    def submit(self, task, func, *args):
+        """Run `func(*args)` of `task` in a new worker process."""
+
+        while len(self._pids) >= self.max_workers:
+            # wait for the oldest one
+            self._wait(self._pids.keys()[0])
+
+        # flush the buffers before fork so that they are not written twice
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        pid = os.fork()
+        if pid == 0:
+            # in the worker process
+            status = 0
+            try:
+                func(*args)
+            except:
+                traceback.print_exc()
+                status = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(status)
+
+        self._pids[pid] = '%s(%s)' % (task.__class__.__name__, task.prefix)
+
+    def join(self, task=None):
+        """Wait for the worker processes of `task`, or all if None, to finish."""
+
+        if task is None:
+            pids = self._pids.keys()
+        else:
+            name = '%s(%s)' % (task.__class__.__name__, task.prefix)
+            pids = [ pid for pid, pname in self._pids.items() if pname == name ]
+
+        for pid in pids:
+            self._wait(pid)
+
+
 # Pipeline Manager
 # ----------------
 
@@ -441,16 +628,25 @@ class Manager(object):
                     'outdir': 'output/', # output directory of pipeline data, default is current-dir/output/
                     'timing': False, # log the running time
                     'flush': False, # flush stdout buffer after each task, may slower the running
+                    'cache': False, # reuse the cached outputs of cacheable tasks if their params and inputs are unchanged
+                    'cache_dir': None, # directory of the cache records, default is outdir/cache/
+                    'profile': False, # record the resource usage of each task
+                    'profile_file': 'profile', # profile report file name (without extension) relative to outdir
+                    'workers': 0, # max number of worker processes to run the side branch tasks concurrently, 0 to disable
+                    'checkpoint': False, # save a checkpoint after each completed iteration to resume the pipeline from
+                    'checkpoint_dir': 'checkpoint/', # directory of the checkpoint relative to outdir
                   }
 
     prefix = 'pipe_'
 
 
-    def __init__(self, pipefile=None, feedback=2):
+    def __init__(self, pipefile=None, feedback=2, resume=False):
 
         # Read in the parameters.
         self.params, self.task_params = parse_ini.parse(pipefile, self.params_init, prefix=self.prefix, return_undeclared=True, feedback=feedback)
         self.tasks = self.params['tasks']
+        # resume from the last checkpoint
+        self.resume = resume
 
         # timing the running
         if self.params['timing']:
@@ -513,6 +709,32 @@ class Manager(object):
         # Flush output or not
         flush = self.params['flush']
 
+        # result cache shared by all tasks
+        if self.params['cache']:
+            cache_dir = self.params['cache_dir']
+            if cache_dir is None:
+                cache_dir = '%s/cache/' % self.params['outdir']
+            result_cache = ResultCache(output_path(cache_dir, relative=False))
+        else:
+            result_cache = None
+
+        # profiler shared by all tasks
+        if self.params['profile']:
+            profiler = Profiler()
+        else:
+            profiler = None
+
+        # worker processes for the concurrent tasks
+        workers = self.params['workers']
+        if workers > 0 and mpiutil.size > 1:
+            if mpiutil.rank0:
+                logger.info('Worker processes are only supported for a single process run, will run all tasks in the main process')
+            workers = 0
+        if workers > 0:
+            worker_pool = _WorkerPool(workers)
+        else:
+            worker_pool = None
+
         # Initialize all tasks.
         pipeline_tasks = []
         for ii, task_spec in enumerate(self.tasks):
@@ -535,22 +757,77 @@ class Manager(object):
                 new_e = PipelineConfigError(msg)
                 # This preserves the traceback.
                 raise new_e.__class__, new_e, sys.exc_info()[2]
+            task._result_cache = result_cache
+            task._profiler = profiler
             pipeline_tasks.append(task)
             if mpiutil.rank0:
                 logger.debug("Added %s to task list." % task.__class__.__name__)
 
+        # checkpoint
+        if self.params['checkpoint'] or self.resume:
+            checkpoint_dir = output_path(self.params['checkpoint_dir'], mkdir=False)
+            checkpoint_file = path.join(checkpoint_dir, 'checkpoint.pkl')
+            if mpiutil.rank0 and not path.isdir(checkpoint_dir):
+                os.makedirs(checkpoint_dir)
+            mpiutil.barrier()
+        else:
+            checkpoint_dir = None
+        all_tasks = list(pipeline_tasks)
+        if self.resume:
+            restore_records = self._load_checkpoint(checkpoint_file, all_tasks)
+        else:
+            restore_records = None
+        checkpoint_iter = None
+
+        # build the dependency graph (of the data products and the files), and
+        # run the forkable tasks in worker processes if their inputs are all
+        # in-memory products and their outputs (products or files) are not
+        # required by any other task
+        producers, consumers = _task_graph(pipeline_tasks)
+        for key in consumers.keys():
+            if not key in producers and not _is_file_key(key) and mpiutil.rank0:
+                logger.debug('Data product with key %s is not produced by any task.' % key)
+        if worker_pool is not None:
+            for task in pipeline_tasks:
+                out_files = [ _file_key(fl) for fl in _task_files(task, 'output_files') ]
+                if (isinstance(task, OneAndOne) and task.forkable and len(task._in_keys) > 0
+                    and len(_task_files(task, 'input_files')) == 0
+                    and not any(key in consumers for key in list(task._out_keys) + out_files)
+                    and not any(len(producers[key]) > 1 for key in out_files)):
+                    task._worker_pool = worker_pool
+                    if mpiutil.rank0:
+                        logger.info('Run %s in worker processes.' % task.__class__.__name__)
+
         # flush if requires
         if flush:
             sys.stdout.flush()
             sys.stderr.flush()
 
+        if profiler is not None:
+            profiler.install()
+
         # Run the pipeline.
         while pipeline_tasks:
             for task in list(pipeline_tasks):  # Copy list so we can alter it.
+                if checkpoint_dir is not None:
+                    # save a checkpoint if a new iteration has completed
+                    iters = _pipeline_iterations(all_tasks)
+                    if iters is not None and iters != checkpoint_iter:
+                        if worker_pool is not None:
+                            worker_pool.join()
+                        self._write_checkpoint(checkpoint_file, checkpoint_dir, all_tasks)
+                        checkpoint_iter = iters
+                if task._worker_pool is not None and task._pipeline_state == 'finish':
+                    # wait for all iterations to finish before `finish()`
+                    task._worker_pool.join(task)
+                if profiler is not None:
+                    profiler.start(task, task._pipeline_state)
                 # These lines control the flow of the pipeline.
                 try:
                     out = task._pipeline_next()
                 except _PipelineMissingData:
+                    if profiler is not None:
+                        profiler.discard()
                     if pipeline_tasks.index(task) == 0:
                         msg = ("%s missing input data and is at beginning of"
                                " task list. Advancing state."
@@ -560,8 +837,22 @@ class Manager(object):
                         task._pipeline_advance_state()
                     break
                 except _PipelineFinished:
+                    if profiler is not None:
+                        profiler.discard()
                     pipeline_tasks.remove(task)
                     continue
+                if profiler is not None:
+                    if task._pipeline_state == 'finish' and out is None:
+                        # `next()` just stopped the iteration
+                        profiler.discard()
+                    else:
+                        profiler.stop()
+                if restore_records is not None and task._pipeline_state != 'setup' and id(task) in restore_records:
+                    # restore the state saved in the checkpoint after `setup()`
+                    task._pipeline_restore(restore_records.pop(id(task)))
+                    if len(restore_records) == 0:
+                        # the restored state has been saved
+                        checkpoint_iter = _pipeline_iterations(all_tasks)
                 # Now pass the output data products to any task that needs them.
                 out_keys = task._out_keys
                 if out is None:     # This iteration supplied no output.
@@ -580,13 +871,74 @@ class Manager(object):
                 if mpiutil.rank0:
                     logger.debug(msg)
                 for receiving_task in pipeline_tasks:
-                    receiving_task._pipeline_inspect_queue_product(out_keys, out)
+                    receiving_task._pipeline_inspect_queue_product(out_keys, out, getattr(task, '_output_fingerprint', None))
 
                 # flush if requires
                 if flush:
                     sys.stdout.flush()
                     sys.stderr.flush()
 
+        if worker_pool is not None:
+            worker_pool.join()
+
+        # write the profile report
+        if profiler is not None:
+            profiler.uninstall()
+            profile_file = output_path(self.params['profile_file'])
+            profiler.write(profile_file, outdir=path.abspath(self.params['outdir']))
+            if mpiutil.rank0:
+                logger.info('Profile report written to %s.json and %s.csv' % (profile_file, profile_file))
+
+
+    def _load_checkpoint(self, checkpoint_file, tasks):
+        ### load the task records from the checkpoint file, return a dict of
+        ### task id to record, None if no checkpoint
+        if mpiutil.rank0:
+            try:
+                with open(checkpoint_file, 'rb') as f:
+                    checkpoint = pickle.load(f)
+            except IOError:
+                checkpoint = None
+        else:
+            checkpoint = None
+        checkpoint = mpiutil.bcast(checkpoint, root=0)
+
+        if checkpoint is None:
+            if mpiutil.rank0:
+                logger.info('No checkpoint file %s, will start from the beginning' % checkpoint_file)
+            return None
+
+        records = checkpoint['tasks']
+        names = [ (task.__class__.__name__, task.prefix) for task in tasks ]
+        if names != [ (rec['class'], rec['prefix']) for rec in records ]:
+            msg = ('Tasks %s do not match those %s in the checkpoint file %s' %
+                   (names, [ (rec['class'], rec['prefix']) for rec in records ], checkpoint_file))
+            raise PipelineConfigError(msg)
+
+        if mpiutil.rank0:
+            logger.info('Resume from the checkpoint saved at %s' % checkpoint['time'])
+
+        return dict(zip([ id(task) for task in tasks ], records))
+
+    def _write_checkpoint(self, checkpoint_file, checkpoint_dir, tasks):
+        ### save the checkpoint of tasks
+        records = [ task._pipeline_checkpoint(checkpoint_dir) for task in tasks ]
+        mpiutil.barrier()
+
+        if mpiutil.rank0:
+            checkpoint = {
+                           'time': str(datetime.datetime.now()),
+                           'tasks': records,
+                         }
+            # write to a temporary file first to keep the last checkpoint
+            # consistent if being killed while writing
+            tmp_file = checkpoint_file + '.tmp'
+            with open(tmp_file, 'wb') as f:
+                pickle.dump(checkpoint, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_file, checkpoint_file)
+            logger.debug('Checkpoint saved to %s' % checkpoint_file)
+
+        mpiutil.barrier()
 
     def _setup_task(self, task):
         """Set up a pipeline task from the spec given in the tasks list."""
@@ -670,6 +1022,13 @@ class TaskBase(object):
 
     prefix = 'tb_'
 
+    # the :class:`ResultCache` set by the pipeline manager, None if disabled
+    _result_cache = None
+    # the :class:`~tlpipe.pipeline.profiler.Profiler` set by the pipeline manager, None if disabled
+    _profiler = None
+    # the :class:`_WorkerPool` to execute `next()` set by the pipeline manager, None if not concurrent
+    _worker_pool = None
+
 
     # Overridable Attributes
     # -----------------------
@@ -787,7 +1146,54 @@ class TaskBase(object):
     def cacheable(self):
         """Override to return `True` if caching results is implemented.
 
-        No caching infrastructure has yet been implemented.
+        A cacheable task must produce the same output for the same parameters
+        and inputs, i.e., its output must not depend on the state kept from
+        the previous iterations, and it must be able to read its output back
+        from the output files (see :meth:`OneAndOne.read_output`). When the
+        result cache is enabled in the pipeline manager, the processing of a
+        cacheable task is skipped and its output is read from the output
+        files written by an earlier run if the task class, its parameters
+        and the fingerprints of its inputs are all unchanged.
+
+        """
+
+        return False
+
+    def checkpoint_state(self, checkpoint_dir):
+        """Override to return the state of the task to be saved in a checkpoint.
+
+        The returned state must be picklable and is the same on all processes.
+        Large data should be saved into files in `checkpoint_dir` and only
+        their names be returned. This is called on all processes after each
+        completed iteration of the pipeline if checkpointing is enabled.
+
+        """
+
+        return {}
+
+    def restore_state(self, state):
+        """Override to restore the state returned by :meth:`checkpoint_state`.
+
+        This is called after `setup()` when resuming the pipeline from a
+        checkpoint.
+
+        """
+
+        pass
+
+    @property
+    def forkable(self):
+        """Override to return `True` if `next()` can be executed in a worker process.
+
+        When the pipeline manager is set to use worker processes, the `next()`
+        of a forkable task whose output products and output files are not
+        required by any other task is executed in a forked worker process,
+        concurrently with the other tasks. A forkable task must not keep any
+        state from `next()` that is required by its later iterations or
+        `finish()`, other than the iteration counter of :class:`OneAndOne`,
+        and must not use files opened by other tasks. Only implemented for
+        :class:`OneAndOne` tasks whose inputs are all products from 'in' (no
+        `input_files`).
 
         """
 
@@ -859,6 +1265,13 @@ class TaskBase(object):
         self._in_keys = in_
         self._in = [Queue.Queue() for i in xrange(n_in)]
         self._out_keys = out
+        # fingerprints of the input data products for result caching
+        self._requires_fingerprints = [None] * n_requires
+        self._in_fingerprints = [Queue.Queue() for i in xrange(n_in)]
+        self._input_fingerprints = []
+        self._output_fingerprint = None
+        # number of completed `next()` iterations
+        self._next_cnt = 0
 
     def _pipeline_advance_state(self):
         """Advance this pipeline task to the next stage.
@@ -891,6 +1304,7 @@ class TaskBase(object):
                         warnings.warn(msg)
 
             self._in = None
+            self._in_fingerprints = None
             self._pipeline_state = "finish"
         elif self._pipeline_state == "finish":
             self._pipeline_state = "raise"
@@ -908,6 +1322,8 @@ class TaskBase(object):
 
         """
 
+        self._output_fingerprint = None
+
         if self._pipeline_state == "setup":
             # Check if we have all the required input data.
             for req in self._requires:
@@ -930,11 +1346,13 @@ class TaskBase(object):
                 args = ()
                 for in_ in self._in:
                     args += (in_.get(),)
+                self._input_fingerprints = [ in_fp.get() for in_fp in self._in_fingerprints ] + self._requires_fingerprints
                 try:
                     msg = "Task %s calling 'next()'." % self.__class__.__name__
                     if mpiutil.rank0:
                         logger.debug(msg)
                     out = self.next(*args)
+                    self._next_cnt += 1
                     return out
                 except PipelineStopIteration:
                     # Finished iterating `next()`.
@@ -951,13 +1369,37 @@ class TaskBase(object):
         else:
             raise PipelineRuntimeError()
 
-    def _pipeline_inspect_queue_product(self, keys, products):
+    def _pipeline_checkpoint(self, checkpoint_dir):
+        """Return the record of the pipeline state and the task state for checkpointing."""
+
+        return {
+                 'class': self.__class__.__name__,
+                 'prefix': self.prefix,
+                 'pipeline_state': self._pipeline_state,
+                 'next_cnt': self._next_cnt,
+                 'state': self.checkpoint_state(checkpoint_dir),
+               }
+
+    def _pipeline_restore(self, record):
+        """Restore the pipeline state and the task state from a checkpoint record."""
+
+        self._next_cnt = record['next_cnt']
+        self.restore_state(record['state'])
+        # advance to the saved pipeline state, `setup()` has been run
+        for state in ('next', 'finish', 'raise'):
+            if self._pipeline_state == record['pipeline_state']:
+                break
+            if self._pipeline_state == state:
+                self._pipeline_advance_state()
+
+    def _pipeline_inspect_queue_product(self, keys, products, fingerprint=None):
         """Inspect data products and queue them as inputs if applicable.
 
         Compare a list of data products keys to the keys expected by this task
         as inputs to `setup()` ('requires') and `next()` ('in').  If there is a
         match, store the corresponding data product to be used in the next
-        invocation of these methods.
+        invocation of these methods. The `fingerprint` of the products, if
+        given, is stored along with them for result caching.
 
         """
 
@@ -965,6 +1407,10 @@ class TaskBase(object):
         for ii in xrange(n_keys):
             key = keys[ii]
             product = products[ii]
+            if fingerprint is None:
+                product_fingerprint = None
+            else:
+                product_fingerprint = '%s:%d' % (fingerprint, ii)
             for jj, requires_key in enumerate(self._requires_keys):
                 if requires_key == key:
                     # Make sure that `setup()` hasn't already been run or this
@@ -983,6 +1429,7 @@ class TaskBase(object):
                     else:
                         # Accept the data product and store for later use.
                         self._requires[jj] = product
+                        self._requires_fingerprints[jj] = product_fingerprint
             for jj, in_key in enumerate(self._in_keys):
                 if in_key == key:
                     msg = "%s queue data product with key %s for 'in'."
@@ -997,6 +1444,7 @@ class TaskBase(object):
                     else:
                         # Accept the data product and store for later use.
                         self._in[jj].put(product)
+                        self._in_fingerprints[jj].put(product_fingerprint)
 
 
 class DoNothing(TaskBase):
@@ -1149,15 +1597,100 @@ class OneAndOne(TaskBase):
         if self.stop_iteration():
             raise PipelineStopIteration()
 
+        cache_key = self._cache_key()
+        cache_files = self._cache_output_files()
+        if cache_key is not None and self.cacheable and self._result_cache.lookup(cache_key, cache_files):
+            if mpiutil.rank0:
+                msg = "%s reusing cached output from files:" % self.__class__.__name__
+                for output_file in cache_files:
+                    msg += '\n\t%s' % output_file
+                logger.info(msg)
+            with self._profile_io('read'):
+                output = self.read_output(cache_files)
+        elif self._worker_pool is not None:
+            # read the lazily loaded data of the input here, so the worker
+            # process does not read through the inherited file handles
+            if hasattr(input, 'load_lazy'):
+                input.load_lazy()
+            # run in a worker process as the output is not needed
+            self._worker_pool.submit(self, self._copy_cast_process, input)
+            output = None
+        else:
+            output = self._copy_cast_process(input)
+
+            if cache_key is not None and self.cacheable and output is not None:
+                self._result_cache.store(cache_key, self, cache_files)
+
+        self._output_fingerprint = cache_key
+        self._iter_cnt += 1
+
+        return output
+
+    def checkpoint_state(self, checkpoint_dir):
+        state = super(OneAndOne, self).checkpoint_state(checkpoint_dir)
+        state.update({
+                       'iter_cnt': self._iter_cnt,
+                       'iter_stop': self._iter_stop,
+                       'cache_chain': getattr(self, '_cache_chain', None),
+                     })
+        return state
+
+    def restore_state(self, state):
+        super(OneAndOne, self).restore_state(state)
+        self._iter_cnt = state['iter_cnt']
+        self._iter_stop = state['iter_stop']
+        if state['cache_chain'] is not None:
+            self._cache_chain = state['cache_chain']
+
+    def _copy_cast_process(self, input):
+        ### prepare the input and process it
         if input:
             if self.params['copy']:
                 input = self.copy_input(input)
             input = self.cast_input(input)
-        output = self.read_process_write(input)
 
-        self._iter_cnt += 1
+        return self.read_process_write(input)
 
-        return output
+    def _cache_key(self):
+        ### key of the result of the current iteration in the result cache,
+        ### None if the result cache is disabled or any input is unknown
+        if self._result_cache is None:
+            return None
+
+        if self._no_input or len(self._in_keys) > 0:
+            inputs = list(self._input_fingerprints)
+        else:
+            # input from files
+            inputs = [ ResultCache.file_fingerprint(input_file) for input_file in self._cache_input_files() ] + self._requires_fingerprints
+        if None in inputs:
+            return None
+
+        key = self._result_cache.task_key(self, inputs + [self.iteration, self._iter_cnt])
+        if not self.cacheable:
+            # the output of a task that is not cacheable may depend on its
+            # previous iterations, so chain the keys of all iterations
+            key = hashlib.sha1(getattr(self, '_cache_chain', '') + key).hexdigest()
+            self._cache_chain = key
+
+        return key
+
+    def _cache_input_files(self):
+        """Input files that are read in the current iteration.
+
+        Override if :attr:`input_files` is not the actual input files.
+
+        """
+
+        return self.input_files
+
+    def _cache_output_files(self):
+        """Output files that are written in the current iteration.
+
+        Override if :attr:`output_files` is not the actual output files.
+
+        """
+
+        return self.output_files
 
     def read_process_write(self, input):
         """Reads input, executes any processing and writes output."""
@@ -1176,7 +1709,8 @@ class OneAndOne(TaskBase):
                     msg += '\n\t%s' % input_file
                 logger.info(msg)
             mpiutil.barrier()
-            input = self.read_input()
+            with self._profile_io('read'):
+                input = self.read_input()
 
         # Analyze.
         if self._no_input:
@@ -1206,10 +1740,18 @@ class OneAndOne(TaskBase):
 
             mpiutil.barrier()
 
-            self.write_output(output)
+            with self._profile_io('write'):
+                self.write_output(output)
 
         return output
 
+    def _profile_io(self, kind):
+        ### context to count the bytes read or written if profiling
+        if self._profiler is None:
+            return _null_context()
+        else:
+            return self._profiler.io(kind)
+
     def read_input(self):
         """Override to implement reading inputs from disk."""
 
@@ -1229,7 +1771,7 @@ class OneAndOne(TaskBase):
     def read_output(self, filenames):
         """Override to implement reading outputs from disk.
 
-        Used for result caching.
+        Used for result caching, see :attr:`~TaskBase.cacheable`.
 
         """
 
@@ -1299,6 +1841,82 @@ def format_list(val):
         return val
 
 
+def _pipeline_iterations(tasks):
+    ### the numbers of `next()` iterations of all tasks if the pipeline is in
+    ### a consistent state for checkpointing, i.e., all tasks have run
+    ### `setup()` and no data product is waiting in the queues, else None
+    iters = []
+    for task in tasks:
+        if task._pipeline_state == 'setup':
+            return None
+        if task._in is not None and not all(in_.empty() for in_ in task._in):
+            return None
+        iters.append((task._pipeline_state, task._next_cnt))
+
+    return iters
+
+
+def _file_key(filename):
+    ### the key of a file in the dependency graph of tasks
+    return ('file', filename)
+
+
+def _is_file_key(key):
+    ### whether `key` is the key of a file in the dependency graph of tasks
+    return isinstance(key, tuple) and len(key) == 2 and key[0] == 'file'
+
+
+def _task_files(task, name):
+    ### the (normalized) `input_files` or `output_files` of task, if any
+    files = getattr(task, name, None)
+    if not files:
+        return []
+    return list(files)
+
+
+def _task_graph(tasks):
+    ### dependency graph of tasks, return the dicts of the key of a data
+    ### product or a file to the list of the tasks that produce and consume it,
+    ### a task consumes the files it reads and produces the files it writes
+    producers = collections.defaultdict(list)
+    consumers = collections.defaultdict(list)
+    for task in tasks:
+        for key in task._out_keys:
+            producers[key].append(task)
+        for key in task._requires_keys + task._in_keys:
+            consumers[key].append(task)
+        for fl in _task_files(task, 'output_files'):
+            producers[_file_key(fl)].append(task)
+        for fl in _task_files(task, 'input_files'):
+            consumers[_file_key(fl)].append(task)
+
+    return dict(producers), dict(consumers)
+
+
+@contextlib.contextmanager
+def _null_context():
+    ### a context that does nothing
+    yield
+
+
+def _hash_update(sha, val):
+    ### update the hash object sha by the content of val
+    if isinstance(val, np.ndarray):
+        sha.update('ndarray%s%s' % (val.dtype.str, val.shape))
+        sha.update(np.ascontiguousarray(val).tostring())
+    elif isinstance(val, (list, tuple)):
+        sha.update('%s%d' % (type(val).__name__, len(val)))
+        for v in val:
+            _hash_update(sha, v)
+    elif isinstance(val, dict):
+        sha.update('dict%d' % len(val))
+        for k in sorted(val.keys()):
+            _hash_update(sha, k)
+            _hash_update(sha, val[k])
+    else:
+        sha.update('%s:%r' % (type(val).__name__, val))
+
+
 def _import_class(class_path):
     """Import class dynamically from a string."""
     path_split = class_path.split('.')
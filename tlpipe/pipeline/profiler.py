@@ -0,0 +1,233 @@
+"""Profiling of pipeline tasks.
+
+A :class:`Profiler` records the resource usage of each executed stage
+(:meth:`~tlpipe.pipeline.pipeline.TaskBase.setup`, each iteration of
+:meth:`~tlpipe.pipeline.pipeline.TaskBase.next` and
+:meth:`~tlpipe.pipeline.pipeline.TaskBase.finish`) of each pipeline task on
+each process, which includes
+
+wall_time
+    Wall clock time in seconds.
+cpu_time
+    User and system CPU time in seconds of the process.
+peak_rss
+    Peak resident set size in bytes of the process during the stage if the
+    peak can be reset (Linux only), or the peak since the process started.
+read_bytes, write_bytes
+    Bytes read by :meth:`~tlpipe.pipeline.pipeline.OneAndOne.read_input`
+    and written by :meth:`~tlpipe.pipeline.pipeline.OneAndOne.write_output`,
+    as counted by the kernel in `/proc/self/io` (-1 if not available).
+barrier_wait
+    Time in seconds spent waiting in :func:`caput.mpiutil.barrier`,
+    including a barrier at the end of the stage, so it measures the load
+    imbalance between processes.
+
+The records of all processes are gathered and written to a JSON file and a
+CSV file. The JSON file also contains a summary of each task (identified by
+its prefix), with the wall time and barrier wait time being the maximum over
+processes of the sum over stages, the CPU time and bytes read and written
+being the sum over both, and the peak RSS being the maximum over both.
+
+"""
+
+import os
+import time
+import json
+import csv
+import resource
+import contextlib
+
+from caput import mpiutil
+
+
+def _proc_io():
+    ### bytes read and written by the process, None if not available
+    try:
+        with open('/proc/self/io', 'r') as f:
+            io = dict(line.split(':') for line in f)
+        return int(io['rchar']), int(io['wchar'])
+    except (IOError, KeyError, ValueError):
+        return None
+
+def _reset_peak_rss():
+    ### reset the peak RSS of the process, return True if succeed
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except IOError:
+        return False
+
+def _peak_rss():
+    ### peak RSS of the process in bytes
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return 1024 * int(line.split()[1]) # in kB
+    except (IOError, ValueError, IndexError):
+        pass
+
+    # in kB on Linux
+    return 1024 * resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def _cpu_time():
+    ### user and system CPU time of the process
+    t = os.times()
+    return t[0] + t[1]
+
+
+class Profiler(object):
+    """Record the resource usage of pipeline task stages."""
+
+    fields = [ 'rank', 'task', 'prefix', 'stage', 'iteration', 'wall_time', 'cpu_time', 'peak_rss', 'read_bytes', 'write_bytes', 'barrier_wait' ]
+
+    def __init__(self):
+
+        self.records = []
+        self._current = None
+        self._current_task = None
+        self._iterations = {}
+        self._barrier = None
+
+    def install(self):
+        """Start to time the waiting in :func:`caput.mpiutil.barrier`."""
+
+        if self._barrier is not None:
+            return
+
+        self._barrier = mpiutil.barrier
+        barrier = self._barrier
+        def timed_barrier(*args, **kwargs):
+            t0 = time.time()
+            barrier(*args, **kwargs)
+            if self._current is not None:
+                self._current['barrier_wait'] += time.time() - t0
+
+        mpiutil.barrier = timed_barrier
+
+    def uninstall(self):
+        """Stop timing the waiting in :func:`caput.mpiutil.barrier`."""
+
+        if self._barrier is not None:
+            mpiutil.barrier = self._barrier
+            self._barrier = None
+
+    def start(self, task, stage):
+        """Start to record a `stage` of `task`."""
+
+        if stage == 'next':
+            iteration = self._iterations.get(id(task), 0)
+            self._iterations[id(task)] = iteration + 1
+        else:
+            iteration = None
+        self._current_task = id(task)
+
+        has_io = _proc_io() is not None
+        _reset_peak_rss()
+        self._current = {
+                          'rank': mpiutil.rank,
+                          'task': task.__class__.__name__,
+                          'prefix': task.prefix,
+                          'stage': stage,
+                          'iteration': iteration,
+                          'wall_time': time.time(),
+                          'cpu_time': _cpu_time(),
+                          'peak_rss': 0,
+                          'read_bytes': 0 if has_io else -1,
+                          'write_bytes': 0 if has_io else -1,
+                          'barrier_wait': 0.0,
+                        }
+
+    def stop(self):
+        """Stop and save the current record."""
+
+        if self._current is None:
+            return
+
+        # wait for all processes to finish this stage
+        mpiutil.barrier()
+
+        record = self._current
+        record['wall_time'] = time.time() - record['wall_time']
+        record['cpu_time'] = _cpu_time() - record['cpu_time']
+        record['peak_rss'] = _peak_rss()
+        self.records.append(record)
+        self._current = None
+
+    def discard(self):
+        """Discard the current record as the stage is not executed."""
+
+        if self._current is not None and self._current['stage'] == 'next':
+            self._iterations[self._current_task] -= 1
+        self._current = None
+
+    @contextlib.contextmanager
+    def io(self, kind):
+        """Context to count the bytes read (`kind` = 'read') or written (`kind` = 'write')."""
+
+        io0 = _proc_io()
+        try:
+            yield
+        finally:
+            io1 = _proc_io()
+            if self._current is not None and io0 is not None and io1 is not None:
+                if kind == 'read':
+                    self._current['read_bytes'] += io1[0] - io0[0]
+                else:
+                    self._current['write_bytes'] += io1[1] - io0[1]
+
+    @staticmethod
+    def _summary(records):
+        ### summary of each task
+        summary = {}
+        for rec in records:
+            prefix = rec['prefix']
+            if not prefix in summary:
+                summary[prefix] = { 'task': rec['task'], 'iterations': 0, 'cpu_time': 0.0, 'peak_rss': 0, 'read_bytes': 0, 'write_bytes': 0, 'wall_time': {}, 'barrier_wait': {} }
+            task = summary[prefix]
+            if rec['stage'] == 'next' and rec['rank'] == 0:
+                task['iterations'] += 1
+            task['cpu_time'] += rec['cpu_time']
+            task['peak_rss'] = max(task['peak_rss'], rec['peak_rss'])
+            for key in ('read_bytes', 'write_bytes'):
+                task[key] = -1 if rec[key] < 0 else task[key] + rec[key]
+            # sum over stages for each rank
+            for key in ('wall_time', 'barrier_wait'):
+                task[key][rec['rank']] = task[key].get(rec['rank'], 0.0) + rec[key]
+
+        for task in summary.values():
+            for key in ('wall_time', 'barrier_wait'):
+                task[key] = max(task[key].values())
+
+        return summary
+
+    def write(self, filename, **kwargs):
+        """Gather the records of all processes and write them to files.
+
+        The records are written to `filename`.json, together with the extra
+        items given in `kwargs`, and to `filename`.csv.
+
+        """
+
+        if mpiutil.size > 1:
+            records = mpiutil.world.gather(self.records, root=0)
+        else:
+            records = [ self.records ]
+
+        if mpiutil.rank0:
+            records = sum(records, [])
+
+            report = dict(kwargs)
+            report['nproc'] = mpiutil.size
+            report['tasks'] = self._summary(records)
+            report['records'] = records
+            with open(filename + '.json', 'w') as f:
+                json.dump(report, f, indent=1)
+
+            with open(filename + '.csv', 'w') as f:
+                writer = csv.DictWriter(f, self.fields)
+                writer.writeheader()
+                writer.writerows(records)
+
+        mpiutil.barrier()
@@ -10,6 +10,7 @@ Inheritance diagram
 
 import local_fit
 import numpy as np
+import running_median
 
 
 class LocalMedianFit(local_fit.LocalFitMethod):
@@ -18,8 +19,24 @@ class LocalMedianFit(local_fit.LocalFitMethod):
     In this method, the background value is caculated by the local median of a
     sliding window of size :math:`N \\times M` around each data value.
 
+    For real valued data, the local medians of all data values are computed
+    in a single pass by a sorted sliding window (see
+    :mod:`~tlpipe.rfi.running_median`), which gives the same result as
+    computing the median of each window separately.
+
     """
 
+    def fit(self):
+        """Fit the background."""
+
+        vis = self.vis
+        if np.isrealobj(vis) and np.issubdtype(vis.dtype, np.floating) and np.isfinite(vis[np.logical_not(self.vis_mask)]).all():
+            self._background[:] = running_median.running_median(vis, self.vis_mask, (self._vsize, self._hsize))
+            return self._background
+        else:
+            # fall back to compute the median of each window
+            return super(LocalMedianFit, self).fit()
+
     def _calculate(self, x, y, start_x, end_x, start_y, end_y):
 
         vis = np.ma.array(self.vis[start_y:end_y, start_x:end_x], mask=self.vis_mask[start_y:end_y, start_x:end_x])
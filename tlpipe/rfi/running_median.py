@@ -0,0 +1,159 @@
+"""Masked running median.
+
+The median of a sliding window of a 1-D or 2-D masked array is computed by
+keeping the unmasked values of the window in a sorted list, which is updated
+incrementally by inserting the values entering the window and removing the
+values leaving it with binary search, instead of sorting the whole window
+again for each data value. The 2-D window is moved along a serpentine path,
+so it only gains and loses one column (or one row at the end of each row) of
+values at each step.
+
+The window around the data value at index :math:`i` along an axis covers the
+indices :math:`\\max(0, i - s) \\le j < \\min(n, i + s)`, where :math:`s` is
+the half window size along that axis, which is the window used by
+:class:`~tlpipe.rfi.local_fit.LocalFitMethod`. The median of an even number
+of values is the mean of the two middle values, the same as
+:func:`numpy.ma.median`.
+
+"""
+
+import bisect
+import numpy as np
+
+
+class SortedWindow(object):
+    """A sorted list of the values in a sliding window."""
+
+    def __init__(self, dtype=np.float64):
+        self._values = []
+        self._type = np.dtype(dtype).type
+
+    def __len__(self):
+        return len(self._values)
+
+    def add(self, value):
+        """Insert `value` into the window."""
+        bisect.insort(self._values, value)
+
+    def remove(self, value):
+        """Remove one occurrence of `value` from the window."""
+        del self._values[bisect.bisect_left(self._values, value)]
+
+    def median(self):
+        """Median of the values in the window, None if the window is empty."""
+        n = len(self._values)
+        if n == 0:
+            return None
+        h = n / 2
+        if n % 2 == 1:
+            return self._values[h]
+        else:
+            # sum in the data type, the same as np.ma.median
+            return (self._type(self._values[h-1]) + self._type(self._values[h])) / self._type(2)
+
+
+def _window(i, size, n):
+    ### index range of the window around i
+    return max(0, i-size), min(n, i+size)
+
+def _update(window, vals, mask, rows, cols, add):
+    ### add or remove the unmasked values of the block vals[rows, cols]
+    op = window.add if add else window.remove
+    for ri in xrange(*rows):
+        vr = vals[ri]
+        mr = mask[ri]
+        for ci in xrange(*cols):
+            if not mr[ci]:
+                op(vr[ci])
+
+def _move(window, vals, mask, old, new, fixed, along_rows):
+    ### move the window range along one axis from old to new, with the range
+    ### along the other axis being fixed
+    if along_rows:
+        block = lambda r: (r, fixed)
+    else:
+        block = lambda r: (fixed, r)
+
+    # remove the part of old not in new
+    for r in [(old[0], min(old[1], new[0])), (max(old[0], new[1]), old[1])]:
+        if r[0] < r[1]:
+            _update(window, vals, mask, *block(r), add=False)
+    # add the part of new not in old
+    for r in [(new[0], min(new[1], old[0])), (max(new[0], old[1]), new[1])]:
+        if r[0] < r[1]:
+            _update(window, vals, mask, *block(r), add=True)
+
+
+def running_median(data, mask=None, size=1):
+    """Compute the masked running median of a 1-D or 2-D array.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        1-D or 2-D array of real values.
+    mask : np.ndarray of bool, optional
+        Mask of `data`, masked values are excluded from the median. If None,
+        the non-finite values of `data` are masked.
+    size : integer or tuple of integers, optional
+        Half window size, one for each axis of `data`. Default 1.
+
+    Returns
+    -------
+    median : np.ndarray
+        The running median. The data values whose windows contain no
+        unmasked value are kept unchanged.
+
+    """
+
+    data = np.asarray(data)
+    if data.ndim not in (1, 2):
+        raise ValueError('Only 1-D or 2-D array is supported')
+    if np.iscomplexobj(data):
+        raise ValueError('Complex data is not supported')
+
+    if mask is None:
+        mask = np.logical_not(np.isfinite(data))
+    else:
+        mask = np.asarray(mask, dtype=bool)
+        if mask.shape != data.shape:
+            raise ValueError('Shape of mask %s does not match shape of data %s' % (mask.shape, data.shape))
+        if not np.isfinite(data[np.logical_not(mask)]).all():
+            raise ValueError('Unmasked data contains non-finite values')
+
+    if isinstance(size, (int, long)):
+        size = (size,) * data.ndim
+    if len(size) != data.ndim:
+        raise ValueError('Invalid window size %s for %d-D data' % (size, data.ndim))
+
+    if data.ndim == 1:
+        # a 2-D array with a single row
+        median = running_median(data.reshape(1, -1), mask.reshape(1, -1), (1, size[0]))
+        return median.reshape(data.shape)
+
+    height, width = data.shape
+    vsize, hsize = size
+    median = data.copy()
+
+    # python lists are much faster than np.ndarray to index element-wise
+    vals = data.tolist()
+    mask = mask.tolist()
+    window = SortedWindow(data.dtype)
+
+    rows = (0, 0)
+    cols = _window(0, hsize, width)
+    for y in xrange(height):
+        new_rows = _window(y, vsize, height)
+        _move(window, vals, mask, rows, new_rows, cols, along_rows=True)
+        rows = new_rows
+        # go along the row forward and backward in turn
+        xs = xrange(width) if y % 2 == 0 else xrange(width-1, -1, -1)
+        for x in xs:
+            new_cols = _window(x, hsize, width)
+            if new_cols != cols:
+                _move(window, vals, mask, cols, new_cols, rows, along_rows=False)
+                cols = new_cols
+            med = window.median()
+            if med is not None:
+                median[y, x] = med
+
+    return median
@@ -27,59 +27,80 @@ algorithm for improving radio-frequency interference detection*.
 import numpy as np
 
 
-def sir1d(mask, eta):
+def sir(mask, eta, axis=-1):
+    """Apply the SIR operator along `axis` of `mask` for all the other axes at once.
+
+    This uses the linear time algorithm of Offringa et al., 2012: with
+    :math:`M(x) = \\sum_{y=0}^{x-1} \\omega(y)`, where :math:`\\omega(y)` is
+    :math:`\\eta` for flagged samples and :math:`\\eta - 1` for unflagged
+    samples, sample :math:`x` is flagged if and only if
+    :math:`\\max_{y > x} M(y) \\ge \\min_{y \\le x} M(y)`, where the running
+    minimum and the reversed running maximum are both computed in one pass.
+
+    Parameters
+    ----------
+    mask : np.ndarray of bool
+        The input mask, it will not be changed.
+    eta : float
+        The aggressiveness of the operator, :math:`0 \\le \\eta \\le 1`.
+    axis : integer, optional
+        Axis along which to apply the operator. Default -1.
+
+    Returns
+    -------
+    mask : np.ndarray of bool
+        The new mask.
 
-    if eta <= 0 or mask.all():
-        return mask
+    """
+
+    mask = np.asarray(mask, dtype=bool)
+
+    if eta <= 0:
+        return mask.copy()
 
     if eta >= 1:
         return np.ones_like(mask)
 
-    size = len(mask)
-
     # make an array in which flagged samples are eta and unflagged samples are eta-1,
     vals = np.where(mask, eta, eta-1.0)
     # make an array M(x) = \\sum_{y=0}^{x-1} vals[y]
-    M = np.zeros(size+1, dtype=vals.dtype)
-    M[1:] = np.cumsum(vals)
+    M = np.cumsum(np.rollaxis(vals, axis), axis=0)
+    M = np.concatenate([np.zeros((1,)+M.shape[1:], dtype=M.dtype), M], axis=0)
 
-    # check mask condition
-    for i in xrange(0, size):
-        if np.max(M[i+1:]) >= np.min(M[:i+1]):
-            mask[i] = True
-        else:
-            mask[i] = False
+    # min(M[:i+1]) and max(M[i+1:]) for all i
+    pre_min = np.minimum.accumulate(M[:-1], axis=0)
+    post_max = np.maximum.accumulate(M[:0:-1], axis=0)[::-1]
 
-    return mask
+    return np.rollaxis(post_max >= pre_min, 0, axis % mask.ndim + 1)
 
 
+def sir1d(mask, eta):
 
-def horizontal_sir(mask, eta, overwrite=True):
+    mask[:] = sir(mask, eta)
+
+    return mask
 
-    height, width = mask.shape
+
+def horizontal_sir(mask, eta, overwrite=True):
 
     if overwrite:
         mask1 = mask
     else:
         mask1 = mask.copy()
 
-    for ri in xrange(height):
-        mask1[ri] = sir1d(mask1[ri], eta)
+    mask1[:] = sir(mask1, eta, axis=1)
 
     return mask1
 
 
 def vertical_sir(mask, eta, overwrite=True):
 
-    height, width = mask.shape
-
     if overwrite:
         mask1 = mask
     else:
         mask1 = mask.copy()
 
-    for ci in xrange(width):
-        mask1[:, ci] = sir1d(mask1[:, ci], eta)
+    mask1[:] = sir(mask1, eta, axis=0)
 
     return mask1
 
@@ -9,15 +9,54 @@ Inheritance diagram
 """
 
 import numpy as np
+import scipy.ndimage as ndimage
 import combinatorial_threshold
 
 
+def _window_sum(a, length, axis):
+    ### sums of all windows of `length` consecutive elements along `axis`,
+    ### computed from the cumulative sum, the result has a length of
+    ### a.shape[axis] - length + 1 along `axis`
+    cs = np.cumsum(a, axis=axis)
+    shp = list(cs.shape)
+    shp[axis] = 1
+    cs = np.concatenate([np.zeros(shp, dtype=cs.dtype), cs], axis=axis)
+    n = cs.shape[axis]
+    return cs.take(xrange(length, n), axis=axis) - cs.take(xrange(0, n-length), axis=axis)
+
+def _sum_threshold(vis, vis_mask, length, threshold, axis):
+    ### one SumThreshold pass of window `length` along `axis` for all the other
+    ### axis at once, return the new mask
+    if length == 1:
+        return np.logical_or(vis_mask, np.abs(vis) > threshold)
+
+    # masked samples contribute neither to the sum nor to the count
+    sm = _window_sum(np.where(vis_mask, 0, vis).astype(np.float64), length, axis)
+    cnt = _window_sum(np.logical_not(vis_mask).astype(np.int64), length, axis)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        exceed = np.logical_and(cnt > 0, np.abs(sm / np.where(cnt > 0, cnt, 1)) > threshold)
+
+    # a sample is flagged if it is in any window that exceeds the threshold,
+    # i.e., if any of the windows starting in [x-length+1, x] exceeds
+    pad = [(0, 0)] * vis.ndim
+    pad[axis] = (length - 1, length - 1)
+    covered = _window_sum(np.pad(exceed.astype(np.int64), pad, mode='constant'), length, axis)
+
+    return np.logical_or(vis_mask, covered > 0)
+
+
 class SumThreshold(combinatorial_threshold.CombinatorialThreshold):
     """The SumThreshold method.
 
     For more details, see Offringa et al., 2000, MNRAS, 405, 155,
     *Post-correlation radio frequency interference classification methods*.
 
+    Each threshold pass evaluates all windows of a given length over the whole
+    time-frequency plane at once by using cumulative sums of the unmasked
+    samples. If `min_connected` > 1, flagged regions (4-connected) that
+    contain less than `min_connected` samples will be unflagged after
+    thresholding, except those samples that have been masked in the input.
+
     """
 
     def __init__(self, time_freq_vis, time_freq_vis_mask=None, first_threshold=6.0, exp_factor=1.5, distribution='Rayleigh', max_threshold_length=1024, min_connected=1):
@@ -25,6 +64,7 @@ class SumThreshold(combinatorial_threshold.CombinatorialThreshold):
         super(SumThreshold, self).__init__(time_freq_vis, time_freq_vis_mask, first_threshold, exp_factor, distribution, max_threshold_length)
 
         self.min_connected = max(1, int(min_connected))
+        self._input_mask = self.vis_mask.copy()
 
 
     def horizontal_sum_threshold(self, length, threshold):
@@ -34,48 +74,7 @@ class SumThreshold(combinatorial_threshold.CombinatorialThreshold):
         if length > width:
             return
 
-        if length == 1:
-            for y in xrange(height):
-
-                # if all have been masked, continue
-                if self.vis_mask[y].all():
-                    continue
-
-                for x in xrange(width):
-                    if (not self.vis_mask[y, x]) and (np.abs(self.vis[y, x]) > threshold):
-                        self.vis_mask[y, x] = True
-        elif length > 1:
-            tmp_mask = self.vis_mask.copy()
-            for y in xrange(height):
-
-                # if all have been masked, continue
-                if self.vis_mask[y].all():
-                    continue
-
-                sm, cnt, left, right = 0, 0, 0, 0
-                for right in xrange(length-1):
-                    if not self.vis_mask[y, right]:
-                        sm += self.vis[y, right]
-                        cnt += 1
-
-                while(right < width):
-                    # add the sample at the right
-                    if not self.vis_mask[y, right]:
-                        sm += self.vis[y, right]
-                        cnt += 1
-                    # check
-                    if (cnt > 0) and (np.abs(sm / cnt) > threshold):
-                        tmp_mask[y, left:left+length] = True
-                    # subtract the sample at the left
-                    if not self.vis_mask[y, left]:
-                        sm -= self.vis[y, left]
-                        cnt -= 1
-
-                    left += 1
-                    right += 1
-
-            # set to the new mask
-            self.vis_mask[:] = tmp_mask
+        self.vis_mask[:] = _sum_threshold(self.vis, self.vis_mask, length, threshold, axis=1)
 
     def vertical_sum_threshold(self, length, threshold):
 
@@ -84,48 +83,21 @@ class SumThreshold(combinatorial_threshold.CombinatorialThreshold):
         if length > height:
             return
 
-        if length == 1:
-            for x in xrange(width):
-
-                # if all have been masked, continue
-                if self.vis_mask[:, x].all():
-                    continue
-
-                for y in xrange(height):
-                    if (not self.vis_mask[y, x]) and (np.abs(self.vis[y, x]) > threshold):
-                        self.vis_mask[y, x] = True
-        elif length > 1:
-            tmp_mask = self.vis_mask.copy()
-            for x in xrange(width):
-
-                # if all have been masked, continue
-                if self.vis_mask[:, x].all():
-                    continue
-
-                sm, cnt, top, bottom = 0, 0, 0, 0
-                for bottom in xrange(length-1):
-                    if not self.vis_mask[bottom, x]:
-                        sm += self.vis[bottom, x]
-                        cnt += 1
-
-                while(bottom < height):
-                    # add the sample at the bottom
-                    if not self.vis_mask[bottom, x]:
-                        sm += self.vis[bottom, x]
-                        cnt += 1
-                    # check
-                    if (cnt > 0) and (np.abs(sm / cnt) > threshold):
-                        tmp_mask[top:top+length, x] = True
-                    # subtract the sample at the top
-                    if not self.vis_mask[top, x]:
-                        sm -= self.vis[top, x]
-                        cnt -= 1
-
-                    top += 1
-                    bottom += 1
-
-            # set to the new mask
-            self.vis_mask[:] = tmp_mask
+        self.vis_mask[:] = _sum_threshold(self.vis, self.vis_mask, length, threshold, axis=0)
+
+    def filter_connected_samples(self):
+        """Unflag the flagged regions that have less than `min_connected` samples.
+
+        Samples that have been masked in the input will not be unflagged.
+        """
+
+        labels, num = ndimage.label(self.vis_mask)
+        if num == 0:
+            return
+        sizes = np.bincount(labels.ravel())
+        small = sizes < self.min_connected
+        small[0] = False # label 0 is the unflagged background
+        self.vis_mask[:] = np.where(small[labels], self._input_mask, self.vis_mask)
 
     def execute_threshold(self, factor):
         for length, threshold in zip(self.lengths, self.thresholds):
@@ -137,5 +109,4 @@ class SumThreshold(combinatorial_threshold.CombinatorialThreshold):
         super(SumThreshold, self).execute(sensitivity)
 
         if self.min_connected > 1:
-            # self.filter_connected_samples()
-            raise NotImplementedError
+            self.filter_connected_samples()
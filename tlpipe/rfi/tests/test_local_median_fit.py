@@ -0,0 +1,50 @@
+import numpy as np
+
+from tlpipe.rfi import running_median
+from tlpipe.rfi.local_median_fit import LocalMedianFit
+
+
+def _per_window(lmf):
+    # the background computed by the median of each window separately
+    height, width = lmf.vis.shape
+    background = np.zeros_like(lmf.vis)
+    for y in xrange(height):
+        for x in xrange(width):
+            background[y, x] = lmf.calculate_background(x, y)
+
+    return background
+
+
+def test_running_median():
+
+    np.random.seed(0)
+    for shape, tsize, fsize in [ ((13, 17), 3, 4), ((8, 30), 2, 5), ((20, 6), 4, 2) ]:
+        vis = np.random.randn(*shape)
+        # repeated values and a fully masked region
+        vis[::3, ::2] = 0.5
+        vis_mask = np.random.rand(*shape) < 0.3
+        vis_mask[:5, :5] = True
+        lmf = LocalMedianFit(vis, vis_mask, tsize, fsize)
+
+        median = running_median.running_median(vis, vis_mask, (lmf._vsize, lmf._hsize))
+        assert np.array_equal(median, _per_window(lmf))
+
+
+def test_fit_non_finite():
+
+    np.random.seed(1)
+    vis = np.random.randn(10, 12)
+    vis[2, 3] = np.inf
+    vis[6, 7] = -np.inf
+    vis[4, 4] = np.nan
+    vis_mask = np.random.rand(*vis.shape) < 0.2
+    vis_mask[4, 4] = True
+
+    # the unmasked infinite values take the per-window path
+    lmf = LocalMedianFit(vis, vis_mask, 2, 3)
+    assert np.array_equal(lmf.fit(), _per_window(lmf))
+
+    # and the fast path is used when they are masked
+    vis_mask[2, 3] = vis_mask[6, 7] = True
+    lmf = LocalMedianFit(vis, vis_mask, 2, 3)
+    assert np.array_equal(lmf.fit(), _per_window(lmf))
@@ -0,0 +1,47 @@
+import numpy as np
+
+from tlpipe.rfi import sir_operator
+
+
+def _sir_loop(mask, eta):
+    # flag all samples of the intervals [y1, y2) in which at least
+    # (1 - eta) of the samples are flagged, by the definition
+    n = len(mask)
+    new_mask = mask.copy()
+    for y1 in xrange(n):
+        for y2 in xrange(y1+1, n+1):
+            if mask[y1:y2].sum() >= (1.0 - eta) * (y2 - y1):
+                new_mask[y1:y2] = True
+
+    return new_mask
+
+
+def test_sir1d():
+
+    np.random.seed(0)
+    for eta in (0.0, 0.25, 0.375, 0.5, 1.0):
+        for n in (1, 2, 7, 30):
+            for frac in (0.1, 0.3, 0.6):
+                mask = np.random.rand(n) < frac
+                expect = _sir_loop(mask, eta)
+                assert np.array_equal(sir_operator.sir(mask, eta), expect)
+                assert np.array_equal(sir_operator.sir1d(mask.copy(), eta), expect)
+
+
+def test_sir2d():
+
+    np.random.seed(1)
+    mask = np.random.rand(9, 13) < 0.3
+    eta = 0.25
+
+    hmask = sir_operator.horizontal_sir(mask, eta, overwrite=False)
+    assert np.array_equal(hmask, np.array([ _sir_loop(row, eta) for row in mask ]))
+
+    vmask = sir_operator.vertical_sir(mask, eta, overwrite=False)
+    assert np.array_equal(vmask, np.array([ _sir_loop(col, eta) for col in mask.T ]).T)
+
+    # the input is changed in place only if overwrite
+    mask1 = mask.copy()
+    sir_operator.horizontal_sir(mask1, eta, overwrite=True)
+    assert np.array_equal(mask1, hmask)
+    assert not np.array_equal(mask, hmask)
@@ -0,0 +1,89 @@
+import numpy as np
+
+from tlpipe.rfi import sum_threshold
+from tlpipe.rfi.sum_threshold import SumThreshold
+
+
+def _sum_threshold_loop(vis, vis_mask, length, threshold, axis):
+    # one SumThreshold pass by the loop over all windows along `axis`, each
+    # window is thresholded by the mean of its unmasked samples
+    if axis == 0:
+        return _sum_threshold_loop(vis.T, vis_mask.T, length, threshold, 1).T
+
+    new_mask = vis_mask.copy()
+    for i in xrange(vis.shape[0]):
+        for st in xrange(vis.shape[1] - length + 1):
+            vals = vis[i, st:st+length][np.logical_not(vis_mask[i, st:st+length])]
+            if len(vals) > 0 and np.abs(vals.sum() / len(vals)) > threshold:
+                new_mask[i, st:st+length] = True
+
+    return new_mask
+
+
+def _data(shape, seed):
+    np.random.seed(seed)
+    vis = np.abs(np.random.randn(*shape) + 1.0J * np.random.randn(*shape))
+    # some RFI lines and spikes
+    vis[3, :] += 4.0
+    vis[:, 5] += 3.0
+    vis[np.random.rand(*shape) < 0.02] += 20.0
+    vis_mask = np.random.rand(*shape) < 0.1
+
+    return vis, vis_mask
+
+
+def test_sum_threshold_pass():
+
+    vis, vis_mask = _data((24, 31), 0)
+    for axis in (0, 1):
+        for length, threshold in [ (1, 3.0), (2, 2.5), (3, 2.0), (8, 1.8), (24, 1.5) ]:
+            mask = sum_threshold._sum_threshold(vis, vis_mask, length, threshold, axis)
+            assert np.array_equal(mask, _sum_threshold_loop(vis, vis_mask, length, threshold, axis))
+
+
+def test_execute_threshold():
+
+    vis, vis_mask = _data((20, 40), 1)
+    st = SumThreshold(vis, vis_mask, distribution='Uniform', max_threshold_length=16)
+    st.execute_threshold(1.0)
+
+    # vertical passes first, then horizontal, each sees the mask of the previous one
+    height, width = vis.shape
+    mask = vis_mask.copy()
+    for axis, n in [ (0, height), (1, width) ]:
+        for length, threshold in zip(st.lengths, st.thresholds):
+            if length <= n:
+                mask = _sum_threshold_loop(vis, mask, length, threshold, axis)
+
+    assert np.array_equal(st.vis_mask, mask)
+
+
+def test_min_connected():
+
+    vis = np.zeros((12, 12))
+    vis_mask = np.zeros_like(vis, dtype=bool)
+    vis_mask[0, 0] = True # masked in the input
+    st = SumThreshold(vis, vis_mask, distribution='Uniform', min_connected=4)
+
+    st.vis_mask[5, 5] = True # a single sample
+    st.vis_mask[2, 8:10] = True # two samples
+    st.vis_mask[8, 2:6] = True # a line of 4 samples
+    st.vis_mask[9:11, 8:10] = True # a block of 4 samples
+    st.vis_mask[0, 1:3] = True # connected to the input masked sample
+    st.vis_mask[4, 0] = st.vis_mask[5, 1] = True # only diagonally connected
+    st.filter_connected_samples()
+
+    expect = np.zeros_like(vis_mask)
+    expect[0, 0] = True
+    expect[8, 2:6] = True
+    expect[9:11, 8:10] = True
+    assert np.array_equal(st.vis_mask, expect)
+
+    # execute flags and then filters
+    vis[6, 6] = 100.0
+    vis[2:5, 2:5] = 100.0
+    st = SumThreshold(vis, np.zeros_like(vis_mask), first_threshold=10.0, distribution='Uniform', min_connected=4)
+    st.execute()
+    expect = np.zeros_like(vis_mask)
+    expect[2:5, 2:5] = True
+    assert np.array_equal(st.vis_mask, expect)
@@ -34,8 +34,48 @@ class Accum(tod_task.TaskTimestream):
 
     prefix = 'ac_'
 
+    @property
+    def cacheable(self):
+        # the output depends on the previous iterations
+        return False
+
+    @property
+    def forkable(self):
+        # the state is changed in each iteration
+        return False
+
     def setup(self):
         self.data = None
+        # number of checkpoints saved
+        self._checkpoint_cnt = 0
+
+    def checkpoint_state(self, checkpoint_dir):
+        state = super(Accum, self).checkpoint_state(checkpoint_dir)
+        if self.data is None:
+            state['data_file'] = None
+        else:
+            # save the accumulated data, alternate between two files on each
+            # checkpoint (which may be saved without a new iteration of this
+            # task), so that the file of the last checkpoint is kept until
+            # this one is saved
+            data_file = '%s/%sdata_%d.hdf5' % (checkpoint_dir, self.prefix, self._checkpoint_cnt % 2)
+            self.data.to_files([data_file])
+            state['data_file'] = data_file
+        self._checkpoint_cnt += 1
+        state['checkpoint_cnt'] = self._checkpoint_cnt
+        return state
+
+    def restore_state(self, state):
+        super(Accum, self).restore_state(state)
+        self._checkpoint_cnt = state['checkpoint_cnt']
+        if state['data_file'] is None:
+            self.data = None
+        else:
+            self.data = Timestream([state['data_file']], 'r', 0, None, self.params['dist_axis'])
+            self.data.load_all()
+            # close the file to be overwritten by a later checkpoint
+            for fh in self.data.infiles:
+                fh.close()
 
     def process(self, ts):
 
@@ -58,10 +98,10 @@ class Accum(tod_task.TaskTimestream):
             # make they are distributed along the same axis
             ts.redistribute(self.data.main_data_dist_axis)
             # check for ra, dec
-            ra_self = self.data['ra_dec'].local_data[:, 0]
+            ra_self = self.data._local_array('ra_dec')[:, 0]
             if mpiutil.rank0 and ra_self[0] > ra_self[1]:
                 ra_self[0] -= 2*np.pi
-            ra_ts = ts['ra_dec'].local_data[:, 0]
+            ra_ts = ts._local_array('ra_dec')[:, 0]
             if mpiutil.rank0 and ra_ts[0] > ra_ts[1]:
                 ra_ts[0] -= 2*np.pi
 
@@ -79,7 +119,7 @@ class Accum(tod_task.TaskTimestream):
 
             ts.apply_mask(fill_val=0) # apply mask, fill 0 to masked values
             self.data.local_vis[:] += ts.local_vis # accumulate vis
-            self.data['weight'].local_data[:] += np.logical_not(ts.local_vis_mask).astype(np.int16) # update weight
+            self.data._local_array('weight')[:] += np.logical_not(ts.local_vis_mask).astype(np.int16) # update weight
             self.data.local_vis_mask[:] = np.where(self.data['weight'].local_data != 0, False, True) # update mask
 
 
@@ -23,6 +23,8 @@ class Average(tod_task.TaskTimestream):
 
     prefix = 'av_'
 
+    _cacheable = True
+
     def process(self, ts):
 
         if not 'weight' in ts.iterkeys():
@@ -31,6 +31,8 @@ class Detect(tod_task.TaskTimestream):
 
     prefix = 'bd_'
 
+    _cacheable = True
+
     def process(self, rt):
 
         assert isinstance(rt, RawTimestream), '%s only works for RawTimestream object currently' % self.__class__.__name__
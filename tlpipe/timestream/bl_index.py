@@ -0,0 +1,156 @@
+"""Index of the baselines of the baseline axis.
+
+A baseline is identified by the ordered pair of its two feeds (or channels)
+and optionally by its polarization. The main data holds only one of a
+baseline and its conjugate, e.g., (1, 2) but not (2, 1), so a lookup of a
+baseline gives its column in the baseline axis and whether the data in that
+column must be conjugated. The pairs are encoded to sorted integer keys, so
+looking up many baselines is a vectorized binary search instead of a linear
+search of the baseline list for each of them.
+
+"""
+
+import numpy as np
+
+
+class BaselineIndex(object):
+    """Index of the baselines of the baseline axis.
+
+    Parameters
+    ----------
+    pairs : (nbl, 2) array like
+        The feed (or channel) pair of each baseline, e.g., the blorder.
+    pol : None or (nbl,) array like, optional
+        The polarization code of each baseline, e.g., the bl_pol of a
+        :class:`~tlpipe.timestream.raw_timestream.RawTimestream`. Default None.
+    conj_pol : None or dict, optional
+        Maps a polarization code to the code of the conjugate baseline, e.g.,
+        the code of 'xy' to the code of 'yx'. Codes not in it are their own
+        conjugate. Default None.
+
+    """
+
+    def __init__(self, pairs, pol=None, conj_pol=None):
+
+        self.pairs = np.asarray(pairs).reshape(-1, 2)
+        self.nbl = self.pairs.shape[0]
+        self.pol = None if pol is None else np.asarray(pol).reshape(-1)
+        self.conj_pol = dict(conj_pol or {})
+
+        if self.pol is not None and len(self.pol) != self.nbl:
+            raise ValueError('Number of pol %d does not match number of baselines %d' % (len(self.pol), self.nbl))
+
+        # the distinct feeds and pols, to encode a baseline to an integer
+        self._feeds = np.unique(self.pairs)
+        if self.pol is None:
+            self._pols = np.zeros(1, dtype=int)
+        else:
+            self._pols = np.unique(np.concatenate([self.pol, self._conj(self.pol)]))
+
+        # keys of the baselines followed by the keys of their conjugates, a
+        # stable sort keeps a baseline before a conjugate of the same key,
+        # e.g., an auto-correlation, so it is found first
+        cols = np.arange(self.nbl)
+        if self.pol is None:
+            keys = np.concatenate([self._encode(self.pairs, None), self._encode(self.pairs[:, ::-1], None)])
+        else:
+            keys = np.concatenate([self._encode(self.pairs, self.pol), self._encode(self.pairs[:, ::-1], self._conj(self.pol))])
+        order = np.argsort(keys, kind='mergesort')
+        self._keys = keys[order]
+        self._cols = np.concatenate([cols, cols])[order]
+        self._conjs = np.concatenate([np.zeros(self.nbl, dtype=bool), np.ones(self.nbl, dtype=bool)])[order]
+
+    def __len__(self):
+        return self.nbl
+
+    def _conj(self, pol):
+        ### the pol codes of the conjugate baselines
+        return np.array([ self.conj_pol.get(p, p) for p in pol.tolist() ], dtype=pol.dtype)
+
+    def _dense(self, vals, table):
+        ### positions of vals in the sorted table, -1 if not in it
+        vals = np.asarray(vals)
+        if len(table) == 0:
+            return -np.ones(vals.shape, dtype=int)
+        inds = np.searchsorted(table, vals)
+        inds = np.minimum(inds, len(table) - 1)
+        return np.where(table[inds] == vals, inds, -1)
+
+    def _encode(self, pairs, pol):
+        ### integer keys of baselines, -1 for those of unknown feeds or pol
+        pairs = np.asarray(pairs).reshape(-1, 2)
+        nfeed, npol = len(self._feeds), len(self._pols)
+        i1 = self._dense(pairs[:, 0], self._feeds)
+        i2 = self._dense(pairs[:, 1], self._feeds)
+        if pol is None:
+            ip = np.zeros(len(pairs), dtype=int)
+        else:
+            ip = self._dense(np.broadcast_to(pol, (len(pairs),)), self._pols)
+        keys = (i1.astype(np.int64) * nfeed + i2) * npol + ip
+
+        return np.where((i1 < 0) | (i2 < 0) | (ip < 0), -1, keys)
+
+    def find(self, pairs, pol=None):
+        """Find the columns of baselines.
+
+        Parameters
+        ----------
+        pairs : (n, 2) array like
+            The feed (or channel) pairs of the baselines to find.
+        pol : None, integer or (n,) array like, optional
+            The polarization code of the baselines to find, must be given if
+            the index has pol. Default None.
+
+        Returns
+        -------
+        cols : (n,) array of integers
+            Column of each baseline in the baseline axis, -1 if not found.
+        conj : (n,) array of bools
+            Whether the data in the column is of the conjugate baseline.
+
+        """
+        if (pol is None) != (self.pol is None):
+            raise ValueError('pol must be given if and only if the index has pol')
+
+        keys = self._encode(pairs, pol)
+        if len(self._keys) == 0:
+            return -np.ones(len(keys), dtype=int), np.zeros(len(keys), dtype=bool)
+        inds = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        found = (keys >= 0) & (self._keys[inds] == keys)
+
+        return np.where(found, self._cols[inds], -1), np.where(found, self._conjs[inds], False)
+
+    def lookup(self, pairs, pol=None):
+        """Same as :meth:`find`, but raise a KeyError if any baseline is not found."""
+        cols, conj = self.find(pairs, pol)
+        if (cols < 0).any():
+            missing = np.asarray(pairs).reshape(-1, 2)[cols < 0]
+            raise KeyError('Baselines %s not found' % missing[:10].tolist())
+
+        return cols, conj
+
+    def baseline(self, cols):
+        """Return the baselines in columns `cols`.
+
+        Returns
+        -------
+        pairs : (n, 2) array
+            The feed (or channel) pairs, ordered as ascending.
+        pol : None or (n,) array
+            The polarization codes of the baselines of `pairs`, None if the
+            index has no pol.
+        conj : (n,) array of bools
+            Whether the data in the column is of the conjugate of `pairs`,
+            i.e., the feeds are held in descending order.
+
+        """
+        pairs = self.pairs[cols]
+        conj = pairs[..., 0] > pairs[..., 1]
+        pairs = np.where(conj[..., np.newaxis], pairs[..., ::-1], pairs)
+        if self.pol is None:
+            pol = None
+        else:
+            pol = self.pol[cols]
+            pol = np.where(conj, self._conj(np.asarray(pol).reshape(-1)).reshape(np.shape(pol)), pol)
+
+        return pairs, pol, conj
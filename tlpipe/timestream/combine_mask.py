@@ -24,6 +24,8 @@ class Combine(tod_task.TaskTimestream):
 
     prefix = 'cm_'
 
+    _cacheable = True
+
     def process(self, ts):
 
         assert isinstance(ts, Timestream), '%s only works for Timestream object' % self.__class__.__name__
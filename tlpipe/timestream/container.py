@@ -6,12 +6,16 @@ import pickle
 import posixpath
 import itertools
 import warnings
+import weakref
+import contextlib
 from copy import deepcopy
 import numpy as np
 import h5py
 from caput import mpiarray
 from caput import memh5
 from caput import mpiutil
+import file_index
+from prefetch import byte_ranges, Prefetcher
 
 
 def ensure_file_list(files):
@@ -33,6 +37,22 @@ def ensure_file_list(files):
     return files
 
 
+@contextlib.contextmanager
+def open_file(fl, mode='r'):
+    """Context to open the hdf5 file `fl`.
+
+    If `fl` is an already opened :class:`h5py.File`, it is used directly and
+    will not be closed on exit.
+
+    """
+
+    if isinstance(fl, h5py.File):
+        yield fl
+    else:
+        with h5py.File(fl, mode) as f:
+            yield f
+
+
 def check_axis(axis, axes):
     """Check a given axis is valid.
 
@@ -70,6 +90,281 @@ def check_axis(axis, axes):
         raise ValueError('Invalid axis %d' % axis)
 
 
+# a gap of unselected data not larger than this is read with the selected data
+# along an axis of a contiguous dataset, instead of starting a new hyperslab
+MAX_GAP_BYTES = 2**20
+
+# approximate bytes of a block of the main data passed to the operation
+# function in a batched :meth:`BasicTod.data_operate`
+BLOCK_BYTES = 2**26
+
+
+def _index_runs(lst, chunk=None, unit_bytes=1):
+    ### split the increasing index list `lst` along an axis into runs, each is
+    ### read as a single hyperslab: for a chunked axis of chunk length `chunk`,
+    ### a run contains indices in the same or adjacent chunks, else a run has no
+    ### gap larger than MAX_GAP_BYTES, where `unit_bytes` is the bytes of the
+    ### hyperslab per unit step of the gap (i.e., of the selected data of the
+    ### other axes); return a list of (slice, indices relative to the run,
+    ### position in `lst`)
+    runs = []
+    first = 0
+    for i in xrange(1, len(lst)+1):
+        if i < len(lst):
+            if chunk is not None:
+                same = lst[i] / chunk <= lst[i-1] / chunk + 1
+            else:
+                same = (lst[i] - lst[i-1] - 1) * unit_bytes <= MAX_GAP_BYTES
+            if same:
+                continue
+        run = lst[first:i]
+        runs.append((slice(run[0], run[-1]+1), [ x - run[0] for x in run ], first))
+        first = i
+
+    return runs
+
+
+def _to_slice_obj(lst):
+    ### convert a list to a slice object if possible
+    if len(lst) == 0:
+        return slice(0, 0)
+    elif len(lst) == 1:
+        return slice(lst[0], lst[0]+1)
+    else:
+        d = np.diff(lst)
+        if np.all(d == d[0]):
+            return slice(lst[0], lst[-1]+d[0], d[0])
+        else:
+            return lst
+
+
+def _memmap(dset):
+    ### a read only memory map of the hdf5 dataset `dset`, None if it is not
+    ### stored contiguously (i.e., chunked, compressed or not yet allocated)
+    if dset.chunks is not None or dset.dtype.hasobject or dset.external:
+        return None
+    offset = dset.id.get_offset()
+    if offset is None:
+        return None
+    try:
+        return np.memmap(dset.file.filename, dtype=dset.dtype, mode='r', offset=offset, shape=dset.shape)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def read_selection(dset, selection, out, use_memmap=False):
+    """Read the `selection` of the hdf5 dataset `dset` into array `out`.
+
+    The selection is a tuple of slices and increasing index lists, one for
+    each axis of `dset`. Instead of the slow point-wise fancy indexing of h5py
+    (which also allows only one index list), each index list is split into
+    runs aligned with the chunk layout of `dset`, and each run (including the
+    small gaps in it) is read as a hyperslab, from which the selected indices
+    are then taken in memory.
+
+    If `use_memmap` is True and `dset` is stored contiguously, the selection
+    is taken from a memory map of the file instead, so only the pages holding
+    the selected elements are read, which is much faster than a hyperslab
+    read for a thin selection of a contiguous dataset.
+
+    """
+    src = _memmap(dset) if use_memmap else None
+    if src is not None:
+        # take the slices first which are views, then the index lists
+        src = src[tuple(sel if isinstance(sel, slice) else slice(None) for sel in selection)]
+        for axis, sel in enumerate(selection):
+            if isinstance(sel, list):
+                src = src.take(sel, axis=axis)
+        out[:] = src
+        return
+
+    if not any(isinstance(sel, list) for sel in selection):
+        out[:] = dset[selection]
+        return
+
+    shape = dset.shape
+    # number of the selected elements along each axis
+    nsel = [ len(sel) if isinstance(sel, list) else len(xrange(*sel.indices(n))) for sel, n in zip(selection, shape) ]
+    plans = []
+    for axis, sel in enumerate(selection):
+        if isinstance(sel, list):
+            chunk = None if dset.chunks is None else dset.chunks[axis]
+            # a gap of one along this axis reads the selection of all the
+            # other axes once more
+            unit_bytes = dset.dtype.itemsize * int(np.prod(nsel[:axis] + nsel[axis+1:]))
+            plans.append(_index_runs(sel, chunk, unit_bytes))
+        else:
+            plans.append([ (sel, None, None) ])
+
+    for runs in itertools.product(*plans):
+        src = dset[tuple(run for run, _, _ in runs)]
+        dest = []
+        for axis, (run, local, pos) in enumerate(runs):
+            if local is None:
+                dest.append(slice(None))
+            else:
+                if len(local) < src.shape[axis]:
+                    src = src.take(local, axis=axis)
+                dest.append(slice(pos, pos + len(local)))
+        out[tuple(dest)] = src
+
+
+class _LazyDataset(object):
+    ### mixin of the lazily loaded main data, whose shape, dtype and attrs are
+    ### available without reading it, but it is read on first access of its data
+
+    def _load(self):
+        owner = self._lazy_owner()
+        if owner is not None:
+            owner.load_lazy()
+        if isinstance(self, _LazyDataset):
+            # the container which reads the data has gone, or this dataset is
+            # no longer its main data
+            raise RuntimeError('Can not read the lazily loaded dataset %s as its container has gone' % self.name)
+
+    @property
+    def data(self):
+        self._load()
+        return self.data
+
+    @property
+    def local_data(self):
+        self._load()
+        return self.local_data
+
+    def __getitem__(self, obj):
+        self._load()
+        return self.__getitem__(obj)
+
+    def __setitem__(self, obj, val):
+        self._load()
+        self.__setitem__(obj, val)
+
+    def redistribute(self, dist_axis):
+        self._load()
+        self.redistribute(dist_axis)
+
+    @property
+    def _raw_data(self):
+        return super(_LazyDataset, self).data
+
+    @property
+    def _raw_local_data(self):
+        return super(_LazyDataset, self).local_data
+
+_lazy_classes = {}
+
+
+class _SharedDataset(object):
+    ### mixin of a dataset sharing its data with datasets of other containers
+    ### (see BasicTod.copy), its data is read through read-only views while it
+    ### is shared, and is copied on its first write, so changes to it have no
+    ### impact on the other datasets
+
+    def _own(self):
+        share = self._share
+        share.discard(self)
+        self.__class__ = self._shared_base
+        del self._share
+        del self._shared_base
+        if len(share) > 0:
+            self._data = self._data.copy()
+
+    def _alone(self):
+        ### drop the shared state if the other datasets have gone, return
+        ### True if so
+        if len(self._share) > 1:
+            return False
+        self._own()
+        return True
+
+    @property
+    def data(self):
+        if self._alone():
+            return self.data
+        return _read_only(self._raw_data)
+
+    @property
+    def local_data(self):
+        if self._alone():
+            return self.local_data
+        return _read_only(self._raw_local_data)
+
+    def __getitem__(self, obj):
+        if self._alone():
+            return self.__getitem__(obj)
+        return _read_only(super(_SharedDataset, self).__getitem__(obj))
+
+    def __setitem__(self, obj, val):
+        self._own()
+        self.__setitem__(obj, val)
+
+    def redistribute(self, dist_axis):
+        self._own()
+        self.redistribute(dist_axis)
+
+    @property
+    def _raw_data(self):
+        return super(_SharedDataset, self).data
+
+    @property
+    def _raw_local_data(self):
+        return super(_SharedDataset, self).local_data
+
+_shared_classes = {}
+
+
+def _read_only(arr):
+    ### a read-only view of `arr`, so the shared data can not be changed in place
+    if not isinstance(arr, np.ndarray):
+        return arr
+    arr = arr.view()
+    arr.flags.writeable = False
+    return arr
+
+
+def _shared_data(dset):
+    ### data of `dset` which is not copied if it is shared
+    if isinstance(dset, _SharedDataset):
+        return dset._raw_data
+    return dset.data
+
+
+def share_dataset(dset, new_dset):
+    """Make datasets `dset` and `new_dset` copy-on-write if they share data.
+
+    The two datasets, usually of different containers, with `new_dset` created
+    from the data of `dset` (see :meth:`BasicTod.copy`), hold the same array
+    until either of them is written, then that one gets its own copy of the
+    array. This saves the memory and the time to copy the datasets that are
+    only read later, e.g., the auxiliary datasets of a copied container of
+    which only the main data is changed.
+
+    While the data is shared, `data`, `local_data` and indexing of the datasets
+    return read-only views of it, and the data is copied on assignment to the
+    datasets (`dset[...] = val`) and on redistribution. To change the data of a
+    shared dataset in place, call :meth:`BasicTod._own_dataset` first, or use
+    :meth:`BasicTod._local_array` or the writable accessors of the containers,
+    e.g., `local_vis`, which do so. A dataset whose sharing datasets have all
+    gone is no longer shared.
+
+    """
+    if not np.may_share_memory(_shared_data(dset), _shared_data(new_dset)):
+        # the data has been copied
+        return
+
+    share = dset._share if isinstance(dset, _SharedDataset) else weakref.WeakSet()
+    for ds in (dset, new_dset):
+        if not isinstance(ds, _SharedDataset):
+            base = ds.__class__
+            if not base in _shared_classes:
+                _shared_classes[base] = type('Shared' + base.__name__, (_SharedDataset, base), {})
+            ds.__class__ = _shared_classes[base]
+            ds._shared_base = base
+            ds._share = share
+        share.add(ds)
+
+
 class BasicTod(memh5.MemDiskGroup):
     """Basic time ordered data container.
 
@@ -87,7 +382,9 @@ class BasicTod(memh5.MemDiskGroup):
     ----------
     files : None, string or list of strings
         File name or a list of file names that data will be loaded from. No files
-        if None. Default None.
+        if None. Default None. The elements of the list can also be opened
+        :class:`h5py.File` objects, which will be used directly and will not be
+        closed by this class, so they can be kept open and reused.
     mode : string, optional
         In which mode to open the input files. Default 'r' to open files read only.
     start : integer, optional
@@ -105,6 +402,18 @@ class BasicTod(memh5.MemDiskGroup):
         construct this class. Default True.
     comm : None or MPI.Comm, optional
         MPI Communicator to distributed over. Default None to use mpiutil._comm.
+    use_index : bool, optional
+        If True, get the lengths and hints of the files from an index of the
+        data files (see :mod:`~tlpipe.timestream.file_index`), so only the
+        selected files are opened. Default False.
+    index_dir : None or string, optional
+        The directory to save the index files in, so they are reused by later
+        runs. Only useful if `use_index` is True. Default None to keep the
+        index in memory only. Nothing is written into the data directories.
+    prefetch : bool, optional
+        If True, when the main data is loaded from several files, the selected
+        part of the next file is read ahead in background (to the page cache
+        of the OS) while the current file is loaded. Default False.
 
     """
 
@@ -115,7 +424,7 @@ class BasicTod(memh5.MemDiskGroup):
     _time_ordered_attrs_ = {}
 
 
-    def __init__(self, files=None, mode='r', start=0, stop=None, dist_axis=0, use_hints=True, comm=None):
+    def __init__(self, files=None, mode='r', start=0, stop=None, dist_axis=0, use_hints=True, comm=None, use_index=False, index_dir=None, prefetch=False):
 
         super(BasicTod, self).__init__(data_group=None, distributed=True, comm=comm)
 
@@ -125,14 +434,25 @@ class BasicTod(memh5.MemDiskGroup):
 
         # hints pattern to match hint class attributes defined above
         self.hints_pattern = re.compile(r"(^_[^_]+_$)|(^_[^_]\w*[^_]_$)")
+        if files is not None:
+            files = ensure_file_list(files)
+        # index entries of all files
+        self._files_info = None
+        if files is not None and len(files) > 0 and use_index:
+            if all(isinstance(fl, (basestring, h5py.File)) for fl in files):
+                self._files_info = file_index.file_info(files, comm=self.comm, index_dir=index_dir, main_data_name=self.main_data_name)
+
         # read and set hints from the first file if use_hints is True
-        if files is not None and use_hints:
-            fl = ensure_file_list(files)[0]
-            with h5py.File(fl, 'r') as f:
-                if 'hints' in f.attrs.iterkeys():
-                    hints = pickle.loads(f.attrs['hints'])
-                    for key, val in hints.iteritems():
-                        setattr(self, key, val)
+        if files is not None and len(files) > 0 and use_hints:
+            if self._files_info is not None:
+                hints = file_index.file_hints(self._files_info[0])
+            else:
+                with open_file(files[0], 'r') as f:
+                    hints = f.attrs['hints'] if 'hints' in f.attrs.iterkeys() else None
+            if hints is not None:
+                hints = pickle.loads(hints)
+                for key, val in hints.iteritems():
+                    setattr(self, key, val)
 
         self.infiles_mode = mode
         # self.infiles will be a list of opened hdf5 file handlers
@@ -142,15 +462,24 @@ class BasicTod(memh5.MemDiskGroup):
 
         self.main_data_select = [ slice(0, None, None) for i in self._main_data_axes_ ]
 
+        # state of the lazily loaded main data, see load_main_data
+        self._lazy = None
+
+        # whether to read ahead the next file of the main data
+        self.prefetch = prefetch
+
     def __del__(self):
-        """Closes the opened file handlers."""
-        for fh in self.infiles:
-            fh.close()
+        """Closes the file handlers opened by this container."""
+        for fh, own in zip(self.infiles, getattr(self, '_own_infiles', [])):
+            if own:
+                fh.close()
 
     def _select_files(self, files, dset_name, start=0, stop=None):
         ### select the needed files from `files` which contain time ordered data from `start` to `stop`
         assert dset_name in self.time_ordered_datasets.keys(), '%s is not a time ordered dataset' % dset_name
 
+        self._own_infiles = []
+        self._infiles_info = None
         if files is None:
             return [], 0, 0
 
@@ -158,13 +487,16 @@ class BasicTod(memh5.MemDiskGroup):
         if len(files) == 0:
             return [], 0, 0
 
-        num_ts = []
-        for fh in mpiutil.mpilist(files, method='con', comm=self.comm):
-            with h5py.File(fh, 'r') as f:
-                num_ts.append(f[dset_name].shape[0])
+        if self._files_info is not None:
+            num_ts = [ info['datasets'][dset_name]['shape'][0] for info in self._files_info ]
+        else:
+            num_ts = []
+            for fh in mpiutil.mpilist(files, method='con', comm=self.comm):
+                with open_file(fh, 'r') as f:
+                    num_ts.append(f[dset_name].shape[0])
 
-        if self.comm is not None:
-            num_ts = list(itertools.chain(*self.comm.allgather(num_ts)))
+            if self.comm is not None:
+                num_ts = list(itertools.chain(*self.comm.allgather(num_ts)))
         nt = sum(num_ts) # total length of the first axis along different files
 
         tmp_start = start if start >=0 else start + nt
@@ -187,8 +519,12 @@ class BasicTod(memh5.MemDiskGroup):
         ef = np.searchsorted(cum_num_ts, stop, side='left') # stop file index, included
         new_stop = stop if sf == 0 else stop - cum_num_ts[sf-1] # stop relative the selected first file
 
-        # open all selected files
-        files = [ h5py.File(fh, self.infiles_mode) for fh in files[sf:ef+1] ]
+        if self._files_info is not None:
+            self._infiles_info = self._files_info[sf:ef+1]
+
+        # open all selected files, use the already opened ones directly
+        self._own_infiles = [ not isinstance(fh, h5py.File) for fh in files[sf:ef+1] ]
+        files = [ h5py.File(fh, self.infiles_mode) if own else fh for fh, own in zip(files[sf:ef+1], self._own_infiles) ]
 
         return files, new_start, new_stop
 
@@ -238,12 +574,15 @@ class BasicTod(memh5.MemDiskGroup):
         ### start, stop are all relative to the first file
         ### shape and type are get from the first file and suppose they are the same in all self.infiles
 
-        num_ts = []
-        for fh in mpiutil.mpilist(self.infiles, method='con', comm=self.comm):
-            num_ts.append(fh[dset_name].shape[0])
+        if self._infiles_info is not None and all(dset_name in info['datasets'] for info in self._infiles_info):
+            num_ts = [ info['datasets'][dset_name]['shape'][0] for info in self._infiles_info ]
+        else:
+            num_ts = []
+            for fh in mpiutil.mpilist(self.infiles, method='con', comm=self.comm):
+                num_ts.append(fh[dset_name].shape[0])
 
-        if self.comm is not None:
-            num_ts = list(itertools.chain(*self.comm.allgather(num_ts)))
+            if self.comm is not None:
+                num_ts = list(itertools.chain(*self.comm.allgather(num_ts)))
         if stop is None:
             stop = sum(num_ts) # total length of the first axis along different files
         infiles_map = self._gen_files_map(num_ts, start, stop)
@@ -416,24 +755,108 @@ class BasicTod(memh5.MemDiskGroup):
         # copy attrs of this dset
         memh5.copyattrs(dset.attrs, self[name].attrs)
 
-    def _load_a_tod_dataset(self, name):
+    def _main_data_read_info(self):
+        ### get the shape and type of the main data to load, the selection of
+        ### it in the files and the segments (file_idx, start, stop, st, et)
+        ### which read time points [start, stop) of a file to [st, et) of the
+        ### local data
+        name = self.main_data_name
+        dset_shape, dset_type, infiles_map = self._get_input_info(name, self.main_data_start, self.main_data_stop)
+        first_start = mpiutil.bcast(infiles_map[0][1], root=0, comm=self.comm) # start form the first file
+        last_stop = mpiutil.bcast(infiles_map[-1][2], root=self.nproc-1, comm=self.comm) # stop from the last file
+
+        main_data_select = self.main_data_select[:] # copy here to not change self.main_data_select
+        new_dset_shape = (dset_shape[0],)
+        for axis in xrange(1, len(dset_shape)): # exclude the first axis
+            tmp = np.arange(dset_shape[axis])
+            sel = tmp[main_data_select[axis]]
+            new_dset_shape += (len(sel),)
+            if axis == self.main_data_dist_axis:
+                main_data_select[axis] = mpiutil.mpilist(sel, method='con', comm=self.comm).tolist() # must have tolist as a single number numpy array index will reduce one axis in h5py slice
+
+            # convert list to slice object if possible
+            main_data_select = [  ( _to_slice_obj(lst) if isinstance(lst, list) else lst ) for lst in main_data_select ]
+
+        segments = []
+        st = 0
+        if self.main_data_dist_axis == 0:
+            for fi, start, stop in infiles_map:
+                et = st + (stop - start)
+                segments.append((fi, start, stop, st, et))
+                st = et
+        # need to take special care when dist_axis != 0
+        else:
+            # every proc has to read from all files
+            for fi, fh in enumerate(self.infiles):
+                num_ts = fh[name].shape[0]
+                if self.num_infiles == 1:
+                    start, stop = first_start, last_stop
+                elif fi == 0:
+                    start, stop = first_start, num_ts
+                elif fi == self.num_infiles-1:
+                    start, stop = 0, last_stop
+                else:
+                    start, stop = 0, num_ts
+                et = st + (stop - start)
+                segments.append((fi, start, stop, st, et))
+                st = et
+
+        return new_dset_shape, dset_type, main_data_select, segments
+
+    def _read_main_data(self, main_data_select, segments, out, axis=None, linds=None):
+        ### read the main data selected by `main_data_select` from `segments`
+        ### into the local array `out`, or only the local indices `linds`
+        ### along `axis` of it
+        name = self.main_data_name
+        prefetcher = None
+        for idx, (fi, start, stop, st, et) in enumerate(segments):
+            fh = self.infiles[fi]
+            dest = out[st:et]
+            sel = main_data_select[:]
+            sel[0] = slice(start, stop)
+            if axis is None:
+                # read the selection of the next file in background
+                if self.prefetch:
+                    prefetcher = self._prefetch(prefetcher, name, segments[idx+1][:3] if idx+1 < len(segments) else None, main_data_select[1:])
+                if np.prod(dest.shape) > 0:
+                    # only read in data if non-empty, may get error otherwise
+                    read_selection(fh[name], tuple(sel), dest) # h5py need the explicit tuple conversion
+            else:
+                if axis == 0:
+                    local = [ li - st for li in linds if st <= li < et ]
+                    sel[0] = _to_slice_obj([ start + li for li in local ])
+                else:
+                    local = list(linds)
+                    sel[axis] = _to_slice_obj(np.arange(fh[name].shape[axis])[main_data_select[axis]][local].tolist())
+                if len(local) == 0 or np.prod(dest.shape) == 0:
+                    continue
+                index = [ slice(None) ] * dest.ndim
+                index[axis] = local
+                shape = list(dest.shape)
+                shape[axis] = len(local)
+                tmp = np.empty(shape, dtype=dest.dtype)
+                read_selection(fh[name], tuple(sel), tmp, use_memmap=True)
+                dest[tuple(index)] = tmp
+        self._prefetch(prefetcher, name, None)
+
+    def _load_a_tod_dataset(self, name, lazy=False):
         ### load a time ordered dataset from all files, distributed along the first axis
         if self.num_infiles == 0:
             warnings.warn('No input file')
             return
 
-        def _to_slice_obj(lst):
-            ### convert a list to a slice object if possible
-            if len(lst) == 0:
-                return slice(0, 0)
-            elif len(lst) == 1:
-                return slice(lst[0], lst[0]+1)
+        # for main data
+        if name == self.main_data_name:
+            dset_shape, dset_type, main_data_select, segments = self._main_data_read_info()
+            self.create_dataset(name, shape=dset_shape, dtype=dset_type, distributed=True, distributed_axis=self.main_data_dist_axis)
+            # copy attrs of this dset
+            memh5.copyattrs(self.infiles[0][name].attrs, self[name].attrs)
+            if lazy:
+                self._lazy = { 'select': main_data_select, 'segments': segments, 'axis': None, 'loaded': None }
+                self._lazy_dataset()
             else:
-                d = np.diff(lst)
-                if np.all(d == d[0]):
-                    return slice(lst[0], lst[-1]+d[0], d[0])
-                else:
-                    return lst
+                self._read_main_data(main_data_select, segments, self[name].local_data)
+            return
 
         if name in self.main_time_ordered_datasets.keys():
             dset_shape, dset_type, infiles_map = self._get_input_info(name, self.main_data_start, self.main_data_stop)
@@ -442,62 +865,8 @@ class BasicTod(memh5.MemDiskGroup):
         else:
             dset_shape, dset_type, infiles_map = self._get_input_info(name, 0, None)
 
-        # for main data
-        if name == self.main_data_name:
-            main_data_select = self.main_data_select[:] # copy here to not change self.main_data_select
-            new_dset_shape = (dset_shape[0],)
-            for axis in xrange(1, len(dset_shape)): # exclude the first axis
-                tmp = np.arange(dset_shape[axis])
-                sel = tmp[main_data_select[axis]]
-                new_dset_shape += (len(sel),)
-                if axis == self.main_data_dist_axis:
-                    main_data_select[axis] = mpiutil.mpilist(sel, method='con', comm=self.comm).tolist() # must have tolist as a single number numpy array index will reduce one axis in h5py slice
-
-                # convert list to slice object if possible
-                main_data_select = [  ( _to_slice_obj(lst) if isinstance(lst, list) else lst ) for lst in main_data_select ]
-
-            self.create_dataset(name, shape=new_dset_shape, dtype=dset_type, distributed=True, distributed_axis=self.main_data_dist_axis)
-            # copy attrs of this dset
-            memh5.copyattrs(self.infiles[0][name].attrs, self[name].attrs)
-
-            if self.main_data_dist_axis == 0:
-                st = 0
-                for fi, start, stop in infiles_map:
-                    main_data_select[0] = slice(start, stop)
-                    et = st + (stop - start)
-                    fh = self.infiles[fi]
-                    if np.prod(self[name].local_data[st:et].shape) > 0:
-                        # only read in data if non-empty, may get error otherwise
-                        # main_data_select = [  ( _to_slice_obj(lst) if isinstance(lst, list) else lst ) for lst in main_data_select ]
-                        self[name].local_data[st:et] = fh[name][tuple(main_data_select)]
-                    st = et
-            # need to take special care when dist_axis != 0
-            else:
-                st = 0
-                # every proc has to read from all files
-                for fi, fh in enumerate(self.infiles):
-                    num_ts = fh[name].shape[0]
-                    if self.num_infiles == 1:
-                        et = st + last_stop - first_start
-                        main_data_select[0] = slice(first_start, last_stop)
-                    elif self.num_infiles > 1:
-                        if fi == 0:
-                            et = st + (num_ts - first_start)
-                            main_data_select[0] = slice(first_start, None)
-                        elif fi == self.num_infiles-1:
-                            et = st + last_stop
-                            main_data_select[0] = slice(0, last_stop)
-                        else:
-                            et = st + num_ts
-
-                    if np.prod(self[name].local_data[st:et].shape) > 0:
-                        # only read in data if non-empty, may get error otherwise
-                        # main_data_select = [  ( _to_slice_obj(lst) if isinstance(lst, list) else lst ) for lst in main_data_select ]
-                        self[name].local_data[st:et] = fh[name][tuple(main_data_select)] # h5py need the explicit tuple conversion
-                    st = et
-
         # for other main_time_ordered_datasets
-        elif name in self.main_time_ordered_datasets.keys():
+        if name in self.main_time_ordered_datasets.keys():
             time_axis = self.main_time_ordered_datasets[name].index(0)
             if self.main_data_dist_axis == 0:
                 # distribute it along the first axis as the main data
@@ -523,11 +892,11 @@ class BasicTod(memh5.MemDiskGroup):
                     num_ts = fh[name].shape[0]
                     if self.num_infiles == 1:
                         et = st + last_stop - first_start
-                        main_data_select[0] = slice(first_start, last_stop)
+                        sel = slice(first_start, last_stop)
                     elif self.num_infiles > 1:
                         if fi == 0:
                             et = st + (num_ts - first_start)
-                            sel = slice(fist_start, None)
+                            sel = slice(first_start, None)
                         elif fi == self.num_infiles-1:
                             et = st + last_stop
                             sel = slice(0, last_stop)
@@ -555,6 +924,158 @@ class BasicTod(memh5.MemDiskGroup):
                     self[name].local_data[st:et] = fh[name][start:stop]
                 st = et
 
+    def _prefetch(self, prefetcher, name, file_map, select=None):
+        ### stop the background reading of `prefetcher`, and start to read the
+        ### part `file_map` = (file_idx, start, stop) of dataset `name` with
+        ### the selection `select` of the other axes in background, return the
+        ### new prefetcher
+        if prefetcher is not None:
+            prefetcher.stop()
+        if file_map is None:
+            return None
+
+        fi, start, stop = file_map
+        fh = self.infiles[fi]
+        prefetcher = Prefetcher([ (fh.filename, byte_ranges(fh, [name], start, stop, { name: select })) ])
+        prefetcher.start()
+
+        return prefetcher
+
+    def _lazy_dataset(self):
+        ### make the main data a lazily loaded dataset
+        dset = self[self.main_data_name]
+        base = dset.__class__
+        if not base in _lazy_classes:
+            _lazy_classes[base] = type('Lazy' + base.__name__, (_LazyDataset, base), {})
+        dset.__class__ = _lazy_classes[base]
+        dset._lazy_base = base
+        dset._lazy_owner = weakref.ref(self)
+
+    def _lazy_done(self):
+        ### the main data has been read or deleted, stop lazily loading it
+        self._lazy = None
+        if not self.main_data_name in self.iterkeys():
+            return
+        dset = self[self.main_data_name]
+        if isinstance(dset, _LazyDataset):
+            dset.__class__ = dset._lazy_base
+            del dset._lazy_base
+            del dset._lazy_owner
+
+    def _lazy_read(self, index):
+        ### called after the `index` of the local lazily loaded main data has
+        ### been read, for sub-classes to update the datasets derived from it
+        pass
+
+    def _own_dataset(self, name):
+        ### copy the data of dataset `name` if it is shared with other containers
+        dset = self[name]
+        if isinstance(dset, _SharedDataset):
+            dset._own()
+
+    def _shared_array(self, name, local=True):
+        ### the local (or global) data of dataset `name` for reading only, e.g.,
+        ### to write to files, which is not copied if it is shared with other
+        ### containers, and not read if lazily loaded
+        dset = self[name]
+        if isinstance(dset, (_LazyDataset, _SharedDataset)):
+            return dset._raw_local_data if local else dset._raw_data
+        return dset.local_data if local else dset.data
+
+    def _local_array(self, name):
+        ### the local data of dataset `name` to be changed in place, not read
+        ### if lazily loaded, and copied if it is shared with other containers
+        dset = self[name]
+        if isinstance(dset, _LazyDataset):
+            return dset._raw_local_data
+        if isinstance(dset, _SharedDataset):
+            dset._own()
+        return dset.local_data
+
+    def _global_array(self, name):
+        ### the MPIArray of dataset `name`, not read if lazily loaded
+        dset = self[name]
+        if isinstance(dset, _LazyDataset):
+            return dset._raw_data
+        return dset.data
+
+    def _load_lazy_sections(self, axis, linds):
+        ### read the sections at local indices `linds` along `axis` of the
+        ### lazily loaded main data if they have not been read
+        lazy = self._lazy
+        if lazy is None:
+            return
+
+        out = self._local_array(self.main_data_name)
+        if lazy['axis'] is None:
+            lazy['axis'] = axis
+            lazy['loaded'] = np.zeros(out.shape[axis], dtype=bool)
+        elif lazy['axis'] != axis:
+            # sections along another axis have been read, read all the rest
+            self.load_lazy()
+            return
+
+        linds = [ li for li in linds if not lazy['loaded'][li] ]
+        if len(linds) > 0:
+            self._read_main_data(lazy['select'], lazy['segments'], out, axis, linds)
+            index = [ slice(None) ] * out.ndim
+            index[axis] = linds
+            self._lazy_read(tuple(index))
+            lazy['loaded'][linds] = True
+            if lazy['loaded'].all():
+                self._lazy_done()
+
+    @property
+    def lazy(self):
+        """Whether the main data has been lazily loaded and not all read."""
+        return self._lazy is not None
+
+    def load_lazy(self):
+        """Read the part of the lazily loaded main data that has not been read.
+
+        Nothing is done if the main data is not lazily loaded.
+        """
+        lazy = self._lazy
+        if lazy is None:
+            return
+
+        out = self._local_array(self.main_data_name)
+        if lazy['axis'] is None:
+            self._read_main_data(lazy['select'], lazy['segments'], out)
+            self._lazy_read((slice(None),) * out.ndim)
+        else:
+            linds = np.where(np.logical_not(lazy['loaded']))[0].tolist()
+            if len(linds) > 0:
+                self._read_main_data(lazy['select'], lazy['segments'], out, lazy['axis'], linds)
+                index = [ slice(None) ] * out.ndim
+                index[lazy['axis']] = linds
+                self._lazy_read(tuple(index))
+        self._lazy_done()
+
+    def local_section(self, name, axis, lind):
+        """Return the section of the local data of a main axes ordered dataset.
+
+        If the main data is lazily loaded, only the requested section of it is
+        read, so a task which uses only a small part of the data need not read
+        all of it.
+
+        Parameters
+        ----------
+        name : string
+            Name of the main axes ordered dataset.
+        axis : string or integer
+            The main data axis along which to take the section.
+        lind : integer
+            Local index of the section along `axis`.
+
+        """
+        axis = check_axis(axis, self.main_data_axes)
+        if name == self.main_data_name:
+            self._load_lazy_sections(axis, [lind])
+        sel = [ slice(None) ] * len(self[name].shape)
+        sel[self.main_axes_ordered_datasets[name].index(axis)] = lind
+        return self._local_array(name)[tuple(sel)]
+
     def _load_a_dataset(self, name):
         ### load a dataset (either a commmon or a time ordered)
         if self.num_infiles == 0:
@@ -586,13 +1107,25 @@ class BasicTod(memh5.MemDiskGroup):
             if dset_name not in self.time_ordered_datasets.keys():
                 self._load_a_common_dataset(dset_name)
 
-    def load_main_data(self):
-        """Load main data from all files."""
+    def load_main_data(self, lazy=False):
+        """Load main data from all files.
+
+        Parameters
+        ----------
+        lazy : bool, optional
+            If True, the main data is not read now, but read on the first
+            access of its data (its shape, dtype and attrs are available
+            without reading), except that :meth:`data_operate` and
+            :meth:`local_section` read only the sections they operate on. The
+            sections are read from memory maps of the files if the data is
+            stored contiguously. Default False.
+
+        """
         if self.num_infiles == 0:
             warnings.warn('No input file')
             return
 
-        self._load_a_tod_dataset(self.main_data_name)
+        self._load_a_tod_dataset(self.main_data_name, lazy)
 
     def load_tod_excl_main_data(self):
         """Load time ordered attributes and datasets (exclude the main data) from all files."""
@@ -611,22 +1144,30 @@ class BasicTod(memh5.MemDiskGroup):
             if dset_name in self.time_ordered_datasets.keys() and dset_name != self.main_data_name:
                 self._load_a_tod_dataset(dset_name)
 
-    def load_time_ordered(self):
-        """Load time ordered attributes and datasets from all files."""
+    def load_time_ordered(self, lazy=False):
+        """Load time ordered attributes and datasets from all files.
+
+        The main data is lazily loaded if `lazy` is True, see
+        :meth:`load_main_data`.
+        """
         if self.num_infiles == 0:
             warnings.warn('No input file')
             return
 
-        self.load_main_data()
+        self.load_main_data(lazy)
         self.load_tod_excl_main_data()
 
-    def load_all(self):
-        """Load all attributes and datasets from files."""
+    def load_all(self, lazy=False):
+        """Load all attributes and datasets from files.
+
+        The main data is lazily loaded if `lazy` is True, see
+        :meth:`load_main_data`.
+        """
         if self.num_infiles == 0:
             warnings.warn('No input file')
             return
 
-        self.load_main_data()
+        self.load_main_data(lazy)
         self.load_common()
         self.load_tod_excl_main_data()
 
@@ -640,6 +1181,8 @@ class BasicTod(memh5.MemDiskGroup):
 
     def _del_a_dataset(self, name):
         ### delete a dataset
+        if name == self.main_data_name:
+            self._lazy_done()
         try:
             del self[name]
         except KeyError:
@@ -844,6 +1387,8 @@ class BasicTod(memh5.MemDiskGroup):
                 if copy_attrs:
                     attr_dict = {} # temporarily save attrs of this dataset
                     memh5.copyattrs(self[name].attrs, attr_dict)
+                if name == self.main_data_name:
+                    self._lazy_done()
                 del self[name]
                 if self.main_data_dist_axis in axes:
                     self.create_dataset(name, data=data, distributed=True, distributed_axis=axis_order.index(self.main_data_dist_axis))
@@ -910,6 +1455,8 @@ class BasicTod(memh5.MemDiskGroup):
     def delete_a_dataset(self, name):
         """Delete a dataset and also remove it from the hint if it is in it."""
         if name in self.iterkeys():
+            if name == self.main_data_name:
+                self._lazy_done()
             del self[name]
         else:
             warnings.warn('Dataset %s does not exist')
@@ -1009,16 +1556,27 @@ class BasicTod(memh5.MemDiskGroup):
             # already the distributed axis, nothing to do
             return
         else:
-            # redistribute main data if it exists
-            try:
-                self.main_data.redistribute(axis)
-            except KeyError:
-                pass
+            if self._lazy is not None and self._lazy['axis'] is None:
+                # nothing of the lazily loaded main data has been read, so
+                # just recreate it distributed along the new axis
+                attr_dict = {}
+                memh5.copyattrs(self.main_data.attrs, attr_dict)
+                self._del_a_dataset(self.main_data_name)
+                self.main_data_dist_axis = axis
+                self._load_a_tod_dataset(self.main_data_name, lazy=True)
+                memh5.copyattrs(attr_dict, self.main_data.attrs)
+            else:
+                # redistribute main data if it exists
+                try:
+                    self.main_data.redistribute(axis)
+                except KeyError:
+                    pass
             self.main_data_dist_axis = axis
 
             # redistribute other main_axes_ordered_datasets
             for name, val in self.main_axes_ordered_datasets.items():
                 if name in self.iterkeys() and name != self.main_data_name:
+                    self._own_dataset(name)
                     if axis in val:
                         with warnings.catch_warnings():
                             warnings.simplefilter('ignore')
@@ -1030,6 +1588,7 @@ class BasicTod(memh5.MemDiskGroup):
             # redistribute other time_ordered_datasets
             for name, val in self.time_ordered_datasets.items():
                 if name in self.iterkeys() and not name in self.main_axes_ordered_datasets.keys():
+                    self._own_dataset(name)
                     if axis == 0:
                         self.dataset_common_to_distributed(name, distributed_axis=val.index(0))
                     else:
@@ -1096,8 +1655,174 @@ class BasicTod(memh5.MemDiskGroup):
 
         return dset_shape, dset_type, outfiles_map
 
+    def _layout_kwargs(self, name, shape, layout, filters=True):
+        ### keyword arguments to create the time ordered dataset `name` of
+        ### `shape` in a file according to `layout`
+        if layout is None:
+            return {}
+        axis_order = self.main_axes_ordered_datasets.get(name)
+        if axis_order is None:
+            axes = None
+        else:
+            axes = tuple( (None if ax is None else self.main_data_axes[ax]) for ax in axis_order )
+
+        # the time points of the dataset are written by procs in sections
+        time_chunk = max(1, self[name].global_shape[0] // self.nproc)
+
+        return layout.dataset_kwargs(shape, self[name].dtype, axes, filters, time_chunk)
+
+    def _write_common_to_file(self, f, fi, num_outfiles, exclude=[], write_hints=True, write_data=True, create_tod=True, layout=None, filters=True):
+        ### write hints, top level common attrs and datasets to the opened file f,
+        ### and create (without initializing) the time ordered datasets in it if create_tod is True
+        ### if write_data is False, common datasets are only created but not filled
+        ### time ordered datasets are created according to `layout`, without filters if filters is False
+
+        # write hints if required
+        if write_hints:
+            hint_keys = [ key for key in self.__class__.__dict__.keys() if re.match(self.hints_pattern, key) ]
+            hint_dict = { key: getattr(self, key) for key in hint_keys }
+            f.attrs['hints'] = pickle.dumps(hint_dict)
+
+        # write top level common attrs
+        for attrs_name, attrs_value in self.attrs.iteritems():
+            if attrs_name in exclude:
+                continue
+            if attrs_name not in self.time_ordered_attrs:
+                f.attrs[attrs_name] = self.attrs[attrs_name]
+
+        for dset_name, dset in self.iteritems():
+            if dset_name in exclude:
+                continue
+            # write top level common datasets
+            if dset_name not in self.time_ordered_datasets.keys():
+                if write_data:
+                    f.create_dataset(dset_name, data=self._shared_array(dset_name, local=False), shape=dset.shape, dtype=dset.dtype)
+                else:
+                    f.create_dataset(dset_name, shape=dset.shape, dtype=dset.dtype)
+            # create time ordered datasets, no need to initialize them as
+            # every time point will be written later
+            elif create_tod:
+                nt = dset.global_shape[0]
+                lt, et, st = mpiutil.split_m(nt, num_outfiles)
+                lshape = (lt[fi],) + dset.global_shape[1:]
+                f.create_dataset(dset_name, lshape, dtype=dset.dtype, **self._layout_kwargs(dset_name, lshape, layout, filters))
+            else:
+                continue
+
+            # copy attrs of this dset
+            memh5.copyattrs(dset.attrs, f[dset_name].attrs)
+
+    def _to_files_mpio(self, outfiles, outfiles_maps, exclude=[], write_hints=True, libver='latest', layout=None):
+        ### all procs open each file collectively with the MPI-IO driver
+        ### and write their own hyperslabs concurrently
+
+        # filters need collective writes, which are not done here
+        if layout is not None and layout.has_filters:
+            warnings.warn('Filters of %s are not applied when written with MPI-IO' % layout)
+
+        for fi, outfile in enumerate(outfiles):
+            with h5py.File(outfile, 'w', driver='mpio', comm=self.comm, libver=libver) as f:
+                # file structure and attrs must be created collectively
+                self._write_common_to_file(f, fi, len(outfiles), exclude, write_hints, write_data=False, layout=layout, filters=False)
+
+                for dset_name, dset in self.iteritems():
+                    if dset_name in exclude:
+                        continue
+                    if dset_name not in self.time_ordered_datasets.keys():
+                        # common datasets are the same on all procs
+                        if self.rank0:
+                            f[dset_name][...] = self._shared_array(dset_name, local=False)
+                    else:
+                        st = 0
+                        for fj, start, stop in outfiles_maps[dset_name]:
+                            et = st + (stop - start)
+                            if fj == fi and stop > start:
+                                f[dset_name][start:stop] = self._shared_array(dset_name)[st:et]
+                            st = et
+
+    def _to_files_vds(self, outfiles, outfiles_maps, exclude=[], write_hints=True, libver='latest', layout=None):
+        ### each proc writes its local section to its own shard files concurrently,
+        ### then the output files are created with virtual datasets indexing the shards
+
+        def _shard_name(outfile, rank):
+            return '%s.shard%d' % (outfile, rank)
 
-    def to_files(self, outfiles, exclude=[], check_status=True, write_hints=True, libver='latest'):
+        # write local sections to shard files, one shard per (output file, proc)
+        shards = {}
+        for dset_name in sorted(outfiles_maps.keys()):
+            st = 0
+            for fi, start, stop in outfiles_maps[dset_name]:
+                et = st + (stop - start)
+                if stop > start:
+                    shards.setdefault(fi, []).append((dset_name, st, et))
+                st = et
+        for fi, dsets in shards.items():
+            with h5py.File(_shard_name(outfiles[fi], self.rank), 'w', libver=libver) as f:
+                for dset_name, st, et in dsets:
+                    data = self._shared_array(dset_name)[st:et]
+                    f.create_dataset(dset_name, data=data, **self._layout_kwargs(dset_name, data.shape, layout))
+
+        # gather the files maps of all procs to build the virtual datasets
+        all_maps = {}
+        for dset_name in sorted(outfiles_maps.keys()):
+            if self.comm is not None:
+                all_maps[dset_name] = self.comm.allgather(outfiles_maps[dset_name])
+            else:
+                all_maps[dset_name] = [ outfiles_maps[dset_name] ]
+
+        num_outfiles = len(outfiles)
+        for outfile in mpiutil.mpilist(outfiles, method='con', comm=self.comm):
+            fi = outfiles.index(outfile)
+            with h5py.File(outfile, 'w', libver=libver) as f:
+                self._write_common_to_file(f, fi, num_outfiles, exclude, write_hints, create_tod=False)
+
+                for dset_name, proc_maps in all_maps.items():
+                    dset = self[dset_name]
+                    nt = dset.global_shape[0]
+                    lt, et, st = mpiutil.split_m(nt, num_outfiles)
+                    lshape = (lt[fi],) + dset.global_shape[1:]
+                    layout = h5py.VirtualLayout(shape=lshape, dtype=dset.dtype)
+                    for ri, files_map in enumerate(proc_maps):
+                        for fj, start, stop in files_map:
+                            if fj == fi and stop > start:
+                                # use relative path so the output can be moved together with its shards
+                                shard = posixpath.basename(_shard_name(outfile, ri))
+                                layout[start:stop] = h5py.VirtualSource(shard, dset_name, shape=(stop-start,)+lshape[1:])
+                    f.create_virtual_dataset(dset_name, layout, fillvalue=0)
+                    # copy attrs of this dset
+                    memh5.copyattrs(dset.attrs, f[dset_name].attrs)
+
+    def _to_files_serial(self, outfiles, outfiles_maps, exclude=[], write_hints=True, libver='latest', layout=None):
+        ### procs write to the output files in turn
+
+        num_outfiles = len(outfiles)
+        # split output files among procs
+        for outfile in mpiutil.mpilist(outfiles, method='con', comm=self.comm):
+            # first write top level common attrs and datasets to file
+            with h5py.File(outfile, 'w', libver=libver) as f:
+                self._write_common_to_file(f, outfiles.index(outfile), num_outfiles, exclude, write_hints, layout=layout)
+
+        mpiutil.barrier(comm=self.comm)
+
+        # then write time ordered datasets, open each file only once per proc
+        sections = {}
+        for dset_name in sorted(outfiles_maps.keys()):
+            st = 0
+            for fi, start, stop in outfiles_maps[dset_name]:
+                et = st + (stop - start)
+                if stop > start:
+                    sections.setdefault(fi, []).append((dset_name, start, stop, st, et))
+                st = et
+
+        for ri in xrange(self.nproc):
+            if ri == self.rank:
+                for fi in sorted(sections.keys()):
+                    with h5py.File(outfiles[fi], 'r+', libver=libver) as f:
+                        for dset_name, start, stop, st, et in sections[fi]:
+                            f[dset_name][start:stop] = self._shared_array(dset_name)[st:et]
+            mpiutil.barrier(comm=self.comm)
+
+    def to_files(self, outfiles, exclude=[], check_status=True, write_hints=True, libver='latest', write_method='auto', layout=None):
         """Save the data hold in this container to files.
 
         Parameters
@@ -1119,11 +1844,28 @@ class BasicTod(memh5.MemDiskGroup):
             backwards compatibility, can be performance advantages. The 'earliest'
             option means that HDF5 will make a best effort to be backwards
             compatible. Default is 'latest'.
+        write_method : 'auto', 'mpio', 'vds' or 'serial', optional
+            How the time ordered datasets are written by the procs. 'mpio' makes
+            all procs write their own sections concurrently to the same files via
+            MPI-IO, which needs h5py built with parallel HDF5; 'vds' makes each
+            proc write its own sections concurrently to per-proc shard files
+            (named `outfile`.shard<rank>, which must be kept together with the
+            output files) and indexes them in the output files by virtual
+            datasets, which needs HDF5 >= 1.10, so the output files are not self
+            contained and 'vds' is only used if explicitly requested; 'serial'
+            makes procs write to the output files in turn. 'auto' chooses 'mpio'
+            if available, else 'serial', and always 'serial' for a single proc.
+            Default 'auto'.
+        layout : None or :class:`~tlpipe.timestream.storage_layout.StorageLayout`, optional
+            Chunking and compression of the time ordered datasets. Filters are
+            not applied with 'mpio'. Default None for contiguous datasets.
 
         """
 
         outfiles = ensure_file_list(outfiles)
-        num_outfiles = len(outfiles)
+
+        # the not yet read main data must be read to be saved
+        self.load_lazy()
 
         # first redistribute main_time_ordered_datasets to the first axis
         if self.main_data_dist_axis != 0:
@@ -1133,65 +1875,52 @@ class BasicTod(memh5.MemDiskGroup):
         if check_status:
             self.check_status()
 
-        # split output files among procs
-        for fi, outfile in enumerate(mpiutil.mpilist(outfiles, method='con', comm=self.comm)):
-            # first write top level common attrs and datasets to file
-            with h5py.File(outfile, 'w', libver=libver) as f:
-
-                # write hints if required
-                if write_hints:
-                    hint_keys = [ key for key in self.__class__.__dict__.keys() if re.match(self.hints_pattern, key) ]
-                    hint_dict = { key: getattr(self, key) for key in hint_keys }
-                    f.attrs['hints'] = pickle.dumps(hint_dict)
-
-                # write top level common attrs
-                for attrs_name, attrs_value in self.attrs.iteritems():
-                    if attrs_name in exclude:
-                        continue
-                    if attrs_name not in self.time_ordered_attrs:
-                        f.attrs[attrs_name] = self.attrs[attrs_name]
-
-                for dset_name, dset in self.iteritems():
-                    if dset_name in exclude:
-                        continue
-                    # write top level common datasets
-                    if dset_name not in self.time_ordered_datasets.keys():
-                        f.create_dataset(dset_name, data=dset, shape=dset.shape, dtype=dset.dtype)
-                    # initialize time ordered datasets
-                    else:
-                        nt = dset.global_shape[0]
-                        lt, et, st = mpiutil.split_m(nt, num_outfiles)
-                        lshape = (lt[fi],) + dset.global_shape[1:]
-                        f.create_dataset(dset_name, lshape, dtype=dset.dtype)
-                        f[dset_name][:] = np.array(0.0).astype(dset.dtype)
-
-                    # copy attrs of this dset
-                    memh5.copyattrs(dset.attrs, f[dset_name].attrs)
-
-        mpiutil.barrier(comm=self.comm)
-
-        # then write time ordered datasets
-        for dset_name, dset in self.iteritems():
+        if write_method == 'auto':
+            if self.nproc == 1:
+                write_method = 'serial'
+            elif h5py.get_config().mpi and self.comm is not None:
+                write_method = 'mpio'
+            else:
+                write_method = 'serial'
+        elif write_method == 'mpio':
+            if not h5py.get_config().mpi:
+                raise RuntimeError('Can not write with MPI-IO as h5py is not built with parallel HDF5')
+            if self.comm is None:
+                raise RuntimeError('Can not write with MPI-IO without a MPI communicator')
+        elif write_method == 'vds':
+            if not hasattr(h5py, 'VirtualLayout'):
+                raise RuntimeError('Can not write virtual datasets as the h5py version does not support them')
+        elif write_method != 'serial':
+            raise ValueError('Unknown write_method %s' % write_method)
+
+        # get the files map of each time ordered dataset
+        outfiles_maps = {}
+        for dset_name in self.iterkeys():
             if dset_name in exclude:
                 continue
             if dset_name in self.time_ordered_datasets.keys():
-                dset_shape, dset_type, outfiles_map = self._get_output_info(dset_name, num_outfiles)
-
-                st = 0
-                for ri in xrange(self.nproc):
-                    if ri == self.rank:
-                        for fi, start, stop in outfiles_map:
+                dset_shape, dset_type, outfiles_maps[dset_name] = self._get_output_info(dset_name, len(outfiles))
 
-                            et = st + (stop - start)
-                            with h5py.File(outfiles[fi], 'r+', libver=libver) as f:
-                                f[dset_name][start:stop] = self[dset_name].local_data[st:et]
-                            st = et
-                    mpiutil.barrier(comm=self.comm)
+        if write_method == 'mpio':
+            self._to_files_mpio(outfiles, outfiles_maps, exclude, write_hints, libver, layout)
+        elif write_method == 'vds':
+            self._to_files_vds(outfiles, outfiles_maps, exclude, write_hints, libver, layout)
+        else:
+            self._to_files_serial(outfiles, outfiles_maps, exclude, write_hints, libver, layout)
 
-                # mpiutil.barrier(comm=self.comm)
+        mpiutil.barrier(comm=self.comm)
 
     def copy(self):
-        """Return a deep copy of this container."""
+        """Return a deep copy of this container.
+
+        The datasets of the copy share the data with the datasets of this
+        container until either of them accesses its data (copy-on-write, see
+        :func:`share_dataset`), so the datasets not changed later are never
+        copied.
+        """
+
+        # the not yet read main data must be read to be copied
+        self.load_lazy()
 
         cont = self.__class__(dist_axis=self.main_data_dist_axis, comm=self.comm)
 
@@ -1206,14 +1935,45 @@ class BasicTod(memh5.MemDiskGroup):
 
         # copy datasets
         for dset_name, dset in self.iteritems():
-            cont.create_dataset(dset_name, data=dset.data.copy())
+            cont.create_dataset(dset_name, data=_shared_data(dset))
+            share_dataset(dset, cont[dset_name])
             memh5.copyattrs(dset.attrs, cont[dset_name].attrs)
 
         return cont
 
 
 
-    def data_operate(self, func, op_axis=None, axis_vals=0, full_data=False, copy_data=False, keep_dist_axis=False, **kwargs):
+    def _blocks(self, axis, block_bytes=None):
+        ### split the local main data along `axis` into blocks of consecutive
+        ### sections of about `block_bytes` bytes, return a list of (slice of
+        ### local indices, local indices, global indices)
+        if block_bytes is None:
+            block_bytes = BLOCK_BYTES
+        inds = list(self._global_array(self.main_data_name).enumerate(axis))
+        local_array = self._shared_array(self.main_data_name)
+        section_bytes = local_array.nbytes / max(1, local_array.shape[axis])
+        size = max(1, int(block_bytes / max(1, section_bytes)))
+
+        blocks = []
+        for st in xrange(0, len(inds), size):
+            et = min(len(inds), st + size)
+            linds = np.array([ li for (li, gi) in inds[st:et] ], dtype=int)
+            ginds = np.array([ gi for (li, gi) in inds[st:et] ], dtype=int)
+            blocks.append((slice(linds[0], linds[-1]+1), linds, ginds))
+
+        return blocks
+
+    def _block_axis_vals(self, axis_vals, sel):
+        ### axis values corresponding to the local section `sel`
+        if isinstance(axis_vals, memh5.MemDataset):
+            # use the new dataset which may be different from axis_vals if it is redistributed
+            return self[axis_vals.name].local_data[sel]
+        elif hasattr(axis_vals, '__iter__'):
+            return axis_vals[sel]
+        else:
+            return axis_vals
+
+    def data_operate(self, func, op_axis=None, axis_vals=0, full_data=False, copy_data=False, keep_dist_axis=False, batch=False, block_bytes=None, **kwargs):
         """A basic data operation interface.
 
         You can use this method to do some constrained operations to the main data
@@ -1249,11 +2009,27 @@ class BasicTod(memh5.MemDiskGroup):
         keep_dist_axis : bool, optional
             Whether to redistribute main data to the original dist axis if the
             dist axis has changed during the operation. Default False.
+        batch : bool, optional
+            If True, `func` is called on blocks of consecutive sections along
+            `op_axis` instead of on each section, which saves the overhead of
+            the many Python calls. The array passed to `func` then keeps the
+            `op_axis`, and the local index, global index and axis value are
+            arrays for the sections of the block. For a tuple of axes, the
+            blocks are along the first axis and contain all local sections of
+            the other axes, and the indices and axis values are tuples of
+            arrays. Default False.
+        block_bytes : None or integer, optional
+            Approximate bytes of a block of the main data if `batch` is True.
+            Default None to use :data:`BLOCK_BYTES`.
         \*\*kwargs : any other arguments
             Any other arguments that will passed to `func`.
 
         """
 
+        if not copy_data:
+            # func changes the main data in place
+            self._own_dataset(self.main_data_name)
+
         if op_axis is None:
             if copy_data:
                 func(self.main_data.local_data.copy(), self, **kwargs)
@@ -1265,19 +2041,19 @@ class BasicTod(memh5.MemDiskGroup):
             if full_data:
                 original_dist_axis = self.main_data_dist_axis
                 self.redistribute(axis)
-            for lind, gind in self.main_data.data.enumerate(axis):
-                data_sel[axis] = lind
-                if isinstance(axis_vals, memh5.MemDataset):
-                    # use the new dataset which may be different from axis_vals if it is redistributed
-                    axis_val = self[axis_vals.name].local_data[lind]
-                elif hasattr(axis_vals, '__iter__'):
-                    axis_val = axis_vals[lind]
-                else:
-                    axis_val = axis_vals
+            if batch:
+                blocks = self._blocks(axis, block_bytes)
+            else:
+                blocks = [ (lind, lind, gind) for (lind, gind) in self._global_array(self.main_data_name).enumerate(axis) ]
+            for sel, lind, gind in blocks:
+                data_sel[axis] = sel
+                axis_val = self._block_axis_vals(axis_vals, sel)
+                # read only this section if the main data is lazily loaded
+                self._load_lazy_sections(axis, np.atleast_1d(lind).tolist())
                 if copy_data:
-                    func(self.main_data.local_data[data_sel].copy(), lind, gind, axis_val, self, **kwargs)
+                    func(self._shared_array(self.main_data_name)[tuple(data_sel)].copy(), lind, gind, axis_val, self, **kwargs)
                 else:
-                    func(self.main_data.local_data[data_sel], lind, gind, axis_val, self, **kwargs)
+                    func(self._local_array(self.main_data_name)[tuple(data_sel)], lind, gind, axis_val, self, **kwargs)
             if full_data and keep_dist_axis:
                 self.redistribute(original_dist_axis)
         elif isinstance(op_axis, tuple):
@@ -1291,24 +2067,28 @@ class BasicTod(memh5.MemDiskGroup):
                     # choose the longest axis in axes as the new dist axis
                     new_dist_axis = axes[np.argmax(axes_len)]
                     self.redistribute(new_dist_axis)
-            linds = [ [ li for (li, gi) in self.main_data.data.enumerate(axis) ] for axis in axes ]
-            ginds = [ [ gi for (li, gi) in self.main_data.data.enumerate(axis) ] for axis in axes ]
-            n_axes = len(axes)
-            for lind, gind in zip(itertools.product(*linds), itertools.product(*ginds)):
+            main_array = self._global_array(self.main_data_name)
+            if batch:
+                # blocks along the first axis with all sections of the other axes
+                rest = [ np.array([ (li, gi) for (li, gi) in main_array.enumerate(axis) ], dtype=int).reshape(-1, 2) for axis in axes[1:] ]
+                blocks = []
+                for sel, linds, ginds in self._blocks(axes[0], block_bytes):
+                    blocks.append(((sel,) + (slice(None),) * len(rest), (linds,) + tuple(r[:, 0] for r in rest), (ginds,) + tuple(r[:, 1] for r in rest)))
+            else:
+                linds = [ [ li for (li, gi) in main_array.enumerate(axis) ] for axis in axes ]
+                ginds = [ [ gi for (li, gi) in main_array.enumerate(axis) ] for axis in axes ]
+                blocks = [ (lind, lind, gind) for lind, gind in zip(itertools.product(*linds), itertools.product(*ginds)) ]
+            for sel, lind, gind in blocks:
                 axis_val = ()
                 for ai, axis in enumerate(axes):
-                    data_sel[axis] = lind[ai]
-                    if isinstance(axis_vals[ai], memh5.MemDataset):
-                        # use the new dataset which may be different from axis_vals if it is redistributed
-                        axis_val += (self[axis_vals[ai].name].local_data[lind[ai]],)
-                    elif hasattr(axis_vals[ai], '__iter__'):
-                        axis_val += (axis_vals[ai][lind[ai]],)
-                    else:
-                        axis_val += (axis_vals[ai],)
+                    data_sel[axis] = sel[ai]
+                    axis_val += (self._block_axis_vals(axis_vals[ai], sel[ai]),)
+                # read only the sections along the first axis if the main data is lazily loaded
+                self._load_lazy_sections(axes[0], np.atleast_1d(lind[0]).tolist())
                 if copy_data:
-                    func(self.main_data.local_data[data_sel].copy(), lind, gind, axis_val, self, **kwargs)
+                    func(self._shared_array(self.main_data_name)[tuple(data_sel)].copy(), lind, gind, axis_val, self, **kwargs)
                 else:
-                    func(self.main_data.local_data[data_sel], lind, gind, axis_val, self, **kwargs)
+                    func(self._local_array(self.main_data_name)[tuple(data_sel)], lind, gind, axis_val, self, **kwargs)
             if full_data and keep_dist_axis:
                 self.redistribute(original_dist_axis)
         else:
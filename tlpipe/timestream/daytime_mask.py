@@ -21,6 +21,8 @@ class Mask(tod_task.TaskTimestream):
 
     prefix = 'dm_'
 
+    _cacheable = True
+
     def process(self, ts):
 
         mask_time_range = self.params['mask_time_range']
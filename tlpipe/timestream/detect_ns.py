@@ -61,7 +61,9 @@ class Detect(tod_task.TaskTimestream):
         auto_inds = [bl_ind] + auto_inds
 
         for bl_ind in auto_inds:
-            vis = np.ma.array(rt.local_vis[:, :, bl_ind].real, mask=rt.local_vis_mask[:, :, bl_ind])
+            # read only this baseline if the main data is lazily loaded
+            vis = rt.local_section(rt.main_data_name, 'baseline', bl_ind).real
+            vis = np.ma.array(vis, mask=rt.local_vis_mask[:, :, bl_ind])
             cnt = vis.count() # number of not masked vals
             total_cnt = mpiutil.allreduce(cnt)
             vis_shp = rt.vis.shape
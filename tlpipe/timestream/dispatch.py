@@ -9,9 +9,13 @@ Inheritance diagram
 """
 
 import itertools
+import weakref
 import numpy as np
 import h5py
 import tod_task
+import file_index
+from container import open_file
+from prefetch import byte_ranges, Prefetcher
 from tlpipe.core import constants as const
 
 from caput import mpiutil
@@ -32,6 +36,14 @@ class Dispatch(tod_task.TaskTimestream):
         This usually should be the first task in the input pipe file to select
         and load the data from input data files for other tasks.
 
+    The time coverage of the files in each group is indexed once, and the files
+    are kept open across iterations if `keep_open` is True. A file is not
+    closed while a lazily loaded tod dispatched before still reads from it.
+    If `prefetch` is True, the data of the next iteration in the same file
+    group is read in background (to the page cache of the OS, each process
+    reads its share of the time range) while the other tasks work on the
+    current data.
+
     .. note::
         Current this task only works for a continuously observed data sets.
         Works need to do to make it work also for data observed in dis-continuous
@@ -44,10 +56,22 @@ class Dispatch(tod_task.TaskTimestream):
                     'extra_inttime': 150, # extra int time to ensure smooth transition in the two ends
                     'exclude_bad': True, # exclude bad channels
                     'drop_days': 0.0, # drop data if time is less than this factor of days
+                    'keep_open': True, # keep the input files open across iterations
+                    'prefetch': True, # read the data of the next iteration in background
                   }
 
     prefix = 'dp_'
 
+    @property
+    def cacheable(self):
+        # the output depends on the previous iterations
+        return False
+
+    @property
+    def forkable(self):
+        # the state is changed in each iteration
+        return False
+
     def __init__(self, parameter_file_or_dict=None, feedback=2):
 
         super(Dispatch, self).__init__(parameter_file_or_dict, feedback)
@@ -61,6 +85,15 @@ class Dispatch(tod_task.TaskTimestream):
         # record start RA for later use
         self.start_ra = None
 
+        # number of time points of the files in each group
+        self._grp_nts = {}
+        # opened files, {file name: h5py.File}
+        self._files = {}
+        # the dispatched tods, which may still read the opened files if
+        # lazily loaded
+        self._tods = weakref.WeakSet()
+        self._prefetcher = None
+
     def _init_input_files(self):
         input_files = self.params['input_files']
         start = self.params['start']
@@ -148,6 +181,113 @@ class Dispatch(tod_task.TaskTimestream):
         self.input_files = list(itertools.chain(*self.input_grps)) # flat input_grps
 
 
+    def checkpoint_state(self, checkpoint_dir):
+        state = super(Dispatch, self).checkpoint_state(checkpoint_dir)
+        for name in ('grp_cnt', 'next_grp', 'int_time', 'start_ra', 'abs_start', 'abs_stop'):
+            state[name] = getattr(self, name, None)
+        return state
+
+    def restore_state(self, state):
+        super(Dispatch, self).restore_state(state)
+        for name in ('grp_cnt', 'next_grp', 'int_time', 'start_ra', 'abs_start', 'abs_stop'):
+            setattr(self, name, state[name])
+
+    def _group_files(self, grp, start=0, stop=None):
+        ### files of group `grp`, the ones that contain time points from
+        ### `start` to `stop` are opened if keep_open, others are file names
+        input_files = self.input_grps[grp]
+        if not self.params['keep_open']:
+            return input_files
+
+        stop = sum(self._group_nts(grp)) if stop is None else stop
+        cum_nts = np.cumsum([0] + self._group_nts(grp))
+        needed = [ fl for fi, fl in enumerate(input_files) if cum_nts[fi] < stop and cum_nts[fi+1] > start ]
+        # close files that are not needed now, except the ones still read by
+        # the lazily loaded tods held by other tasks
+        in_use = self._files_in_use()
+        for fl in self._files.keys():
+            if not fl in needed and not id(self._files[fl]) in in_use:
+                self._files.pop(fl).close()
+        for fl in needed:
+            if not fl in self._files:
+                self._files[fl] = h5py.File(fl, self.params['mode'])
+
+        return [ self._files.get(fl, fl) for fl in input_files ]
+
+    def _files_in_use(self):
+        ### ids of the opened files the live lazily loaded tods read from
+        return set(id(fh) for tod in self._tods if tod.lazy for fh in tod.infiles)
+
+    def _group_nts(self, grp):
+        ### number of time points of the files in group `grp`
+        if not grp in self._grp_nts:
+            name = self._Tod_class._main_data_name_
+            infos = file_index.file_info(self.input_grps[grp], comm=mpiutil.world, index_dir=self.index_dir, main_data_name=name)
+            self._grp_nts[grp] = [ info['datasets'][name]['shape'][0] for info in infos ]
+
+        return self._grp_nts[grp]
+
+    def _group_range(self, grp):
+        ### absolute start and stop of group `grp` relative to its first file
+        nt = sum(self._group_nts(grp))
+        start = self.start[grp]
+        stop = self.stop[grp]
+
+        tmp_start = start if start >=0 else start + nt
+        if tmp_start >= 0 and tmp_start < nt:
+            start = tmp_start
+        else:
+            raise ValueError('Invalid start %d for nt = %d' % (start, nt))
+        stop = nt if stop is None else stop
+        tmp_stop = stop if stop >=0 else stop + nt
+        if tmp_stop >= 0 and tmp_stop <= nt:
+            stop = tmp_stop
+        else:
+            raise ValueError('Invalid stop %d for nt = %d' % (stop, nt))
+        if start > stop:
+            raise ValueError('Invalid start %d and stop %d for nt = %d' % (start, stop, nt))
+
+        return start, stop
+
+    def _iteration_range(self, iteration):
+        ### start and stop of `iteration` relative to the first file of the group
+        days = self.params['days']
+        extra_inttime = self.params['extra_inttime']
+        this_start = self.abs_start + np.int(np.around(iteration * days * const.sday / self.int_time))
+        this_stop = min(self.abs_stop, self.abs_start + np.int(np.around((iteration+1) * days * const.sday / self.int_time)) + 2*extra_inttime)
+
+        return this_start, this_stop
+
+    def _start_prefetch(self, grp, start, stop, select=None):
+        ### start to read the time points from `start` to `stop` of group `grp`
+        ### in background, each process reads its own part, only the selection
+        ### `select` of the other axes of the main data
+        self._stop_prefetch()
+        if start >= stop:
+            return
+        lt, st, et = mpiutil.split_local(stop - start)
+        st, et = start + st, start + et
+
+        names = self._Tod_class._main_axes_ordered_datasets_.keys()
+        file_ranges = []
+        nt0 = 0
+        for fl, nt in zip(self.input_grps[grp], self._group_nts(grp)):
+            if nt0 < et and nt0 + nt > st:
+                with open_file(self._files.get(fl, fl), 'r') as f:
+                    ranges = byte_ranges(f, names, st - nt0, et - nt0, { self._Tod_class._main_data_name_: select })
+                    if len(ranges) > 0:
+                        file_ranges.append((f.filename, ranges))
+            nt0 += nt
+
+        self._prefetcher = Prefetcher(file_ranges)
+        self._prefetcher.start()
+
+    def _stop_prefetch(self):
+        ### stop the background reading
+        if self._prefetcher is not None:
+            self._prefetcher.stop()
+            self._prefetcher = None
+
     def read_process_write(self, tod):
         """Reads input, executes any processing and writes output."""
 
@@ -164,7 +304,6 @@ class Dispatch(tod_task.TaskTimestream):
     def read_input(self):
         """Method for (maybe iteratively) reading data from input data files."""
 
-        days = self.params['days']
         extra_inttime = self.params['extra_inttime']
         drop_days = self.params['drop_days']
         mode = self.params['mode']
@@ -180,24 +319,22 @@ class Dispatch(tod_task.TaskTimestream):
             self.abs_start = None
             self.abs_stop = None
 
-        input_files = self.input_grps[self.grp_cnt]
-        start = self.start[self.grp_cnt]
-        stop = self.stop[self.grp_cnt]
+        # stop reading the data of this iteration in background, it is
+        # (maybe partially) read by now
+        self._stop_prefetch()
+
+        grp = self.grp_cnt
 
         if self.int_time is None:
             # NOTE: here assume all files have the same int_time
-            with h5py.File(self.input_files[0], 'r') as f:
+            with open_file(self._files.get(self.input_files[0], self.input_files[0]), 'r') as f:
                 self.int_time = f.attrs['inttime']
 
         if self.abs_start is None or self.abs_stop is None:
-            tmp_tod = self._Tod_class(input_files, mode, start, stop, dist_axis)
-            self.abs_start = tmp_tod.main_data_start
-            self.abs_stop = tmp_tod.main_data_stop
-            del tmp_tod
+            self.abs_start, self.abs_stop = self._group_range(grp)
 
         iteration = self.iteration if self.iterable else 0
-        this_start = self.abs_start + np.int(np.around(iteration * days * const.sday / self.int_time))
-        this_stop = min(self.abs_stop, self.abs_start + np.int(np.around((iteration+1) * days * const.sday / self.int_time)) + 2*extra_inttime)
+        this_start, this_stop = self._iteration_range(iteration)
         if  this_stop >= self.abs_stop:
             self.next_grp = True
             self.grp_cnt += 1
@@ -216,11 +353,20 @@ class Dispatch(tod_task.TaskTimestream):
                 print 'Not enough span time (less than `extra_inttime`), drop it...'
             return None
 
-        tod = self._Tod_class(input_files, mode, this_start, this_stop, dist_axis)
+        input_files = self._group_files(grp, this_start, this_stop)
+        # the files of the group have been indexed, so only the selected ones are opened
+        tod = self._Tod_class(input_files, mode, this_start, this_stop, dist_axis, use_index=True, index_dir=self.index_dir)
 
         tod = self.data_select(tod)
 
-        tod.load_all() # load in all data
+        tod.load_all(self.params['lazy']) # load in all data, the main data may be lazily loaded
+        if tod.lazy:
+            self._tods.add(tod)
+
+        # read the data of the next iteration in the same group in background
+        if self.params['prefetch'] and self.iterable and not self.next_grp:
+            next_start, next_stop = self._iteration_range(iteration + self.iter_step)
+            self._start_prefetch(grp, next_start, next_stop, tod.main_data_select[1:])
 
         if self.start_ra is None: # the first iteration
             ra_dec = mpiutil.gather_array(tod['ra_dec'].local_data, root=None)
@@ -234,7 +380,7 @@ class Dispatch(tod_task.TaskTimestream):
         super(Dispatch, self).data_select(tod)
 
         if self.params['exclude_bad']:
-            with h5py.File(self.input_files[0], 'r') as f:
+            with open_file(tod.infiles[0], 'r') as f:
                 channo = f['channo'][:]
                 feedno = f['feedno'][:]
                 try:
@@ -264,3 +410,15 @@ class Dispatch(tod_task.TaskTimestream):
         :class:`~tlpipe.timestream.raw_timestream.RawTimestream` object."""
 
         return super(Dispatch, self).process(rt)
+
+    def finish(self):
+        """Close the opened input files."""
+        self._stop_prefetch()
+        # read the rest of the lazily loaded tods still held by other tasks
+        # before their files are closed
+        for tod in list(self._tods):
+            if tod.lazy:
+                tod.load_lazy()
+        for fh in self._files.values():
+            fh.close()
+        self._files = {}
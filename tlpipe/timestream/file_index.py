@@ -0,0 +1,214 @@
+"""Index of time ordered data files.
+
+The information needed to select time ordered data from a list of files, i.e.,
+the shape and data type of the datasets of each file, its time range and the
+hints used to construct the data container, is recorded in an index, so the
+files that do not overlap the selected time range need not be opened at all.
+
+An entry of the index is identified by the base name of the data file and is
+valid as long as the size and the modification time of the file are
+unchanged. Missing or outdated entries are built from the data files when
+they are requested. The index of a data directory is kept in memory for the
+life of the process, and if an index directory is given (e.g., under the
+output directory of the pipeline), also saved there in a small file (named
+by the hash of the data directory), so it is reused by later runs. Nothing
+is ever written into the data directories.
+
+"""
+
+import os
+import json
+import hashlib
+import base64
+import itertools
+import h5py
+from caput import mpiutil
+
+
+INDEX_VERSION = 1
+
+# the indices kept in memory, {(data directory, index directory): FileIndex}
+_indices = {}
+
+
+def _file_name(fl):
+    ### absolute file name of a file name or an opened h5py.File
+    if isinstance(fl, h5py.File):
+        fl = fl.filename
+    return os.path.abspath(fl)
+
+def _file_stat(filename):
+    ### size and modification time of a file
+    st = os.stat(filename)
+    return st.st_size, repr(st.st_mtime)
+
+def _scan(filename, main_data_name):
+    ### build the index entry of a file, the time range is got from the
+    ### length of the main data
+    size, mtime = _file_stat(filename)
+    with h5py.File(filename, 'r') as f:
+        datasets = {}
+        for name, dset in f.iteritems():
+            if isinstance(dset, h5py.Dataset):
+                datasets[name] = { 'shape': list(dset.shape), 'dtype': str(dset.dtype) }
+        try:
+            nt = f[main_data_name].shape[0]
+            t0 = float(f.attrs['sec1970'])
+            time_range = [ t0, t0 + nt * float(f.attrs['inttime']) ]
+        except (KeyError, TypeError, ValueError):
+            time_range = None
+        hints = base64.b64encode(f.attrs['hints']) if 'hints' in f.attrs else None
+
+    return { 'size': size, 'mtime': mtime, 'datasets': datasets, 'time_range': time_range, 'hints': hints }
+
+
+class FileIndex(object):
+    """Index of the time ordered data files in a directory.
+
+    Parameters
+    ----------
+    directory : string
+        The data directory.
+    index_dir : None or string, optional
+        The directory to save the index file in. If None, the index is only
+        kept in memory. Default None.
+
+    """
+
+    def __init__(self, directory, index_dir=None):
+
+        self.directory = os.path.abspath(directory)
+        if index_dir is None:
+            self.filename = None
+        else:
+            self.filename = os.path.join(os.path.abspath(index_dir), '%s.json' % hashlib.sha1(self.directory).hexdigest())
+        self.entries = {}
+        self.changed = False
+
+        if self.filename is None:
+            return
+        try:
+            with open(self.filename, 'r') as f:
+                index = json.load(f)
+            if index.get('version') == INDEX_VERSION and index.get('directory') == self.directory:
+                self.entries = index['files']
+        except (IOError, ValueError, KeyError):
+            # no or an invalid index file, will be rebuilt
+            pass
+
+    def is_valid(self, filename):
+        """Whether the entry of data file `filename` exists and is up to date."""
+        entry = self.entries.get(os.path.basename(filename))
+        if entry is None:
+            return False
+        try:
+            return [ entry['size'], entry['mtime'] ] == list(_file_stat(filename))
+        except OSError:
+            return False
+
+    def get(self, filename):
+        """Return the entry of data file `filename`."""
+        return self.entries[os.path.basename(filename)]
+
+    def set(self, filename, entry):
+        """Set the entry of data file `filename`."""
+        self.entries[os.path.basename(filename)] = entry
+        self.changed = True
+
+    def save(self):
+        """Write the index file if it has been changed."""
+        if not self.changed or self.filename is None:
+            return
+
+        tmp_file = '%s.%d.tmp' % (self.filename, os.getpid())
+        try:
+            index_dir = os.path.dirname(self.filename)
+            if not os.path.isdir(index_dir):
+                os.makedirs(index_dir)
+            with open(tmp_file, 'w') as f:
+                json.dump({ 'version': INDEX_VERSION, 'directory': self.directory, 'files': self.entries }, f)
+            os.rename(tmp_file, self.filename)
+            self.changed = False
+        except (IOError, OSError):
+            # may have no write permission to the index directory
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+
+def _get_index(directory, index_dir=None):
+    ### the index of data directory `directory`, kept in memory
+    key = (os.path.abspath(directory), None if index_dir is None else os.path.abspath(index_dir))
+    if not key in _indices:
+        _indices[key] = FileIndex(directory, index_dir)
+
+    return _indices[key]
+
+
+def file_info(files, comm=None, index_dir=None, main_data_name='vis'):
+    """Return the index entries of the data files `files`.
+
+    The index files are read and written by the rank 0 process of `comm`
+    and the outdated entries are rebuilt by all processes in parallel. This
+    must be called by all processes in `comm`.
+
+    Parameters
+    ----------
+    files : list of strings or h5py.File objects
+        The data files.
+    comm : None or MPI.Comm, optional
+        MPI Communicator. Default None for no communication.
+    index_dir : None or string, optional
+        The directory to save the index files in, see :class:`FileIndex`.
+        Default None to keep the index only in memory.
+    main_data_name : string, optional
+        Name of the main data, whose length gives the time range of a file.
+        Default 'vis'.
+
+    Returns
+    -------
+    entries : list of dicts
+        The index entries of `files`, each has items 'size', 'mtime',
+        'datasets' (a dict with the 'shape' and 'dtype' of each dataset),
+        'time_range' (start and stop time in seconds since 1970, or None) and
+        'hints' (base64 encoded, or None).
+
+    """
+    filenames = [ _file_name(fl) for fl in files ]
+    rank0 = comm is None or comm.rank == 0
+
+    if rank0:
+        indices = {}
+        for fl in filenames:
+            directory = os.path.dirname(fl)
+            if not directory in indices:
+                indices[directory] = _get_index(directory, index_dir)
+        index_of = lambda fl: indices[os.path.dirname(fl)]
+        outdated = sorted(set(fl for fl in filenames if not index_of(fl).is_valid(fl)))
+    else:
+        outdated = None
+    if comm is not None:
+        outdated = comm.bcast(outdated, root=0)
+
+    # rebuild the outdated entries in parallel
+    entries = [ (fl, _scan(fl, main_data_name)) for fl in mpiutil.mpilist(outdated, method='con', comm=comm) ]
+    if comm is not None:
+        entries = list(itertools.chain(*comm.allgather(entries)))
+
+    if rank0:
+        for fl, entry in entries:
+            index_of(fl).set(fl, entry)
+        for index in indices.values():
+            index.save()
+        entries = [ index_of(fl).get(fl) for fl in filenames ]
+    else:
+        entries = None
+    if comm is not None:
+        entries = comm.bcast(entries, root=0)
+
+    return entries
+
+
+def file_hints(entry):
+    """Return the pickled hints string of an index entry, None if no hints."""
+    hints = entry['hints']
+    return None if hints is None else base64.b64decode(hints)
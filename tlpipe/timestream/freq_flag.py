@@ -31,6 +31,8 @@ class Flag(tod_task.TaskTimestream):
 
     prefix = 'ff_'
 
+    _cacheable = True
+
     def process(self, ts):
 
         freq_points = self.params['freq_points']
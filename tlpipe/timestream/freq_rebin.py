@@ -32,6 +32,8 @@ class Rebin(tod_task.TaskTimestream):
 
     prefix = 'rb_'
 
+    _cacheable = True
+
     def process(self, ts):
 
         assert isinstance(ts, Timestream), '%s only works for Timestream object' % self.__class__.__name__
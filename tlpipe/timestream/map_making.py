@@ -48,6 +48,7 @@ class MapMaking(tod_task.TaskTimestream):
                     'beam_dir': 'map/bt',
                     'gen_invbeam': True,
                     'noise_weight': True,
+                    'bt_nprocs': 1, # local worker processes to generate the beam transfers
                     'ts_dir': 'map/ts',
                     'ts_name': 'ts',
                     'simulate': False,
@@ -78,6 +79,7 @@ class MapMaking(tod_task.TaskTimestream):
         beam_dir = output_path(self.params['beam_dir'])
         gen_inv = self.params['gen_invbeam']
         noise_weight = self.params['noise_weight']
+        bt_nprocs = self.params['bt_nprocs']
         ts_dir = output_path(self.params['ts_dir'])
         ts_name = self.params['ts_name']
         simulate = self.params['simulate']
@@ -161,15 +163,8 @@ class MapMaking(tod_task.TaskTimestream):
             redundancy = tel.redundancy
 
             # reorder bls according to allpairs
-            vis_tmp = np.zeros_like(vis)
-            bls = [ tuple(bl) for bl in ts['blorder'][:] ]
-            for ind, (a1, a2) in enumerate(allpairs):
-                try:
-                    b_ind = bls.index((feeds[a1], feeds[a2]))
-                    vis_tmp[:, :, ind] = vis[:, :, b_ind]
-                except ValueError:
-                    b_ind = bls.index((feeds[a2], feeds[a1]))
-                    vis_tmp[:, :, ind] = vis[:, :, b_ind].conj()
+            b_inds, b_conj = ts.bl_index.lookup(feeds[np.asarray(allpairs)])
+            vis_tmp = np.where(b_conj, vis[:, :, b_inds].conj(), vis[:, :, b_inds])
 
             # average over redundancy
             vis_stream = np.zeros(vis.shape[:-1]+(len(redundancy),), dtype=vis_tmp.dtype)
@@ -183,6 +178,7 @@ class MapMaking(tod_task.TaskTimestream):
 
         # beamtransfer
         bt = beamtransfer.BeamTransfer(beam_dir, tel, noise_weight, True)
+        bt.nprocs = bt_nprocs
         bt.generate()
 
         if simulate:
@@ -11,7 +11,7 @@ Inheritance diagram
 import os
 from datetime import datetime
 import numpy as np
-from scipy.interpolate import InterpolatedUnivariateSpline
+from scipy.interpolate import make_interp_spline
 import tod_task
 from raw_timestream import RawTimestream
 from tlpipe.utils.path_util import output_path
@@ -97,30 +97,23 @@ class NsCal(tod_task.TaskTimestream):
         else:
             freq_plt = [ fi for fi in freq_incl if not fi in freq_excl ]
 
-        rt.freq_and_bl_data_operate(self.cal, full_data=True, keep_dist_axis=False, bls_plt=bls_plt, freq_plt=freq_plt)
+        # operate on blocks of frequencies with all baselines
+        rt.freq_and_bl_data_operate(self.cal, full_data=True, keep_dist_axis=False, batch=True, bls_plt=bls_plt, freq_plt=freq_plt)
 
         return super(NsCal, self).process(rt)
 
     def cal(self, vis, vis_mask, li, gi, fbl, rt, **kwargs):
-        """Function that does the actual cal."""
+        """Function that does the actual cal for a block of frequencies."""
 
         num_mean = self.params['num_mean']
         plot_phs = self.params['plot_phs']
-        fig_prefix = self.params['fig_name']
-        rotate_xdate = self.params['rotate_xdate']
-        feed_no = self.params['feed_no']
-        tag_output_iter = self.params['tag_output_iter']
-        iteration = self.iteration
         bls_plt = kwargs['bls_plt']
         freq_plt = kwargs['freq_plt']
 
         if np.prod(vis.shape) == 0 :
             return
 
-        fi = gi[0] # freq idx for this cal
-        bl = tuple(fbl[1]) # bl for this cal
-
-        nt = vis.shape[0]
+        nt, nf, nbl = vis.shape
         on_time = rt['ns_on'].attrs['on_time']
         num_mean = min(num_mean, on_time-2)
         if num_mean <= 0:
@@ -136,65 +129,93 @@ class NsCal(tod_task.TaskTimestream):
         if inds[-1]+2 > nt-1: # no on data in the end to use
             inds = inds[:-1]
 
-        valid_inds = []
-        phase = []
-        for ind in inds:
+        # phase of each noise source on for all (freq, bl) of this block
+        valid = np.zeros((len(inds), nf*nbl), dtype=bool)
+        phase = np.zeros((len(inds), nf*nbl), dtype=np.float64)
+        for ii, ind in enumerate(inds):
             if ind == inds[0]: # the first ind
                 lower = max(0, ind-num_mean)
             else:
                 lower = ind - num_mean
+            if ind == inds[-1]: # the last ind
+                upper = min(nt, ind+2+num_mean)
+            else:
+                upper = ind + 2 + num_mean
             off_sec = np.ma.array(vis[lower:ind], mask=vis_mask[lower:ind])
-            if off_sec.count() > 0: # not all data in this section are masked
-                valid_inds.append(ind)
-                if ind == inds[-1]: # the last ind
-                    upper = min(nt, ind+2+num_mean)
-                else:
-                    upper = ind + 2 + num_mean
-                phase.append( np.angle(np.mean(vis[ind+2:upper]) - np.ma.mean(off_sec)) ) # in radians
-
-        # not enough valid data to do the ns_cal
-        if len(phase) <= 3:
-            vis_mask[:] = True # mask the vis as no ns_cal has done
-            return
+            # not all data in this section are masked
+            valid[ii] = (off_sec.count(axis=0) > 0).reshape(-1)
+            off_mean = np.ma.mean(off_sec, axis=0).filled(0)
+            phase[ii] = np.angle(np.mean(vis[ind+2:upper], axis=0) - off_mean).reshape(-1) # in radians
+
+        # interpolate the phase of the (freq, bl) with the same valid inds together
+        all_phase = np.zeros((nt, nf*nbl), dtype=np.float64)
+        failed = np.zeros(nf*nbl, dtype=bool)
+        groups = {}
+        for si in xrange(nf*nbl):
+            groups.setdefault(valid[:, si].tostring(), []).append(si)
+        for sis in groups.itervalues():
+            valid_inds = inds[valid[:, sis[0]]]
+            # not enough valid data to do the ns_cal
+            if len(valid_inds) <= 3:
+                failed[sis] = True
+                continue
+            phs = np.unwrap(phase[valid[:, sis[0]]][:, sis], axis=0) # unwrap 2pi discontinuity
+            all_phase[:, sis] = make_interp_spline(valid_inds, phs, k=3, axis=0)(np.arange(nt))
+
+        if plot_phs:
+            bls_plt = set(tuple(bl) for bl in bls_plt)
+            freq_plt = set(freq_plt)
+            for si in np.where(np.logical_not(failed))[0]:
+                fi, bi = divmod(si, nbl)
+                if tuple(fbl[1][bi]) in bls_plt and gi[0][fi] in freq_plt:
+                    valid_inds = inds[valid[:, si]]
+                    self.plot(all_phase[:, si], valid_inds, np.unwrap(phase[valid[:, si], si]), li[1][bi], fbl[0][fi], fbl[1][bi], rt)
+
+        # mask the vis as no ns_cal has done
+        fis, bis = np.unravel_index(np.where(failed)[0], (nf, nbl))
+        vis_mask[:, fis, bis] = True
+
+        vis[:] = vis * np.exp(-1.0J * all_phase).reshape(nt, nf, nbl)
+
+    def plot(self, all_phase, valid_inds, phase, lbi, freq, bl, rt):
+        """Plot the phase of a (freq, bl)."""
 
-        phase = np.unwrap(phase) # unwrap 2pi discontinuity
-
-        f = InterpolatedUnivariateSpline(valid_inds, phase)
-        all_phase = f(np.arange(nt))
-
-        if plot_phs and (bl in bls_plt and fi in freq_plt):
-            plt.figure()
-            fig, ax = plt.subplots()
-            ax_val = np.array([ datetime.fromtimestamp(sec) for sec in rt['sec1970'][:] ])
-            xlabel = '%s' % ax_val[0].date()
-            ax_val = mdates.date2num(ax_val)
-            ax.plot(ax_val, all_phase)
-            ax.plot(ax_val[valid_inds], phase, 'ro')
-            ax.xaxis_date()
-            date_format = mdates.DateFormatter('%H:%M')
-            ax.xaxis.set_major_formatter(date_format)
-            if rotate_xdate:
-                # set the x-axis tick labels to diagonal so it fits better
-                fig.autofmt_xdate()
-            else:
-                # reduce the number of tick locators
-                locator = MaxNLocator(nbins=6)
-                ax.xaxis.set_major_locator(locator)
-                ax.xaxis.set_minor_locator(AutoMinorLocator(2))
-            ax.set_xlabel(xlabel)
-            ax.set_ylabel(r'$\Delta \phi$ / radian')
-
-            if feed_no:
-                pol = rt['bl_pol'].local_data[li[1]]
-                bl = tuple(rt['true_blorder'].local_data[li[1]])
-                fig_name = '%s_%f_%d_%d_%s.png' % (fig_prefix, fbl[0], bl[0], bl[1], rt.pol_dict[pol])
-            else:
-                fig_name = '%s_%f_%d_%d.png' % (fig_prefix, fbl[0], fbl[1][0], fbl[1][1])
-            if tag_output_iter:
-                fig_name = output_path(fig_name, iteration=iteration)
-            else:
-                fig_name = output_path(fig_name)
-            plt.savefig(fig_name)
-            plt.close()
+        fig_prefix = self.params['fig_name']
+        rotate_xdate = self.params['rotate_xdate']
+        feed_no = self.params['feed_no']
+        tag_output_iter = self.params['tag_output_iter']
+        iteration = self.iteration
 
-        vis[:] = vis * np.exp(-1.0J * all_phase)
+        plt.figure()
+        fig, ax = plt.subplots()
+        ax_val = np.array([ datetime.fromtimestamp(sec) for sec in rt['sec1970'][:] ])
+        xlabel = '%s' % ax_val[0].date()
+        ax_val = mdates.date2num(ax_val)
+        ax.plot(ax_val, all_phase)
+        ax.plot(ax_val[valid_inds], phase, 'ro')
+        ax.xaxis_date()
+        date_format = mdates.DateFormatter('%H:%M')
+        ax.xaxis.set_major_formatter(date_format)
+        if rotate_xdate:
+            # set the x-axis tick labels to diagonal so it fits better
+            fig.autofmt_xdate()
+        else:
+            # reduce the number of tick locators
+            locator = MaxNLocator(nbins=6)
+            ax.xaxis.set_major_locator(locator)
+            ax.xaxis.set_minor_locator(AutoMinorLocator(2))
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(r'$\Delta \phi$ / radian')
+
+        if feed_no:
+            pol = rt['bl_pol'].local_data[lbi]
+            bl = tuple(rt['true_blorder'].local_data[lbi])
+            fig_name = '%s_%f_%d_%d_%s.png' % (fig_prefix, freq, bl[0], bl[1], rt.pol_dict[pol])
+        else:
+            fig_name = '%s_%f_%d_%d.png' % (fig_prefix, freq, bl[0], bl[1])
+        if tag_output_iter:
+            fig_name = output_path(fig_name, iteration=iteration)
+        else:
+            fig_name = output_path(fig_name)
+        plt.savefig(fig_name)
+        plt.close()
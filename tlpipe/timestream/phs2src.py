@@ -15,6 +15,7 @@ import tod_task
 import timestream
 
 from caput import mpiutil
+from tlpipe.core import ps_sim
 from tlpipe.utils.date_util import get_ephdate
 
 
@@ -38,6 +39,8 @@ class Phs2src(tod_task.TaskTimestream):
 
     prefix = 'p2s_'
 
+    _cacheable = True
+
     def process(self, ts):
 
         source = self.params['source']
@@ -86,29 +89,23 @@ class Phs2src(tod_task.TaskTimestream):
             print 'Phase to source %s.' % source
 
 
-        ts.time_and_bl_data_operate(self.phs, aa=aa, s=s)
+        # operate on blocks of time points with all baselines
+        sim = ps_sim.PointSourceSim(aa, feedno)
+        ts.time_and_bl_data_operate(self.phs, batch=True, sim=sim, s=s)
 
         return super(Phs2src, self).process(ts)
 
     def phs(self, vis, vis_mask, li, gi, tbl, ts, **kwargs):
-        """Function that does the actual phs."""
+        """Function that does the actual phs for a block of time points."""
 
-        t = tbl[0]
-        ai, aj = tbl[1]
-        aa = kwargs.get('aa')
+        times, bls = tbl
+        sim = kwargs.get('sim')
         s = kwargs.get('s')
 
-        feedno = ts['feedno'][:].tolist()
-        i = feedno.index(ai)
-        j = feedno.index(aj)
-
-        aa.set_jultime(t)
-        s.compute(aa)
-        # get fluxes vs. freq of the calibrator
-        # Sc = s.get_jys()
-        # get the topocentric coordinate of the calibrator at the current time
-        s_top = s.get_crds('top', ncrd=3)
-        # aa.sim_cache(cat.get_crds('eq', ncrd=3)) # for compute bm_response and sim
-        uij = aa.gen_uvw(i, j, src='z').squeeze() # (rj - ri)/lambda
-
-        vis[:] = vis / np.exp(-2.0J * np.pi * np.dot(s_top, uij))[:, np.newaxis], vis_mask
+        # the fringe exp(-2 pi i s_0 . uij) of the source for all time points
+        # and baselines of the block, computing the source position once for
+        # each time point
+        fringe = sim.fringes(s, times, [ tuple(bl) for bl in bls ]) # (nt, nfreq, nbl)
+
+        # divide by the unit-modulus fringe
+        vis[:] = vis * fringe.conj()[:, :, np.newaxis, :]
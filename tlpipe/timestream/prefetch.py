@@ -0,0 +1,179 @@
+"""Read ahead time ordered data files in background.
+
+The data that is going to be loaded (the next iteration of
+:class:`~tlpipe.timestream.dispatch.Dispatch`, or the next file of a
+container) is read in a background thread with plain file reads and then
+discarded, so it is in the page cache of the OS when it is loaded by h5py.
+As the thread does not call h5py or MPI, it can run along with any other work
+of the pipeline.
+
+"""
+
+import os
+import itertools
+import threading
+import numpy as np
+
+
+# a block of the inner axes of a contiguous dataset smaller than this is read
+# from the first to the last selected element, instead of element-wise
+MIN_RANGE_BYTES = 2**16
+
+
+def _merge_ranges(starts, sizes, gap=0):
+    ### merge the sorted byte ranges which overlap or have gaps not larger
+    ### than `gap`, return a list of (offset, size)
+    if len(starts) == 0:
+        return []
+    ends = starts + sizes
+    ends = np.maximum.accumulate(ends)
+    breaks = np.where(starts[1:] > ends[:-1] + gap)[0] + 1
+    firsts = np.concatenate([[0], breaks])
+    lasts = np.concatenate([breaks, [len(starts)]]) - 1
+
+    return zip(starts[firsts].tolist(), (ends[lasts] - starts[firsts]).tolist())
+
+
+def _contiguous_ranges(offset, shape, itemsize, inds):
+    ### byte ranges of the elements selected by the index arrays `inds` (one
+    ### for each axis) of a contiguous dataset at `offset` of the file
+    ndim = len(shape)
+    strides = [ itemsize * int(np.prod(shape[ax+1:])) for ax in xrange(ndim) ]
+
+    # enumerate the selected indices of the outer axes, and read from the
+    # first to the last selected element of the remaining inner axes
+    k = 1
+    while k < ndim and strides[k-1] > MIN_RANGE_BYTES:
+        k += 1
+    lo = sum(inds[ax][0] * strides[ax] for ax in xrange(k, ndim))
+    hi = sum(inds[ax][-1] * strides[ax] for ax in xrange(k, ndim)) + itemsize
+
+    starts = np.zeros((), dtype=np.int64)
+    for ax in xrange(k):
+        starts = np.add.outer(starts, inds[ax].astype(np.int64) * strides[ax])
+    starts = np.sort(starts.reshape(-1)) + (offset + lo)
+
+    return _merge_ranges(starts, np.full(len(starts), hi - lo, dtype=np.int64), MIN_RANGE_BYTES)
+
+
+def _chunked_ranges(dset, inds):
+    ### byte ranges of the chunks holding the elements selected by the index
+    ### arrays `inds` of a chunked dataset, None if chunk locations are not
+    ### available (need h5py >= 2.10 with HDF5 >= 1.10.5)
+    if not hasattr(dset.id, 'get_chunk_info_by_coord'):
+        return None
+
+    chunk_inds = [ np.unique(ind // c) for ind, c in zip(inds, dset.chunks) ]
+    starts, sizes = [], []
+    try:
+        for coord in itertools.product(*chunk_inds):
+            info = dset.id.get_chunk_info_by_coord(tuple(int(ci) * c for ci, c in zip(coord, dset.chunks)))
+            if info.byte_offset is not None:
+                starts.append(info.byte_offset)
+                sizes.append(info.size)
+    except RuntimeError:
+        return None
+    order = np.argsort(starts)
+
+    return _merge_ranges(np.array(starts, dtype=np.int64)[order], np.array(sizes, dtype=np.int64)[order])
+
+
+def byte_ranges(fh, names, start, stop, select=None):
+    """Return the byte ranges of the selected data of datasets.
+
+    Only the chunks (of a chunked dataset) or the pieces (of a contiguous
+    dataset) holding the selected data are included, so that only the data
+    that is going to be read is read ahead.
+
+    Parameters
+    ----------
+    fh : h5py.File
+        The opened data file.
+    names : list of strings
+        Names of the time ordered datasets, the ones not in `fh` are ignored.
+    start, stop : integer
+        Range of the time points (the first axis) of the datasets.
+    select : None or dict, optional
+        Selection of the other axes of the datasets, {name: a list of slices
+        or increasing index lists, one for each of the other axes}. All are
+        selected for datasets not in it. Default None.
+
+    Returns
+    -------
+    ranges : list of tuples
+        The byte ranges (offset, size) in the file.
+
+    """
+    select = select or {}
+    ranges = []
+    for name in names:
+        if not name in fh:
+            continue
+        dset = fh[name]
+        nt = dset.shape[0]
+        st, sp = max(0, start), min(nt, stop)
+        if st >= sp:
+            continue
+        sel = select.get(name)
+        if sel is None:
+            sel = [ slice(None) ] * (dset.ndim - 1)
+        inds = [ np.arange(st, sp) ] + [ np.arange(n)[s] for n, s in zip(dset.shape[1:], sel) ]
+        if any(len(ind) == 0 for ind in inds):
+            continue
+
+        if dset.chunks is None:
+            offset = dset.id.get_offset()
+            if offset is not None:
+                ranges.extend(_contiguous_ranges(offset, dset.shape, dset.dtype.itemsize, inds))
+            continue
+        chunk_ranges = _chunked_ranges(dset, inds)
+        if chunk_ranges is not None:
+            ranges.extend(chunk_ranges)
+        elif all(len(ind) == n for ind, n in zip(inds[1:], dset.shape[1:])):
+            # chunk locations are not available, suppose the chunks are
+            # stored in time order and read the proportional part of the
+            # file, only if all of the other axes are selected
+            size = os.path.getsize(fh.filename)
+            ranges.append((int(size * st / float(nt)), int(size * (sp - st) / float(nt)) + 1))
+
+    return ranges
+
+
+class Prefetcher(threading.Thread):
+    """Read byte ranges of files in background and discard the data.
+
+    Parameters
+    ----------
+    file_ranges : list of tuples
+        A list of (file name, byte ranges) as returned by :func:`byte_ranges`.
+
+    """
+
+    block_size = 4 * 2**20 # bytes
+
+    def __init__(self, file_ranges):
+        super(Prefetcher, self).__init__()
+        self.daemon = True
+        self.file_ranges = file_ranges
+        self.cancel = threading.Event()
+
+    def run(self):
+        for filename, ranges in self.file_ranges:
+            try:
+                with open(filename, 'rb') as f:
+                    for offset, size in sorted(ranges):
+                        f.seek(offset)
+                        while size > 0:
+                            if self.cancel.is_set():
+                                return
+                            data = f.read(min(size, self.block_size))
+                            if len(data) == 0: # end of file
+                                break
+                            size -= len(data)
+            except IOError:
+                pass
+
+    def stop(self):
+        """Stop reading and wait for the thread to exit."""
+        self.cancel.set()
+        self.join()
@@ -132,8 +132,27 @@ class PsCal(tod_task.TaskTimestream):
         gain = np.empty((nt, nfeed, 2, len(lfreq)), dtype=np.complex128)
         gain[:] = complex(np.nan, np.nan)
 
-        # construct visibility matrix for a single time, pol, freq
-        Vmat = np.zeros((nfeed, nfeed), dtype=ts.main_data.dtype)
+        # map each feed pair (i, j) to the index of baseline (ai, aj) in bls,
+        # or of baseline (aj, ai) whose data should be conjugated
+        bl_inds = dict((b, (bi, False)) for bi, b in enumerate(bls))
+        bi_mat = np.empty((nfeed, nfeed), dtype=np.int)
+        conj_mat = np.empty((nfeed, nfeed), dtype=bool)
+        for i, ai in enumerate(feedno):
+            for j, aj in enumerate(feedno):
+                try:
+                    bi_mat[i, j], conj_mat[i, j] = bl_inds[(ai, aj)]
+                except KeyError:
+                    try:
+                        bi_mat[i, j] = bl_inds[(aj, ai)][0]
+                        conj_mat[i, j] = True
+                    except KeyError:
+                        raise ValueError('Neither baseline %s nor %s in data' % ((ai, aj), (aj, ai)))
+
+        # baselines (rj - r0) in the zenith topocentric coordinates, so
+        # uij = (bls_z[j] - bls_z[i]) * freq
+        bls_z = np.array([ aa.get_baseline(0, j, src='z') for j in range(nfeed) ]) # (nfeed, 3), in ns
+        afreqs = aa.get_afreqs() # GHz
+
         for ind, ti in enumerate(range(start_ind, end_ind)):
             # when noise on, just pass
             if 'ns_on' in ts.iterkeys() and ts['ns_on'][ti]:
@@ -144,32 +163,29 @@ class PsCal(tod_task.TaskTimestream):
             Sc = s.get_jys()
             # get the topocentric coordinate of the calibrator at the current time
             s_top = s.get_crds('top', ncrd=3)
-            aa.sim_cache(cat.get_crds('eq', ncrd=3)) # for compute bm_response and sim
+            # the fringe exp(2 pi i s_top . uij) for all feed pairs and freqs
+            phs = np.dot(bls_z, s_top)
+            phs = 2.0 * np.pi * afreqs[:, np.newaxis, np.newaxis] * (phs[np.newaxis, np.newaxis, :] - phs[np.newaxis, :, np.newaxis])
+            fringe = np.exp(1.0J * phs)
+            # the beam response of each feed towards the calibrator, whose
+            # equatorial coordinate is the one computed for the current time
+            s_eq = cat.get_crds('eq', ncrd=3)
+            src_top = np.dot(aa.eq2top_m, s_eq)
+            resp = {}
+            for p in 'xy':
+                resp[p] = np.array([ aa[c].bm_response(src_top, pol=p).reshape(-1) for c in range(nfeed) ]).T # (nfreq, nfeed)
             for pi in [pol.index('xx'), pol.index('yy')]: # xx, yy
-                aa.set_active_pol(pol[pi])
-                for fi, freq in enumerate(lfreq): # mpi among freq
-                    for i, ai in enumerate(feedno):
-                        for j, aj in enumerate(feedno):
-                            # uij = aa.gen_uvw(i, j, src='z').squeeze() # (rj - ri)/lambda
-                            uij = aa.gen_uvw(i, j, src='z')[:, 0, :] # (rj - ri)/lambda
-                            # bmij = aa.bm_response(i, j).squeeze() # will get error for only one local freq
-                            # import pdb
-                            # pdb.set_trace()
-                            bmij = aa.bm_response(i, j).reshape(-1)
-                            try:
-                                bi = bls.index((ai, aj))
-                                # Vmat[i, j] = ts.local_vis[ti, fi, pi, bi] / (Sc[fi] * bmij[fi] * np.exp(-2.0J * np.pi * np.dot(s_top, uij[:, fi]))) # xx, yy
-                                Vmat[i, j] = ts.local_vis[ti, fi, pi, bi] / (Sc[fi] * bmij[fi] * np.exp(2.0J * np.pi * np.dot(s_top, uij[:, fi]))) # xx, yy
-                            except ValueError:
-                                bi = bls.index((aj, ai))
-                                # Vmat[i, j] = np.conj(ts.local_vis[ti, fi, pi, bi] / (Sc[fi] * bmij[fi] * np.exp(-2.0J * np.pi * np.dot(s_top, uij[:, fi])))) # xx, yy
-                                Vmat[i, j] = np.conj(ts.local_vis[ti, fi, pi, bi] / (Sc[fi] * bmij[fi] * np.exp(2.0J * np.pi * np.dot(s_top, uij[:, fi])))) # xx, yy
+                p1, p2 = pol[pi][0], pol[pi][-1]
+                # bmij = resp_j * conj(resp_i)
+                bm = resp[p2][:, np.newaxis, :] * resp[p1][:, :, np.newaxis].conj()
+                # construct visibility matrices for all local freqs
+                Vmat = ts.local_vis[ti, :, pi, :][:, bi_mat] / (Sc[:, np.newaxis, np.newaxis] * bm * fringe)
+                Vmat = np.where(conj_mat, Vmat.conj(), Vmat).astype(ts.main_data.dtype)
+                Vmat = np.where(np.isfinite(Vmat), Vmat, 0)
 
+                for fi, freq in enumerate(lfreq): # mpi among freq
                     # Eigen decomposition
-
-                    Vmat = np.where(np.isfinite(Vmat), Vmat, 0)
-
-                    e, U = eigh(Vmat)
+                    e, U = eigh(Vmat[fi])
                     eigval[ind, :, pi, fi] = e[::-1] # descending order
                     # max eigen-val
                     lbd = e[-1] # lambda
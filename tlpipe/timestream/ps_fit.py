@@ -17,6 +17,7 @@ from timestream import Timestream
 from caput import mpiutil
 from tlpipe.utils.path_util import output_path
 from tlpipe.core import constants as const
+from tlpipe.core import ps_sim
 import tlpipe.plot
 import matplotlib.pyplot as plt
 
@@ -226,31 +227,9 @@ class PsFit(tod_task.TaskTimestream):
         Omega_ij = aa[0].beam.Omega
         pre_factor = 1.0e-26 * (const.c**2 / (2 * const.k_B * (1.0e6*freq)**2) / Omega_ij) # NOTE: 1Jy = 1.0e-26 W m^-2 Hz^-1
 
-        for ind, ti in enumerate(xrange(start_ind, end_ind)):
-            aa.set_jultime(ts['jul_date'][ti])
-            s.compute(aa)
-            # get fluxes vs. freq of the calibrator
-            Sc = s.get_jys()
-            # get the topocentric coordinate of the calibrator at the current time
-            s_top = s.get_crds('top', ncrd=3)
-            aa.sim_cache(cat.get_crds('eq', ncrd=3)) # for compute bm_response and sim
-
-            # for pi in range(len(pol)):
-            for pi in xrange(2): # only cal for xx, yy
-                aa.set_active_pol(pol[pi])
-                # assume all have the same beam responce, speed the calculation
-                # resp1 = aa[0].bm_response(s_top, pol=pol[pi][0]).transpose()
-                # resp2 = aa[0].bm_response(s_top, pol=pol[pi][1]).transpose()
-                # bmij = resp1 * np.conjugate(resp2)
-                bmij = aa.bm_response(0, 0).reshape(-1)
-                factor = pre_factor * Sc * bmij
-                for bi, (i, j) in enumerate(bls):
-                    ai = feedno.index(i)
-                    aj = feedno.index(j)
-                    uij = aa.gen_uvw(ai, aj, src='z')[:, 0, :] # (rj - ri)/lambda
-                    # bmij = aa.bm_response(ai, aj).reshape(-1)
-                    vis_sim[ind, :, pi, bi] = factor * np.exp(-2.0J * np.pi * np.dot(s_top, uij)) # Unit: K
-                    # vis_sim[ind, :, pi, bi] = Sc * bmij * np.exp(-2.0J * np.pi * np.dot(s_top, uij))
+        # simulate xx, yy of all time points together
+        sim = ps_sim.PointSourceSim(aa, feedno)
+        sim.simulate(s, ts['jul_date'][start_ind:end_ind], bls, pol[:2], factor=pre_factor, out=vis_sim[:, :, :2]) # Unit: K
 
         mpiutil.barrier()
 
@@ -12,6 +12,7 @@ import numpy as np
 import aipy as a
 import tod_task
 from tlpipe.core import constants as const
+from tlpipe.core import ps_sim
 from caput import mpiutil
 
 
@@ -32,6 +33,8 @@ class PsSub(tod_task.TaskTimestream):
 
     prefix = 'ps_'
 
+    _cacheable = True
+
     def process(self, ts):
 
         ps = self.params['ps']
@@ -64,6 +67,7 @@ class PsSub(tod_task.TaskTimestream):
         # array
         aa = ts.array
         # aa.set_jultime(ts['jul_date'][0]) # the first obs time point
+        sim = ps_sim.PointSourceSim(aa, feedno)
 
         for s in cat.values():
             # reset time of the array here
@@ -79,24 +83,9 @@ class PsSub(tod_task.TaskTimestream):
             inds = range(pre_transit_ind-num_span, pre_transit_ind+num_span) + range(transit_ind-num_span, transit_ind+num_span)
             inds = np.intersect1d(inds, np.arange(nt))
 
-            for ti in inds:
-                aa.set_jultime(ts['jul_date'][ti])
-                s.compute(aa)
-                # get fluxes vs. freq of the point source
-                Sc = s.get_jys()
-                # get the topocentric coordinate of the point source at the current time
-                s_top = s.get_crds('top', ncrd=3)
-                aa.sim_cache(s.get_crds('eq', ncrd=3)[:, np.newaxis]) # for compute bm_response and sim
-                # for pi in range(len(pol)):
-                for pi in xrange(2): # only cal for xx, yy
-                    aa.set_active_pol(pol[pi])
-                    for bi, (i, j) in enumerate(bls):
-                        ai = feedno.index(i)
-                        aj = feedno.index(j)
-                        uij = aa.gen_uvw(ai, aj, src='z')[:, 0, :] # (rj - ri)/lambda
-                        bmij = aa.bm_response(ai, aj).reshape(-1)
-                        vis_sim = Sc * bmij * np.exp(-2.0J * np.pi * np.dot(s_top, uij))
-                        ts.local_vis[ti, :, pi, bi] -= vis_sim # subtract this ps
+            # only subtract for xx, yy
+            for st, et, vis_sim in sim.iter_simulate(s, ts['jul_date'][inds], bls, pol[:2]):
+                ts.local_vis[inds[st:et], :, :2, :] -= vis_sim # subtract this ps
 
 
         return super(PsSub, self).process(ts)
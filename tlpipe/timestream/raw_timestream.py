@@ -11,6 +11,8 @@ Inheritance diagram
 
 import itertools
 import numpy as np
+import container
+import bl_index
 import timestream_common
 import timestream
 from caput import mpiarray
@@ -147,19 +149,26 @@ class RawTimestream(timestream_common.TimestreamCommon):
             raise ValueError('Unknown correlation type %s' % corr)
 
         # get blorder info from the first input file
-        blorder = self.infiles[0]['blorder']
-        blorder = [ set(bl) for bl in blorder ]
+        blorder = bl_index.BaselineIndex(self.infiles[0]['blorder'][:])
 
         # channel pair indices
-        indices = { blorder.index(chp) for chp in channel_pairs }
-        indices = sorted(list(indices))
+        channel_pairs = [ (min(chp), max(chp)) for chp in channel_pairs ]
+        indices, _ = blorder.lookup(channel_pairs)
+        indices = np.unique(indices).tolist()
 
         self.data_select('baseline', indices)
 
         self._feed_select = feeds
+        self._bl_index = None
         self._channel_select = np.array([ channo[feedno.index(fd)] for fd in feeds ])
 
 
+    def _build_bl_index(self):
+        ### build the baseline index from the feed numbered blorder and the
+        ### pol of the baselines, a xy baseline is conjugate to a yx baseline
+        p = self.pol_dict
+        return bl_index.BaselineIndex(self._global_bl_array('true_blorder'), self._global_bl_array('bl_pol'), { p['xy']: p['yx'], p['yx']: p['xy'] })
+
     def _load_a_common_dataset(self, name):
         ### load a common dataset from the first file
         if name == 'channo' and not self._channel_select is None:
@@ -242,39 +251,16 @@ class RawTimestream(timestream_common.TimestreamCommon):
         ts = timestream.Timestream(dist_axis=self.main_data_dist_axis, comm=self.comm)
 
         feedno = sorted(self['feedno'][:].tolist())
-        xchans = [ self['channo'][feedno.index(fd)][0] for fd in feedno ]
-        ychans = [ self['channo'][feedno.index(fd)][1] for fd in feedno ]
-
         nfeed = len(feedno)
-        xx_pairs = [ (xchans[i], xchans[j]) for i in xrange(nfeed) for j in xrange(i, nfeed) ]
-        yy_pairs = [ (ychans[i], ychans[j]) for i in xrange(nfeed) for j in xrange(i, nfeed) ]
-        xy_pairs = [ (xchans[i], ychans[j]) for i in xrange(nfeed) for j in xrange(i, nfeed) ]
-        yx_pairs = [ (ychans[i], xchans[j]) for i in xrange(nfeed) for j in xrange(i, nfeed) ]
-
-        blorder = [ tuple(bl) for bl in self['blorder'] ]
-        conj_blorder = [ tuple(bl[::-1]) for bl in self['blorder'] ]
-
-        def _get_ind(chp):
-            try:
-                return False, blorder.index(chp)
-            except ValueError:
-                return True, conj_blorder.index(chp)
-        # xx
-        xx_list = [ _get_ind(chp) for chp in xx_pairs ]
-        xx_inds = [ ind for (cj, ind) in xx_list ]
-        xx_conj = [ cj for (cj, ind) in xx_list ]
-        # yy
-        yy_list = [ _get_ind(chp) for chp in yy_pairs ]
-        yy_inds = [ ind for (cj, ind) in yy_list ]
-        yy_conj = [ cj for (cj, ind) in yy_list ]
-        # xy
-        xy_list = [ _get_ind(chp) for chp in xy_pairs ]
-        xy_inds = [ ind for (cj, ind) in xy_list ]
-        xy_conj = [ cj for (cj, ind) in xy_list ]
-        # yx
-        yx_list = [ _get_ind(chp) for chp in yx_pairs ]
-        yx_inds = [ ind for (cj, ind) in yx_list ]
-        yx_conj = [ cj for (cj, ind) in yx_list ]
+        # feed pairs of the separated baselines
+        fd_pairs = np.array([ (feedno[i], feedno[j]) for i in xrange(nfeed) for j in xrange(i, nfeed) ])
+
+        p = self.pol_dict
+        bli = self.bl_index
+        xx_inds, xx_conj = bli.lookup(fd_pairs, p['xx']) # xx
+        yy_inds, yy_conj = bli.lookup(fd_pairs, p['yy']) # yy
+        xy_inds, xy_conj = bli.lookup(fd_pairs, p['xy']) # xy
+        yx_inds, yx_conj = bli.lookup(fd_pairs, p['yx']) # yx
 
         # create a MPIArray to hold the pol and bl separated vis
         rvis = self.main_data.local_data
@@ -311,13 +297,11 @@ class RawTimestream(timestream_common.TimestreamCommon):
 
         # create other datasets needed
         # pol ordered dataset
-        p = self.pol_dict
         ts.create_pol_ordered_dataset('pol', data=np.array([p['xx'], p['yy'], p['xy'], p['yx']], dtype='i4'))
         ts['pol'].attrs['pol_type'] = 'linear'
 
         # bl ordered dataset
-        blorder = np.array([ [feedno[i], feedno[j]] for i in xrange(nfeed) for j in xrange(i, nfeed) ])
-        ts.create_bl_ordered_dataset('blorder', data=blorder)
+        ts.create_bl_ordered_dataset('blorder', data=fd_pairs)
         # copy attrs of this dset
         memh5.copyattrs(self['blorder'].attrs, ts['blorder'].attrs)
         # other bl ordered dataset
@@ -329,7 +313,8 @@ class RawTimestream(timestream_common.TimestreamCommon):
             if attrs_name not in self.time_ordered_attrs:
                 ts.attrs[attrs_name] = attrs_value
 
-        # copy other datasets
+        # copy other datasets, which share the data with the datasets of
+        # self until either of them accesses its data
         for dset_name, dset in self.iteritems():
             if dset_name == self.main_data_name or dset_name == 'vis_mask':
                 # already created above
@@ -346,22 +331,23 @@ class RawTimestream(timestream_common.TimestreamCommon):
                             axis = order
                     if axis is None:
                         raise RuntimeError('Invalid axis order %s for dataset %s' % (axis_order, dset_name))
-                    ts.create_main_axis_ordered_dataset(axis, dset_name, dset.data, axis_order)
+                    ts.create_main_axis_ordered_dataset(axis, dset_name, self._shared_array(dset_name, local=False), axis_order)
             elif dset_name in self.time_ordered_datasets.keys():
                 axis_order = self.time_ordered_datasets[dset_name]
-                ts.create_time_ordered_dataset(dset_name, dset.data, axis_order)
+                ts.create_time_ordered_dataset(dset_name, self._shared_array(dset_name, local=False), axis_order)
             elif dset_name in self.feed_ordered_datasets.keys():
                 if dset_name == 'channo': # channo no useful for Timestream
                     continue
                 else:
                     axis_order = self.feed_ordered_datasets[dset_name]
-                    ts.create_feed_ordered_dataset(dset_name, dset.data, axis_order)
+                    ts.create_feed_ordered_dataset(dset_name, self._shared_array(dset_name, local=False), axis_order)
             else:
                 if dset.common:
-                    ts.create_dataset(dset_name, data=dset)
+                    ts.create_dataset(dset_name, data=self._shared_array(dset_name, local=False))
                 elif dset.distributed:
-                    ts.create_dataset(dset_name, data=dset.data, shape=dset.shape, dtype=dset.dtype, distributed=True, distributed_axis=dset.distributed_axis)
+                    ts.create_dataset(dset_name, data=self._shared_array(dset_name, local=False), shape=dset.shape, dtype=dset.dtype, distributed=True, distributed_axis=dset.distributed_axis)
 
+            container.share_dataset(dset, ts[dset_name])
             # copy attrs of this dset
             memh5.copyattrs(dset.attrs, ts[dset_name].attrs)
 
@@ -28,6 +28,8 @@ class ReOrder(tod_task.TaskTimestream):
 
     prefix = 'ro_'
 
+    _cacheable = True
+
     def process(self, ts):
 
         assert isinstance(ts, Timestream), '%s only works for Timestream object' % self.__class__.__name__
@@ -110,6 +112,8 @@ class ReOrder(tod_task.TaskTimestream):
         # re-order all main_time_ordered_datasets
         for name in ts.main_time_ordered_datasets.keys():
             if name in ts.iterkeys():
+                # re-ordered in place, so copy it if it is shared with other containers
+                ts._own_dataset(name)
                 dset = ts[name]
                 time_axis = ts.main_time_ordered_datasets[name].index(0)
                 sel1 = [slice(0, None)] * (time_axis + 1)
@@ -38,6 +38,8 @@ class Flag(tod_task.TaskTimestream):
 
     prefix = 'rf_'
 
+    _cacheable = True
+
     def process(self, ts):
 
         ts.redistribute('baseline')
@@ -30,6 +30,8 @@ class Rt2ts(tod_task.TaskTimestream):
 
     prefix = 'r2t_'
 
+    _cacheable = True
+
     def process(self, rt):
 
         ts = rt.separate_pol_and_bl(self.params['keep_dist_axis'])
@@ -28,6 +28,8 @@ class Sir(tod_task.TaskTimestream):
 
     prefix = 'sir_'
 
+    _cacheable = True
+
     def process(self, ts):
 
         ts.redistribute('baseline')
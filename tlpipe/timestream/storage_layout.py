@@ -0,0 +1,242 @@
+"""Storage layout of the time ordered datasets in output files.
+
+The output files are written along the time axis, but are usually read back
+by the later tasks distributed along another axis, e.g., the baseline axis for
+:meth:`~tlpipe.timestream.timestream_common.TimestreamCommon.bl_data_operate`
+or the frequency axis for
+:meth:`~tlpipe.timestream.timestream_common.TimestreamCommon.freq_data_operate`.
+A contiguous dataset is stored in time order, so such a read gathers many
+small pieces from all over the file. A :class:`StorageLayout` chunks the
+datasets to be thin along the expected access axis, so each process reads
+whole chunks of its own section, and optionally compresses the chunks with
+the lzf or gzip filter (with the shuffle filter).
+
+:func:`benchmark` measures the write and re-read throughput of a list of
+layouts, see also the script `h5layout`.
+
+"""
+
+import os
+import time
+import numpy as np
+import h5py
+
+
+def _even_length(n, max_len):
+    ### the length not larger than max_len that splits n into even pieces
+    num = -(-n // max_len) # number of pieces
+    return -(-n // num)
+
+
+def chunk_shape(shape, itemsize, access_axis=None, chunk_bytes=2**20, time_chunk=None):
+    """Choose the chunk shape of a dataset.
+
+    The chunk is first shrunk along `access_axis`, then along the other axes
+    from the last to the first, until its size is not larger than
+    `chunk_bytes`. The chunk length along an axis is chosen to split the axis
+    evenly, so the last chunk is not mostly empty.
+
+    Parameters
+    ----------
+    shape : tuple of integers
+        Shape of the dataset.
+    itemsize : integer
+        Bytes of a data element.
+    access_axis : None or integer, optional
+        The axis along which the dataset is expected to be accessed (or
+        distributed when read). If None, the chunk is shrunk along the axes
+        from the first (time) axis to the last. Default None.
+    chunk_bytes : integer, optional
+        Maximum bytes of a chunk. Default 1 MB.
+    time_chunk : None or integer, optional
+        Maximum chunk length along the first (time) axis, which should be the
+        length of the time sections the dataset is written in, so a chunk is
+        not written partially many times. Default None.
+
+    Returns
+    -------
+    chunks : tuple of integers
+
+    """
+    ndim = len(shape)
+    chunks = [ max(1, n) for n in shape ]
+    if time_chunk is not None and ndim > 0:
+        chunks[0] = _even_length(chunks[0], max(1, time_chunk))
+    if access_axis is None:
+        order = range(ndim)
+    else:
+        order = [ access_axis ] + [ ax for ax in reversed(range(ndim)) if ax != access_axis ]
+    for ax in order:
+        if itemsize * np.prod(chunks) <= chunk_bytes:
+            break
+        rest = itemsize * int(np.prod(chunks)) / chunks[ax]
+        chunks[ax] = _even_length(chunks[ax], max(1, chunk_bytes / rest))
+
+    return tuple(chunks)
+
+
+class StorageLayout(object):
+    """Storage layout of the time ordered datasets.
+
+    Parameters
+    ----------
+    access_axis : None or string, optional
+        Name of the main data axis along which the output is expected to be
+        read, e.g., 'baseline' or 'frequency'. If None, the chunks are shrunk
+        along the time axis first. Default None.
+    chunk_bytes : integer, optional
+        Maximum bytes of a chunk. Default 1 MB.
+    compression : None, 'lzf' or 'gzip', optional
+        Compression filter of the chunks. Default None.
+    compression_opts : None or integer, optional
+        Compression level (0 - 9) of gzip. Default None.
+    shuffle : bool, optional
+        Whether to apply the shuffle filter before compression, which
+        usually improves the compression ratio. Default False.
+
+    """
+
+    def __init__(self, access_axis=None, chunk_bytes=2**20, compression=None, compression_opts=None, shuffle=False):
+
+        if not compression in (None, 'lzf', 'gzip'):
+            raise ValueError('Unsupported compression %s' % compression)
+
+        self.access_axis = access_axis
+        self.chunk_bytes = chunk_bytes
+        self.compression = compression
+        self.compression_opts = compression_opts
+        self.shuffle = shuffle
+
+    @property
+    def has_filters(self):
+        """Whether any filter is applied."""
+        return self.compression is not None or self.shuffle
+
+    def __repr__(self):
+        return 'StorageLayout(access_axis=%r, chunk_bytes=%r, compression=%r, compression_opts=%r, shuffle=%r)' % (self.access_axis, self.chunk_bytes, self.compression, self.compression_opts, self.shuffle)
+
+    def dataset_kwargs(self, shape, dtype, axes=None, filters=True, time_chunk=None):
+        """Keyword arguments of :meth:`h5py.Group.create_dataset` for a dataset.
+
+        Parameters
+        ----------
+        shape : tuple of integers
+            Shape of the dataset.
+        dtype : np.dtype
+            Data type of the dataset.
+        axes : None or tuple of strings, optional
+            Names of the axes of the dataset, used to find the access axis.
+        filters : bool, optional
+            If False, only the chunk shape is returned. Default True.
+        time_chunk : None or integer, optional
+            Maximum chunk length along the time axis, see :func:`chunk_shape`.
+
+        """
+        if np.prod(shape) == 0:
+            return {}
+
+        if axes is not None and self.access_axis in axes:
+            access_axis = list(axes).index(self.access_axis)
+        else:
+            access_axis = None
+        kwargs = { 'chunks': chunk_shape(shape, np.dtype(dtype).itemsize, access_axis, self.chunk_bytes, time_chunk) }
+        if filters:
+            if self.compression is not None:
+                kwargs['compression'] = self.compression
+                if self.compression_opts is not None:
+                    kwargs['compression_opts'] = self.compression_opts
+            if self.shuffle:
+                kwargs['shuffle'] = True
+
+        return kwargs
+
+
+def benchmark(filename, shape, dtype, axes, layouts, nsection=4, repeat=1):
+    """Measure the write and re-read throughput of storage layouts.
+
+    For each layout, a dataset of random data is written to `filename` in
+    `nsection` sections along the first (time) axis, which is how the output
+    files are written, and then read back in `nsection` sections along the
+    access axis of the layout (the first axis if None), which is how the
+    later tasks read them. The write time includes syncing the file to the
+    disk, but note that the re-read may hit the page cache of the OS if the
+    file is smaller than the free memory.
+
+    Parameters
+    ----------
+    filename : string
+        The temporary file to write, it is removed at the end.
+    shape : tuple of integers
+        Shape of the dataset.
+    dtype : np.dtype
+        Data type of the dataset.
+    axes : tuple of strings
+        Names of the axes of the dataset.
+    layouts : list of None or :class:`StorageLayout`
+        The layouts to measure, None for a contiguous dataset.
+    nsection : integer, optional
+        Number of sections to write and read. Default 4.
+    repeat : integer, optional
+        Number of repeats, the best time is used. Default 1.
+
+    Returns
+    -------
+    results : list of dicts
+        For each layout, a dict with the items 'layout', 'chunks', 'file_size'
+        (bytes), 'write_rate' and 'read_rate' (MB/s of the uncompressed data).
+
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'c':
+        data = (np.random.randn(*shape) + 1.0J * np.random.randn(*shape)).astype(dtype)
+    else:
+        data = np.random.randn(*shape).astype(dtype)
+    nbytes = data.nbytes / 2.0**20 # MB
+
+    def _sections(n):
+        bounds = np.linspace(0, n, nsection+1).astype(int)
+        return [ slice(bounds[i], bounds[i+1]) for i in xrange(nsection) if bounds[i+1] > bounds[i] ]
+
+    results = []
+    sections = _sections(shape[0])
+    time_chunk = min(sec.stop - sec.start for sec in sections)
+    for layout in layouts:
+        kwargs = {} if layout is None else layout.dataset_kwargs(shape, dtype, axes, time_chunk=time_chunk)
+        if layout is None or layout.access_axis not in axes:
+            read_axis = 0
+        else:
+            read_axis = list(axes).index(layout.access_axis)
+
+        write_time = read_time = np.inf
+        for ri in xrange(repeat):
+            # truncating an existing file may be slow, do not count it
+            if os.path.exists(filename):
+                os.remove(filename)
+            t0 = time.time()
+            with h5py.File(filename, 'w') as f:
+                dset = f.create_dataset('data', shape, dtype=dtype, **kwargs)
+                for sec in sections:
+                    dset[sec] = data[sec]
+                chunks = dset.chunks
+            # count the time to write the data to the disk
+            fd = os.open(filename, os.O_RDONLY)
+            os.fsync(fd)
+            os.close(fd)
+            write_time = min(write_time, time.time() - t0)
+            file_size = os.path.getsize(filename)
+
+            t0 = time.time()
+            with h5py.File(filename, 'r') as f:
+                dset = f['data']
+                for sec in _sections(shape[read_axis]):
+                    sel = [ slice(None) ] * len(shape)
+                    sel[read_axis] = sec
+                    dset[tuple(sel)]
+            read_time = min(read_time, time.time() - t0)
+
+        results.append({ 'layout': layout, 'chunks': chunks, 'file_size': file_size, 'write_rate': nbytes / write_time, 'read_rate': nbytes / read_time })
+
+    if os.path.exists(filename):
+        os.remove(filename)
+
+    return results
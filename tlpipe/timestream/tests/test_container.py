@@ -0,0 +1,59 @@
+import numpy as np
+
+from caput import mpiarray
+from tlpipe.timestream.raw_timestream import RawTimestream
+
+
+def _raw_timestream():
+    rt = RawTimestream(dist_axis=0)
+    vis = np.arange(4 * 3 * 2, dtype=np.complex64).reshape(4, 3, 2)
+    rt.create_main_data(mpiarray.MPIArray.wrap(vis, axis=0))
+    vis_mask = np.zeros(vis.shape, dtype=bool)
+    rt.create_main_time_ordered_dataset('vis_mask', mpiarray.MPIArray.wrap(vis_mask, axis=0), (0, 1, 2))
+    ra_dec = np.array([ [6.2, 0.5], [0.1, 0.5], [0.2, 0.5], [0.3, 0.5] ])
+    rt.create_time_ordered_dataset('ra_dec', ra_dec)
+
+    return rt
+
+
+def test_copy_write():
+
+    rt = _raw_timestream()
+    vis = rt.local_vis.copy()
+    ra_dec = rt['ra_dec'].local_data.copy()
+    cp = rt.copy()
+
+    # reads do not change either container
+    assert np.array_equal(cp['vis'].local_data, vis)
+    assert np.array_equal(cp['ra_dec'][:], ra_dec)
+
+    # in-place writes to the copy
+    cp.local_vis[:] += 1
+    cp.local_vis_mask[0] = True
+    cp._local_array('ra_dec')[0, 0] -= 2*np.pi
+    assert np.array_equal(rt.local_vis, vis)
+    assert not rt.local_vis_mask.any()
+    assert np.array_equal(rt['ra_dec'].local_data, ra_dec)
+
+    # in-place writes to the original
+    rt.local_vis[:] *= 2
+    rt.local_vis_mask[1] = True
+    rt._local_array('ra_dec')[1, 0] = 0.0
+    assert np.array_equal(cp.local_vis, vis + 1)
+    assert cp.local_vis_mask[0].all() and not cp.local_vis_mask[1:].any()
+    assert cp['ra_dec'].local_data[0, 0] == ra_dec[0, 0] - 2*np.pi
+    assert cp['ra_dec'].local_data[1, 0] == ra_dec[1, 0]
+    assert np.array_equal(rt.local_vis, 2 * vis)
+
+
+def test_copy_write_after_free():
+
+    rt = _raw_timestream()
+    cp = rt.copy()
+    del rt
+
+    # the data is no longer shared, so it can be written in place
+    cp['ra_dec'].local_data[0, 0] -= 2*np.pi
+    cp['vis'].local_data[:] = 0
+    assert np.allclose(cp['ra_dec'].local_data[0, 0], 6.2 - 2*np.pi)
+    assert not cp['vis'].local_data.any()
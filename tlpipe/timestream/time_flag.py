@@ -32,6 +32,8 @@ class Flag(tod_task.TaskTimestream):
 
     prefix = 'tf_'
 
+    _cacheable = True
+
     def process(self, ts):
 
         time_window = self.params['time_window']
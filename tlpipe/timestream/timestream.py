@@ -12,6 +12,7 @@ Inheritance diagram
 import itertools
 import numpy as np
 import container
+import bl_index
 import timestream_common
 from caput import mpiarray
 from caput import memh5
@@ -108,16 +109,17 @@ class Timestream(timestream_common.TimestreamCommon):
             raise ValueError('Unknown correlation type %s' % corr)
 
         # get blorder info from the first input file
-        blorder = self.infiles[0]['blorder']
-        blorder = [ set(bl) for bl in blorder ]
+        blorder = bl_index.BaselineIndex(self.infiles[0]['blorder'][:])
 
         # baseline indices
-        indices = { blorder.index(bl) for bl in bls }
-        indices = sorted(list(indices))
+        bls = [ (min(bl), max(bl)) for bl in bls ]
+        indices, _ = blorder.lookup(bls)
+        indices = np.unique(indices).tolist()
 
         self.data_select('baseline', indices)
 
         self._feed_select = feeds
+        self._bl_index = None
 
 
     def _load_a_common_dataset(self, name):
@@ -10,16 +10,74 @@ Inheritance diagram
 """
 
 import itertools
+import collections
 import numpy as np
-import ephem
-from datetime import datetime
 import container
+import bl_index
 from caput import mpiutil
 from caput import mpiarray
 from caput import memh5
 from tlpipe.core import tl_array
 from tlpipe.core import constants as const
-from tlpipe.utils import date_util
+from tlpipe.utils import ephem_util
+
+
+# maximum number of antenna arrays kept by antenna_array
+ARRAY_CACHE_SIZE = 4
+
+_array_cache = collections.OrderedDict()
+
+
+def antenna_array(lat, lon, elev, freq, pos, beam):
+    """Return a dish or cylinder antenna array.
+
+    The arrays are cached by all the arguments, so an identical array is
+    built only once and the same instance is returned later. At most
+    :data:`ARRAY_CACHE_SIZE` arrays are kept, the least recently used one is
+    dropped first.
+
+    Parameters
+    ----------
+    lat, lon : float
+        Latitude and longitude of the site in degree.
+    elev : float
+        Elevation of the site in m.
+    freq : np.ndarray
+        Frequencies in MHz.
+    pos : (nfeed, 3) np.ndarray
+        Feed positions in topocentric coordinate in m.
+    beam : tuple
+        ('dish', diameter) for a dish array or ('cylinder', width, length)
+        for a cylinder array, in m.
+
+    """
+    freq = np.asarray(freq)
+    pos = np.asarray(pos)
+    key = (lat, lon, elev, beam, freq.dtype.str, freq.shape, freq.tostring(), pos.dtype.str, pos.shape, pos.tostring())
+    try:
+        aa = _array_cache.pop(key)
+    except KeyError:
+        pos = pos - pos[-1]
+        # convert to equatorial (ns) coordinates
+        m2ns = 1.0 / const.c * 1.0e9
+        pos_ns = np.dot(tl_array.xyz2XYZ_m(np.radians(lat)), m2ns * pos.T).T
+        if beam[0] == 'dish':
+            ants = [ tl_array.DishAntenna(pi, freq, beam[1]) for pi in pos_ns ]
+        elif beam[0] == 'cylinder':
+            ants = [ tl_array.CylinderFeed(pi, freq, beam[1], beam[2]) for pi in pos_ns ]
+        else:
+            raise ValueError('Unknown beam %s' % (beam,))
+        aa = tl_array.AntennaArray((str(lat), str(lon), elev), ants)
+
+    _array_cache[key] = aa
+    while len(_array_cache) > ARRAY_CACHE_SIZE:
+        _array_cache.popitem(last=False)
+
+    return aa
+
+def clear_array_cache():
+    """Drop all antenna arrays cached by :func:`antenna_array`."""
+    _array_cache.clear()
 
 
 class TimestreamCommon(container.BasicTod):
@@ -204,17 +262,33 @@ class TimestreamCommon(container.BasicTod):
             # create attrs of this dset
             self['freq'].attrs["unit"] = 'MHz'
 
-    def load_main_data(self):
-        """Load main data from all files and create its mask array if it does not exist."""
-        super(TimestreamCommon, self).load_main_data()
+    def load_main_data(self, lazy=False):
+        """Load main data from all files and create its mask array if it does not exist.
+
+        If the main data is lazily loaded and there is no mask array in the
+        files, the mask of the non-finite values is set when the corresponding
+        section of the main data is read.
+        """
+        super(TimestreamCommon, self).load_main_data(lazy)
 
+        self._lazy_vis_mask = False
         if 'vis_mask' not in self.iterkeys():
             # create the mask array
-            vis_mask = np.where(np.isfinite(self.main_data.local_data), False, True)
+            if self.lazy:
+                vis_mask = np.zeros(self._local_array(self.main_data_name).shape, dtype=bool)
+                self._lazy_vis_mask = not 'vis_mask' in self.infiles[0]
+            else:
+                vis_mask = np.where(np.isfinite(self.main_data.local_data), False, True)
             vis_mask = mpiarray.MPIArray.wrap(vis_mask, axis=self.main_data_dist_axis)
             axis_order = self.main_axes_ordered_datasets[self.main_data_name]
             vis_mask = self.create_main_axis_ordered_dataset(axis_order, 'vis_mask', vis_mask, axis_order)
 
+    def _lazy_read(self, index):
+        ### mask the non-finite values of the section just read
+        if self._lazy_vis_mask:
+            vis = self._local_array(self.main_data_name)[index]
+            self.local_vis_mask[index] |= np.logical_not(np.isfinite(vis))
+
     def load_tod_excl_main_data(self):
         """Load time ordered attributes and datasets (exclude the main data) from all files."""
 
@@ -253,7 +327,9 @@ class TimestreamCommon(container.BasicTod):
                 self['sec1970'].attrs["continuous"] = True
 
             # generate julian date
-            jul_date = np.array([ date_util.get_juldate(datetime.fromtimestamp(s), tzone=self.infiles[0].attrs['timezone']) for s in sec1970 ], dtype=np.float64) # precision float32 is not enough
+            tzone = self.infiles[0].attrs['timezone']
+            local_sec1970 = self['sec1970'].local_data
+            jul_date = ephem_util.sec1970_to_juldate(local_sec1970) # precision float32 is not enough
             if 'time' == self.main_data_axes[self.main_data_dist_axis]:
                 jul_date = mpiarray.MPIArray.wrap(jul_date, axis=0)
             # if time is just the distributed axis, load jul_date distributed
@@ -262,9 +338,7 @@ class TimestreamCommon(container.BasicTod):
             self['jul_date'].attrs["unit"] = 'day'
 
             # generate local time in hour from 0 to 24.0
-            def _hour(t):
-                return t.hour + t.minute/60.0 + t.second/3600.0 + t.microsecond/3.6e8
-            local_hour = np.array([ _hour(datetime.fromtimestamp(s).time()) for s in sec1970 ], dtype=np.float64)
+            local_hour = ephem_util.sec1970_to_local_hour(local_sec1970, tzone)
             if 'time' == self.main_data_axes[self.main_data_dist_axis]:
                 local_hour = mpiarray.MPIArray.wrap(local_hour, axis=0)
             # if time is just the distributed axis, load local_hour distributed
@@ -286,13 +360,15 @@ class TimestreamCommon(container.BasicTod):
                 raise RuntimeError('Unknown antenna type %s' % self.attrs['telescope'])
 
             # generate ra, dec of the antenna pointing
-            aa = self.array
+            try:
+                lon = np.radians(self.attrs['sitelon']) # degree
+                lat = np.radians(self.attrs['sitelat']) # degree
+            except KeyError:
+                raise KeyError('Attribute sitelon or sitelat does not exist, try to load it first')
             ra_dec = np.zeros_like(az_alt) # radians
-            for ti in xrange(az_alt.shape[0]):
-                az, alt = az_alt[ti]
-                az, alt = ephem.degrees(az), ephem.degrees(alt)
-                aa.set_jultime(self['jul_date'].local_data[ti])
-                ra_dec[ti] = aa.radec_of(az, alt) # in radians, a point in the sky above the observer
+            ra, dec = ephem_util.azalt2radec(az_alt[:, 0], az_alt[:, 1], self['jul_date'].local_data, lat, lon)
+            ra_dec[:, 0] = ra # a point in the sky above the observer
+            ra_dec[:, 1] = dec
 
             if self.main_data_dist_axis == 0:
                 az_alt = mpiarray.MPIArray.wrap(az_alt, axis=0)
@@ -329,7 +405,9 @@ class TimestreamCommon(container.BasicTod):
 
     @property
     def local_vis(self):
-        """A convenience for vis.local_data."""
+        """A convenience for vis.local_data, which can be changed in place."""
+        # copy it if it is shared with other containers
+        self._own_dataset(self.main_data_name)
         return self.main_data.local_data
 
     @property
@@ -342,7 +420,9 @@ class TimestreamCommon(container.BasicTod):
 
     @property
     def local_vis_mask(self):
-        """A convenience for vis_mask.local_data."""
+        """A convenience for vis_mask.local_data, which can be changed in place."""
+        # copy it if it is shared with other containers
+        self._own_dataset('vis_mask')
         return self.vis_mask.local_data
 
     def apply_mask(self, fill_val=complex(np.nan, np.nan)):
@@ -440,6 +520,37 @@ class TimestreamCommon(container.BasicTod):
         """A convenience for bl.local_data."""
         return self.bl.local_data
 
+    _bl_index = None
+
+    def _global_bl_array(self, name):
+        ### the global data of the baseline ordered dataset `name`, gathered
+        ### from all procs if it is distributed
+        if self[name].distributed:
+            return mpiutil.gather_array(self[name].local_data, axis=self[name].distributed_axis, root=None, comm=self.comm)
+        return self._shared_array(name, local=False)
+
+    def _build_bl_index(self):
+        ### build the baseline index from blorder
+        return bl_index.BaselineIndex(self._global_bl_array('blorder'))
+
+    @property
+    def bl_index(self):
+        """The index of the baselines in the baseline axis.
+
+        A :class:`~tlpipe.timestream.bl_index.BaselineIndex` to find the
+        column of a feed pair and the feed pair of a column. It is built once
+        and rebuilt if the blorder dataset is re-created or a new
+        :meth:`feed_select` is made.
+        """
+        try:
+            dset = self['blorder']
+        except KeyError:
+            raise KeyError('blorder does not exist, try to load it first')
+        if self._bl_index is None or self._bl_index[0] is not dset:
+            self._bl_index = (dset, self._build_bl_index())
+
+        return self._bl_index[1]
+
     @property
     def is_dish(self):
         """True if data is get from dish array."""
@@ -458,7 +569,13 @@ class TimestreamCommon(container.BasicTod):
 
     @property
     def array(self):
-        """Return either a dish array or a cylinder array instance."""
+        """Return either a dish array or a cylinder array instance.
+
+        The array is built by :func:`antenna_array`, so the same instance is
+        returned as long as the site, the feed positions, the frequencies and
+        the beam are unchanged. Its time (and active pol, etc.) may have been
+        set by other tasks, so set it before use.
+        """
         try:
             lon = self.attrs['sitelon'] # degree
             lat = self.attrs['sitelat'] # degree
@@ -468,18 +585,12 @@ class TimestreamCommon(container.BasicTod):
 
         freq = self.freq.local_data[:]
         pos = self['feedpos'].local_data[:] # in topocentric coordinate
-        nfeed = pos.shape[0]
-        pos -= pos[-1]
-        # convert to equatorial (ns) coordinates
-        m2ns = 1.0 / const.c * 1.0e9
-        pos_ns = np.dot(tl_array.xyz2XYZ_m(np.radians(lat)), m2ns * pos.T).T
         if self.is_dish:
             try:
                 diameter = self.attrs['dishdiam']
             except KeyError:
                 raise KeyError('Attribute dishdiam does not exist, try to load it first')
-            # beam = tl_array.DishBeam(freq, diameter)
-            ants = [ tl_array.DishAntenna(pi, freq, diameter) for pi in pos_ns ]
+            beam = ('dish', diameter)
         elif self.is_cylinder:
             try:
                 factor = 1.2 # suppose an illumination efficiency
@@ -487,12 +598,11 @@ class TimestreamCommon(container.BasicTod):
                 length = self.attrs['cylen']
             except KeyError:
                 raise KeyError('Attribute dishdiam does not exist, try to load it first')
-            # beam = tl_array.CylinderBeam(freq, width, length)
-            ants = [ tl_array.CylinderFeed(pi, freq, width, length) for pi in pos_ns ]
-
-        aa = tl_array.AntennaArray((str(lat), str(lon), elev), ants)
+            beam = ('cylinder', width, length)
+        else:
+            raise RuntimeError('Unknown array type %s' % self.attrs['telescope'])
 
-        return aa
+        return antenna_array(lat, lon, elev, freq, pos, beam)
 
     @property
     def is_continuous(self):
@@ -721,7 +831,7 @@ class TimestreamCommon(container.BasicTod):
             raise RuntimeError('Not all feed_ordered_datasets have an aligned feed axis')
 
 
-    def data_operate(self, func, op_axis=None, axis_vals=0, full_data=False, copy_data=False, keep_dist_axis=False, **kwargs):
+    def data_operate(self, func, op_axis=None, axis_vals=0, full_data=False, copy_data=False, keep_dist_axis=False, batch=False, block_bytes=None, **kwargs):
         """An overload data operation interface.
 
         This overloads the method in its super class :class:`container.BasicTod`
@@ -761,14 +871,26 @@ class TimestreamCommon(container.BasicTod):
         keep_dist_axis : bool, optional
             Whether to redistribute main data to the original dist axis if the
             dist axis has changed during the operation. Default False.
+        batch : bool, optional
+            If True, `func` is called on blocks of consecutive sections along
+            `op_axis` instead of on each section, see
+            :meth:`container.BasicTod.data_operate`. Default False.
+        block_bytes : None or integer, optional
+            Approximate bytes of a block of `vis` if `batch` is True. Default
+            None to use :data:`container.BLOCK_BYTES`.
         \*\*kwargs : any other arguments
             Any other arguments that will passed to `func`.
 
         """
 
+        if not copy_data:
+            # func changes the vis and the mask in place
+            self._own_dataset(self.main_data_name)
+            self._own_dataset('vis_mask')
+
         if op_axis is None:
             if copy_data:
-                func(self.local_vis.copy(), self.local_vis_mask.copy(), self, **kwargs)
+                func(self.main_data.local_data.copy(), self.vis_mask.local_data.copy(), self, **kwargs)
             else:
                 func(self.local_vis, self.local_vis_mask, self, **kwargs)
         elif isinstance(op_axis, int) or isinstance(op_axis, basestring):
@@ -777,19 +899,19 @@ class TimestreamCommon(container.BasicTod):
             if full_data:
                 original_dist_axis = self.main_data_dist_axis
                 self.redistribute(axis)
-            for lind, gind in self.main_data.data.enumerate(axis):
-                data_sel[axis] = lind
-                if isinstance(axis_vals, memh5.MemDataset):
-                    # use the new dataset which may be different from axis_vals if it is redistributed
-                    axis_val = self[axis_vals.name].local_data[lind]
-                elif hasattr(axis_vals, '__iter__'):
-                    axis_val = axis_vals[lind]
-                else:
-                    axis_val = axis_vals
+            if batch:
+                blocks = self._blocks(axis, block_bytes)
+            else:
+                blocks = [ (lind, lind, gind) for (lind, gind) in self._global_array(self.main_data_name).enumerate(axis) ]
+            for sel, lind, gind in blocks:
+                data_sel[axis] = sel
+                axis_val = self._block_axis_vals(axis_vals, sel)
+                # read only this section if the main data is lazily loaded
+                self._load_lazy_sections(axis, np.atleast_1d(lind).tolist())
                 if copy_data:
-                    func(self.local_vis[data_sel].copy(), self.local_vis_mask[data_sel].copy(), lind, gind, axis_val, self, **kwargs)
+                    func(self._shared_array(self.main_data_name)[tuple(data_sel)].copy(), self._shared_array('vis_mask')[tuple(data_sel)].copy(), lind, gind, axis_val, self, **kwargs)
                 else:
-                    func(self.local_vis[data_sel], self.local_vis_mask[data_sel], lind, gind, axis_val, self, **kwargs)
+                    func(self._local_array(self.main_data_name)[tuple(data_sel)], self._local_array('vis_mask')[tuple(data_sel)], lind, gind, axis_val, self, **kwargs)
             if full_data and keep_dist_axis:
                 self.redistribute(original_dist_axis)
         elif isinstance(op_axis, tuple):
@@ -803,24 +925,28 @@ class TimestreamCommon(container.BasicTod):
                     # choose the longest axis in axes as the new dist axis
                     new_dist_axis = axes[np.argmax(axes_len)]
                     self.redistribute(new_dist_axis)
-            linds = [ [ li for (li, gi) in self.main_data.data.enumerate(axis) ] for axis in axes ]
-            ginds = [ [ gi for (li, gi) in self.main_data.data.enumerate(axis) ] for axis in axes ]
-            n_axes = len(axes)
-            for lind, gind in zip(itertools.product(*linds), itertools.product(*ginds)):
+            main_array = self._global_array(self.main_data_name)
+            if batch:
+                # blocks along the first axis with all sections of the other axes
+                rest = [ np.array([ (li, gi) for (li, gi) in main_array.enumerate(axis) ], dtype=int).reshape(-1, 2) for axis in axes[1:] ]
+                blocks = []
+                for sel, linds, ginds in self._blocks(axes[0], block_bytes):
+                    blocks.append(((sel,) + (slice(None),) * len(rest), (linds,) + tuple(r[:, 0] for r in rest), (ginds,) + tuple(r[:, 1] for r in rest)))
+            else:
+                linds = [ [ li for (li, gi) in main_array.enumerate(axis) ] for axis in axes ]
+                ginds = [ [ gi for (li, gi) in main_array.enumerate(axis) ] for axis in axes ]
+                blocks = [ (lind, lind, gind) for lind, gind in zip(itertools.product(*linds), itertools.product(*ginds)) ]
+            for sel, lind, gind in blocks:
                 axis_val = ()
                 for ai, axis in enumerate(axes):
-                    data_sel[axis] = lind[ai]
-                    if isinstance(axis_vals[ai], memh5.MemDataset):
-                        # use the new dataset which may be different from axis_vals if it is redistributed
-                        axis_val += (self[axis_vals[ai].name].local_data[lind[ai]],)
-                    elif hasattr(axis_vals[ai], '__iter__'):
-                        axis_val += (axis_vals[ai][lind[ai]],)
-                    else:
-                        axis_val += (axis_vals[ai],)
+                    data_sel[axis] = sel[ai]
+                    axis_val += (self._block_axis_vals(axis_vals[ai], sel[ai]),)
+                # read only the sections along the first axis if the main data is lazily loaded
+                self._load_lazy_sections(axes[0], np.atleast_1d(lind[0]).tolist())
                 if copy_data:
-                    func(self.local_vis[data_sel].copy(), self.local_vis_mask[data_sel].copy(), lind, gind, axis_val, self, **kwargs)
+                    func(self._shared_array(self.main_data_name)[tuple(data_sel)].copy(), self._shared_array('vis_mask')[tuple(data_sel)].copy(), lind, gind, axis_val, self, **kwargs)
                 else:
-                    func(self.local_vis[data_sel], self.local_vis_mask[data_sel], lind, gind, axis_val, self, **kwargs)
+                    func(self._local_array(self.main_data_name)[tuple(data_sel)], self._local_array('vis_mask')[tuple(data_sel)], lind, gind, axis_val, self, **kwargs)
             if full_data and keep_dist_axis:
                 self.redistribute(original_dist_axis)
         else:
@@ -12,6 +12,7 @@ import h5py
 from timestream_common import TimestreamCommon
 from raw_timestream import RawTimestream
 from timestream import Timestream
+from storage_layout import StorageLayout
 from tlpipe.utils.path_util import input_path, output_path
 from tlpipe.pipeline.pipeline import OneAndOne
 
@@ -38,9 +39,19 @@ class TaskTimestream(OneAndOne):
                     'start': 0,
                     'stop': None,
                     'dist_axis': 0,
+                    'lazy': False, # read the main data on demand, so only the sections used are read
+                    'read_ahead': False, # read the selection of the next input file in background while loading the main data
+                    'use_index': False, # get the lengths of the input files from an index, so only the selected files are opened
+                    'index_dir': None, # save the index of the input files in this directory (relative to the output dir) for later runs, None to keep it in memory only
                     'exclude': [],
                     'check_status': True,
                     'libver': 'latest',
+                    'write_method': 'auto', # 'auto' (mpio if available, else serial), 'mpio', 'serial', or 'vds' (data in per-proc shard files next to the outputs)
+                    'chunk_axis': None, # chunk output along this expected access axis, e.g., 'baseline', or 'time', None for contiguous output if no compression
+                    'chunk_bytes': 2**20, # maximum bytes of an output chunk
+                    'compression': None, # None, 'lzf' or 'gzip'
+                    'compression_opts': None, # gzip compression level 0 - 9
+                    'shuffle': False, # apply the shuffle filter before compression
                     'time_select': (0, None),
                     'freq_select': (0, None),
                     'pol_select': (0, None), # only useful for ts
@@ -49,6 +60,7 @@ class TaskTimestream(OneAndOne):
                     'show_info': False,
                     'tag_input_iter': True, # tag current iteration to input file path
                     'tag_output_iter': True, # tag current iteration to output file path
+                    'fork': False, # run in a worker process if the pipeline manager uses them
                   }
 
     prefix = 'tt_'
@@ -95,6 +107,51 @@ class TaskTimestream(OneAndOne):
 
         return super(TaskTimestream, self).read_process_write(tod)
 
+    # set True in the tasks whose only output is the returned data (no other
+    # files, figures or state), whose results can be reused from the cache
+    _cacheable = False
+
+    @property
+    def cacheable(self):
+        """Whether the output can be reused from the result cache.
+
+        Only the tasks that set `_cacheable` are cacheable, as the other
+        outputs (e.g., saved gains or figures) of a task are not produced if
+        its processing is skipped. The output can not be fully restored from
+        the output files if some datasets are excluded from writing.
+
+        """
+        return self._cacheable and len(self.params['exclude']) == 0
+
+    @property
+    def forkable(self):
+        """The `next()` can be run in a worker process if `fork` is set.
+
+        Only set `fork` for a task that works on in-memory products and whose
+        outputs are not used by the other tasks while it runs.
+
+        """
+        return self.params['fork']
+
+    def _cache_input_files(self):
+        if self.iterable and self.params['tag_input_iter']:
+            return input_path(self.input_files, iteration=self.iteration)
+        else:
+            return self.input_files
+
+    def _cache_output_files(self):
+        if self.iterable and self.params['tag_output_iter']:
+            return output_path(self.output_files, relative=False, iteration=self.iteration)
+        else:
+            return self.output_files
+
+    @property
+    def index_dir(self):
+        """The directory to save the index of the input files in, None if not given."""
+        if self.params['index_dir'] is None:
+            return None
+        return output_path(self.params['index_dir'], mkdir=False)
+
     def read_input(self):
         """Method for reading time ordered data input."""
 
@@ -108,10 +165,28 @@ class TaskTimestream(OneAndOne):
             input_files = input_path(self.input_files, iteration=self.iteration)
         else:
             input_files = self.input_files
-        tod = self._Tod_class(input_files, mode, start, stop, dist_axis)
+        tod = self._Tod_class(input_files, mode, start, stop, dist_axis, use_index=self.params['use_index'], index_dir=self.index_dir, prefetch=self.params['read_ahead'])
 
         tod = self.data_select(tod)
 
+        tod.load_all(self.params['lazy'])
+
+        return tod
+
+    def read_output(self, filenames):
+        """Method for reading time ordered data output written by :meth:`write_output`."""
+
+        # see 'vis' dataset from the first output file
+        with h5py.File(filenames[0], 'r') as f:
+            vis_shp = f['vis'].shape
+        if len(vis_shp) == 3:
+            self._Tod_class = RawTimestream
+        elif len(vis_shp) == 4:
+            self._Tod_class = Timestream
+        else:
+            raise RuntimeError('Something wrong happened, dimension of vis data != 3 or 4')
+
+        tod = self._Tod_class(filenames, 'r', 0, None, self.params['dist_axis'])
         tod.load_all()
 
         return tod
@@ -145,10 +220,19 @@ class TaskTimestream(OneAndOne):
         exclude = self.params['exclude']
         check_status = self.params['check_status']
         libver = self.params['libver']
+        write_method = self.params['write_method']
         tag_output_iter = self.params['tag_output_iter']
+        chunk_axis = self.params['chunk_axis']
+        compression = self.params['compression']
+
+        if chunk_axis is None and compression is None and not self.params['shuffle']:
+            layout = None
+        else:
+            access_axis = None if chunk_axis == 'time' else chunk_axis
+            layout = StorageLayout(access_axis, self.params['chunk_bytes'], compression, self.params['compression_opts'], self.params['shuffle'])
 
         if self.iterable and tag_output_iter:
             output_files = output_path(self.output_files, relative=False, iteration=self.iteration)
         else:
             output_files = self.output_files
-        output.to_files(output_files, exclude, check_status, libver)
+        output.to_files(output_files, exclude=exclude, check_status=check_status, libver=libver, write_method=write_method, layout=layout)
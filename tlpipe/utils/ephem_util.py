@@ -0,0 +1,178 @@
+"""Vectorized ephemeris utils.
+
+Compute Julian dates, local time, sidereal time and the equatorial coordinates
+of a fixed horizontal pointing for a whole time axis at once by array
+arithmetic, instead of setting the time of an :class:`ephem.Observer` sample
+by sample.
+
+The sidereal time is the apparent sidereal time (the IAU 1982 mean sidereal
+time plus the equation of the equinoxes), and :func:`azalt2radec` returns the
+astrometric position in the equinox of date as :meth:`ephem.Observer.radec_of`
+does with the observer epoch set to its date (which is what
+:meth:`aipy.phs.ArrayLocation.set_jultime` does), i.e., nutation and annual
+aberration removed. Compared with pyephem, the sidereal time agrees to better
+than 1 arcsecond and the position agrees to better than 2 arcseconds in both
+right ascension (as an angular distance on the sky) and declination for the
+dates of the Tianlai observations. Atmospheric refraction
+is not considered, the same as an observer with zero pressure.
+
+"""
+
+import re
+import numpy as np
+
+
+# Julian date of the Unix epoch 1970-01-01 00:00:00 UTC
+JD_1970 = 2440587.5
+# Julian date of the J2000 epoch
+JD_2000 = 2451545.0
+# arcsecond in radians
+_arcsec = np.pi / (180.0 * 3600.0)
+
+
+def get_tzone_hours(tzone='UTC+08h'):
+    """Return the offset in hours of time zone `tzone` of format 'UTC[+/-]xxh'."""
+    pattern = '[-+]?\d+'
+    return int(re.search(pattern, tzone).group())
+
+
+def sec1970_to_juldate(sec1970):
+    """Convert seconds since the Unix epoch to Julian dates.
+
+    Parameters
+    ----------
+    sec1970 : float or array like
+        Seconds since 1970-01-01 00:00:00 UTC.
+
+    Returns
+    -------
+    julian_date : float or np.ndarray
+        Julian dates of `sec1970`.
+
+    """
+    return np.asarray(sec1970, dtype=np.float64) / 86400.0 + JD_1970
+
+
+def sec1970_to_local_hour(sec1970, tzone='UTC+08h'):
+    """Convert seconds since the Unix epoch to local time in hour.
+
+    Parameters
+    ----------
+    sec1970 : float or array like
+        Seconds since 1970-01-01 00:00:00 UTC.
+    tzone : string, optional
+        Time zone in format 'UTC[+/-]xxh'. Defaut: UTC+08h.
+
+    Returns
+    -------
+    local_hour : float or np.ndarray
+        Local time in hour from 0 to 24.0.
+
+    """
+    local_sec = np.asarray(sec1970, dtype=np.float64) + 3600.0 * get_tzone_hours(tzone)
+    return np.mod(local_sec, 86400.0) / 3600.0
+
+
+def _nutation(jul_date):
+    ### nutation in longitude, nutation in obliquity and the mean obliquity
+    ### of the ecliptic, all in radians, the 4 main terms of the IAU 1980 theory
+    T = (np.asarray(jul_date, dtype=np.float64) - JD_2000) / 36525.0
+    omega = np.radians(125.04452 - 1934.136261 * T) # longitude of the ascending node of the Moon
+    L = np.radians(280.4665 + 36000.7698 * T) # mean longitude of the Sun
+    Lp = np.radians(218.3165 + 481267.8813 * T) # mean longitude of the Moon
+    dpsi = (-17.20 * np.sin(omega) - 1.32 * np.sin(2*L) - 0.23 * np.sin(2*Lp) + 0.21 * np.sin(2*omega)) * _arcsec
+    deps = (9.20 * np.cos(omega) + 0.57 * np.cos(2*L) + 0.10 * np.cos(2*Lp) - 0.09 * np.cos(2*omega)) * _arcsec
+    eps = np.radians(23.439291 - 0.0130042 * T)
+
+    return dpsi, deps, eps
+
+
+def _sun_longitude(jul_date):
+    ### true geometric longitude of the Sun in radians
+    T = (np.asarray(jul_date, dtype=np.float64) - JD_2000) / 36525.0
+    M = np.radians(357.52911 + 35999.05029 * T) # mean anomaly of the Sun
+    C = (1.914602 - 0.004817 * T) * np.sin(M) + 0.019993 * np.sin(2*M) + 0.000289 * np.sin(3*M)
+
+    return np.radians(280.46646 + 36000.76983 * T + C)
+
+
+def gmst(jul_date):
+    """Greenwich mean sidereal time in radians of the Julian dates `jul_date`."""
+    d = np.asarray(jul_date, dtype=np.float64) - JD_2000
+    T = d / 36525.0
+    gmst = 280.46061837 + 360.98564736629 * d + 0.000387933 * T**2 - T**3 / 38710000.0 # degree
+
+    return np.radians(np.mod(gmst, 360.0))
+
+
+def lst(jul_date, lon, apparent=True):
+    r"""Local sidereal time in radians.
+
+    Parameters
+    ----------
+    jul_date : float or array like
+        Julian dates.
+    lon : float
+        Longitude of the observing position in radians, East positive.
+    apparent : bool, optional
+        If True, return the apparent sidereal time, which is what
+        :meth:`ephem.Observer.sidereal_time` returns, else the mean sidereal
+        time. Default True.
+
+    Returns
+    -------
+    lst : float or np.ndarray
+        Local sidereal time in radians from 0 to :math:`2\pi`.
+
+    """
+    st = gmst(jul_date) + lon
+    if apparent:
+        # add the equation of the equinoxes
+        dpsi, deps, eps = _nutation(jul_date)
+        st = st + dpsi * np.cos(eps + deps)
+
+    return np.mod(st, 2*np.pi)
+
+
+def azalt2radec(az, alt, jul_date, lat, lon):
+    """Convert horizontal coordinates to astrometric equatorial coordinates.
+
+    Parameters
+    ----------
+    az, alt : float or array like
+        Azimuth (from North through East) and altitude in radians, they must
+        be broadcastable with `jul_date`.
+    jul_date : float or array like
+        Julian dates.
+    lat, lon : float
+        Latitude, longitude of the observing position in radians.
+
+    Returns
+    -------
+    ra, dec : np.ndarray
+        Right ascension and declination in radians, in the equinox of date.
+
+    """
+    az = np.asarray(az, dtype=np.float64)
+    alt = np.asarray(alt, dtype=np.float64)
+    jul_date = np.asarray(jul_date, dtype=np.float64)
+    slat, clat = np.sin(lat), np.cos(lat)
+
+    # apparent hour angle and declination
+    dec = np.arcsin(slat * np.sin(alt) + clat * np.cos(alt) * np.cos(az))
+    ha = np.arctan2(-np.sin(az) * np.cos(alt), clat * np.sin(alt) - slat * np.cos(alt) * np.cos(az))
+    ra = lst(jul_date, lon) - ha
+
+    # remove the nutation and the annual aberration
+    dpsi, deps, eps = _nutation(jul_date)
+    lsun = _sun_longitude(jul_date)
+    kappa = 20.49552 * _arcsec # constant of aberration
+    sra, cra = np.sin(ra), np.cos(ra)
+    sdec, cdec, tdec = np.sin(dec), np.cos(dec), np.tan(dec)
+    seps, ceps = np.sin(eps), np.cos(eps)
+    dra = (ceps + seps * sra * tdec) * dpsi - cra * tdec * deps
+    ddec = seps * cra * dpsi + sra * deps
+    dra += -kappa * (cra * np.cos(lsun) * ceps + sra * np.sin(lsun)) / cdec
+    ddec += -kappa * (np.cos(lsun) * ceps * (np.tan(eps) * cdec - sra * sdec) + cra * sdec * np.sin(lsun))
+
+    return np.mod(ra - dra, 2*np.pi), dec - ddec
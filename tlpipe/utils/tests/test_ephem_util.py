@@ -0,0 +1,68 @@
+from datetime import datetime
+
+import numpy as np
+import ephem
+
+from tlpipe.utils import ephem_util
+
+
+lat = np.radians(44.15268333)
+lon = np.radians(91.80686667)
+# one day of 1 minute integrations
+sec1970 = 1474992000.0 + 60.0 * np.arange(1440)
+
+# tolerance in radians
+arcsec = np.pi / (180.0 * 3600.0)
+lst_tol = 1.0 * arcsec
+radec_tol = 2.0 * arcsec
+
+
+def _ang_diff(a, b):
+    return np.abs(np.angle(np.exp(1.0J * (a - b))))
+
+def _observer(jd):
+    # the same as aipy.phs.ArrayLocation.set_jultime
+    obs = ephem.Observer()
+    obs.pressure = 0
+    obs.lat, obs.long = lat, lon
+    obs.date = obs.epoch = jd - 2415020.0
+    return obs
+
+
+def test_juldate():
+
+    jd = ephem_util.sec1970_to_juldate(sec1970)
+    jd_e = np.array([ ephem.julian_date(datetime.utcfromtimestamp(s)) for s in sec1970 ])
+
+    # 1 millisecond
+    assert np.allclose(jd, jd_e, rtol=0, atol=1.0e-3/86400)
+
+
+def test_local_hour():
+
+    hour = ephem_util.sec1970_to_local_hour(sec1970, 'UTC+08h')
+    dt = [ datetime.utcfromtimestamp(s + 8*3600) for s in sec1970 ]
+    hour_e = np.array([ t.hour + t.minute/60.0 + t.second/3600.0 for t in dt ])
+
+    assert np.allclose(hour, hour_e)
+
+
+def test_lst():
+
+    jd = ephem_util.sec1970_to_juldate(sec1970)
+    lst = ephem_util.lst(jd, lon)
+    lst_e = np.array([ _observer(t).sidereal_time() for t in jd ])
+
+    assert _ang_diff(lst, lst_e).max() < lst_tol
+
+
+def test_azalt2radec():
+
+    jd = ephem_util.sec1970_to_juldate(sec1970)
+    for az, alt in [ (0.0, 0.5*np.pi), (0.5*np.pi, 0.5*np.pi), (0.3, 1.0), (4.0, 0.6) ]:
+        ra, dec = ephem_util.azalt2radec(az, alt, jd, lat, lon)
+        radec_e = np.array([ _observer(t).radec_of(az, alt) for t in jd ])
+
+        # angular distance along the right ascension
+        assert (_ang_diff(ra, radec_e[:, 0]) * np.cos(dec)).max() < radec_tol
+        assert np.abs(dec - radec_e[:, 1]).max() < radec_tol